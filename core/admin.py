@@ -1,7 +1,12 @@
 from django.contrib import admin
 
-from core.models import Transaction
+from core.models import (CreditCardInvoice, MonthVersion, SheetMonthState, SheetsOutbox,
+                         Transaction)
 
 admin.site.register(Transaction)
+admin.site.register(SheetsOutbox)
+admin.site.register(CreditCardInvoice)
+admin.site.register(SheetMonthState)
+admin.site.register(MonthVersion)
 # admin.site.register(TransactionType)
 # admin.site.register(Category)
@@ -0,0 +1,175 @@
+from datetime import date
+
+from django.conf import settings
+from django.utils.http import parse_etags
+from rest_framework import status, viewsets
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from core.models import CreditCard, Transaction
+from core.serializers import CreditCardSerializer, TransactionSerializer
+from core.services import billing_service, invoice_service, transaction_service, version_service
+from core.views import outbox_worker
+
+
+def requested_months(params):
+    """
+    Meses pedidos com os parâmetros do histórico (ano/mes com periodo, ou
+    periodo=intervalo com mes_de/mes_ate). None sem período: todo o histórico.
+    """
+    periodo = params.get('periodo', '')
+    if periodo == 'intervalo' and params.get('mes_de') and params.get('mes_ate'):
+        today = date.today()
+        return transaction_service.selected_months(today.year, today.month, periodo,
+                                                   params['mes_de'], params['mes_ate'])
+    if 'ano' not in params and 'mes' not in params:
+        return None
+    try:
+        ano, mes = int(params.get('ano')), int(params.get('mes'))
+    except (TypeError, ValueError):
+        raise ValidationError({'ano': 'Informe ano e mes numéricos.'})
+    if not 1 <= mes <= 12:
+        raise ValidationError({'mes': 'Mês deve estar entre 1 e 12.'})
+    return transaction_service.selected_months(ano, mes, periodo)
+
+
+def requested_ordering(params):
+    """(order_by, direction) como no histórico, caindo para data decrescente"""
+    order_by = params.get('order_by', 'data')
+    direction = params.get('direction', 'desc')
+    return (order_by if order_by in transaction_service.ORDER_FIELDS else 'data',
+            direction if direction in ('asc', 'desc') else 'desc')
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginação por cursor do histórico (?depois= / ?antes=, os mesmos cursores da
+    tela): cada página filtra a partir da linha de referência, sem OFFSET. Só conta
+    e lê a página, com qualquer tamanho de página.
+    """
+    page_size_query_param = 'page_size'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        params = request.query_params
+        self.order_by, self.direction = requested_ordering(params)
+        self.per_page = self.get_page_size(request)
+        after = transaction_service.decode_cursor(params.get('depois'), self.order_by,
+                                                  self.direction)
+        before = transaction_service.decode_cursor(params.get('antes'), self.order_by,
+                                                   self.direction)
+        (self.transactions, self.number, self.count, self.has_previous,
+         self.has_next) = transaction_service.keyset_window(
+            queryset, self.order_by, self.direction, after, before, params.get('page'),
+            self.per_page)
+        return self.transactions
+
+    def get_page_size(self, request):
+        default = getattr(settings, "API_PAGE_SIZE", 50)
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, default))
+        except ValueError:
+            size = default
+        return min(max(size, 1), getattr(settings, "API_MAX_PAGE_SIZE", 200))
+
+    def link(self, name, transaction, number):
+        """URL desta listagem com o cursor `name` apontando para a transação"""
+        url = self.request.build_absolute_uri()
+        for key in ('page', 'antes', 'depois'):
+            url = remove_query_param(url, key)
+        row = transaction_service.to_historical_row(transaction)
+        return replace_query_param(url, name, transaction_service.encode_cursor(
+            self.order_by, self.direction, row, number))
+
+    def get_paginated_response(self, data):
+        has_rows = bool(self.transactions)
+        return Response({
+            'count': self.count,
+            'next': (self.link('depois', self.transactions[-1], self.number + 1)
+                     if self.has_next and has_rows else None),
+            'previous': (self.link('antes', self.transactions[0], max(self.number - 1, 1))
+                         if self.has_previous and has_rows else None),
+            'results': data,
+        })
+
+
+class TransactionViewSet(viewsets.ModelViewSet):
+    """
+    Transações: a listagem aceita os filtros do histórico (busca, tipo, categoria,
+    pagamento, ano/mes/periodo, order_by/direction) e ?fields=. Escritas passam
+    pela fila do Google Sheets, como nas telas.
+    """
+    serializer_class = TransactionSerializer
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        # Cartão junto: o serializer mostra o nome sem uma consulta por linha
+        queryset = Transaction.objects.select_related('credit_card')
+        if self.action != 'list':
+            return queryset
+
+        params = self.request.query_params
+        months = requested_months(params)
+        if months is not None:
+            if len(months) == 1:
+                queryset = queryset.in_sheet_period(*months[0])
+            else:
+                queryset = queryset.in_sheet_range(months[0], months[-1])
+        queryset = transaction_service.filter_transactions(
+            queryset, params.get('busca'), params.get('tipo'), params.get('categoria'),
+            params.get('pagamento'))
+        return transaction_service.order_transactions(queryset, *requested_ordering(params))
+
+    def list(self, request, *args, **kwargs):
+        # ETag pelas versões dos meses pedidos: página sem mudança responde 304 sem
+        # ler as transações
+        params = dict(request.query_params.items(), formato=request.accepted_renderer.format)
+        etag = version_service.collection_etag(requested_months(request.query_params), params)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        return response
+
+    def perform_create(self, serializer):
+        transaction = Transaction(**serializer.validated_data)
+        transaction_service.assign_billing(transaction)
+        transaction_service.save_and_enqueue(transaction, 'save', on_commit=outbox_worker.wake)
+        serializer.instance = transaction
+
+    def perform_update(self, serializer):
+        transaction = serializer.instance
+        # Aba onde a transação está hoje, caso ela mude de mês
+        old_period = transaction.get_sheet_period()
+        for field, value in serializer.validated_data.items():
+            setattr(transaction, field, value)
+        transaction_service.assign_billing(transaction)
+        transaction_service.save_and_enqueue(transaction, 'update', old_period=old_period,
+                                             on_commit=outbox_worker.wake)
+
+    def perform_destroy(self, instance):
+        transaction_service.delete_and_enqueue(instance, on_commit=outbox_worker.wake)
+
+
+class CreditCardViewSet(viewsets.ModelViewSet):
+    """Cartões de crédito; excluir só desativa o cartão, como na tela de cartões"""
+    serializer_class = CreditCardSerializer
+    queryset = CreditCard.objects.order_by('id')
+    pagination_class = None
+
+    def perform_update(self, serializer):
+        old_closing_day = serializer.instance.closing_day
+        card = serializer.save()
+        if card.closing_day != old_closing_day:
+            # Novo fechamento: as compras antigas podem mudar de mês de fatura
+            billing_service.recompute_billing(card)
+            outbox_worker.wake()
+        else:
+            # O vencimento pode ter mudado: refaz as datas das faturas
+            invoice_service.rebuild(card)
+
+    def perform_destroy(self, instance):
+        instance.active = False
+        instance.save()
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class FinanceAppDjangoConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Registra os signals que mantêm as tabelas agregadas
+        from core import signals  # noqa: F401
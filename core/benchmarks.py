@@ -0,0 +1,276 @@
+import platform
+import random
+import statistics
+import subprocess
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from core.models import CreditCard, Transaction
+from core.services import transaction_service
+from core.services.local_sheets import LocalClient, LocalStore
+from core.services.month_table import MonthTable
+from core.services.sheets_service import HEADER, GoogleSheetsService
+from core.templatetags.current_filters import format_currency, format_currency_float, moeda
+from core.utils import parse_many, parse_money
+
+# (nome, função de preparo, usa o banco?) na ordem em que foram registrados
+BENCHMARKS = []
+
+CATEGORIES = [choice for choice, _ in Transaction.CATEGORY_CHOICES]
+
+
+def benchmark(name, orm=False):
+    """
+    Registra um benchmark. A função recebe o tamanho da massa de dados, prepara o
+    que precisar e devolve a função (sem argumentos) que será cronometrada.
+    """
+    def register(setup):
+        BENCHMARKS.append((name, setup, orm))
+        return setup
+    return register
+
+
+def synthetic_records(size, year=2025, month=1, seed=42):
+    """Registros de uma aba mensal (cabeçalho -> valor), como o get_all_records devolve"""
+    rng = random.Random(seed)
+    first_day = date(year, month, 1)
+    records = []
+    for i in range(1, size + 1):
+        tipo = "receita" if rng.random() < 0.2 else "gasto"
+        records.append({
+            "ID": i,
+            "Valor": round(rng.uniform(1, 5000), 2),
+            "Tipo": tipo,
+            "Descrição": f"Compra {rng.choice(['mercado', 'uber', 'aluguel', 'farmácia'])} {i}",
+            "Método Pagamento": rng.choice(["credito", "debito"]) if tipo == "gasto" else "",
+            "Categoria": rng.choice(CATEGORIES),
+            "Data": str(first_day + timedelta(days=rng.randrange(28))),
+            "Data Registro": str(timezone.now()),
+        })
+    return records
+
+
+def synthetic_money(size, seed=42):
+    rng = random.Random(seed)
+    values = [Decimal(str(round(rng.uniform(0.01, 100000), 2))) for _ in range(size)]
+    masked = [format_currency_float(value) for value in values]
+    return values, masked
+
+
+@benchmark("parse_money")
+def bench_parse_money(size):
+    _, masked = synthetic_money(size)
+    return lambda: [parse_money(value) for value in masked]
+
+
+@benchmark("parse_many")
+def bench_parse_many(size):
+    _, masked = synthetic_money(size)
+    return lambda: parse_many(masked)
+
+
+@benchmark("filtro_moeda")
+def bench_filtro_moeda(size):
+    values, _ = synthetic_money(size)
+    return lambda: [moeda(value) for value in values]
+
+
+@benchmark("filtro_format_currency")
+def bench_format_currency(size):
+    values, _ = synthetic_money(size)
+    return lambda: [format_currency(value) for value in values]
+
+
+@benchmark("filtro_format_currency_float")
+def bench_format_currency_float(size):
+    values, _ = synthetic_money(size)
+    floats = [float(value) for value in values]
+    return lambda: [format_currency_float(value) for value in floats]
+
+
+@benchmark("month_table_from_records")
+def bench_month_table(size):
+    records = synthetic_records(size)
+    return lambda: MonthTable.from_records(records)
+
+
+@benchmark("get_transactions_local")
+def bench_get_transactions(size):
+    """Leitura completa de um mês na planilha local (sem cache), incluindo a conversão"""
+    service = GoogleSheetsService(client=LocalClient(store=LocalStore()))
+    worksheet = service.get_or_create_sheet(2025, 1)
+    worksheet.append_rows([HEADER] + [list(record.values()) for record in synthetic_records(size)])
+
+    def run():
+        service.cache.clear()
+        return service.get_transactions(2025, 1)
+    return run
+
+
+@benchmark("historical_filtro_ordenacao_pagina")
+def bench_historical_pipeline(size):
+    """O caminho do histórico sobre o mês em cache: filtros, ordenação e paginação"""
+    table = MonthTable.from_records(synthetic_records(size))
+
+    def run():
+        transactions = table.select("compra", "gasto", None, "credito", "valor", "desc")
+        return transaction_service.table_page(transactions, "valor", "desc", page_number=3)
+    return run
+
+
+@benchmark("historical_ordenacao_data")
+def bench_sort_by_date(size):
+    """Primeira ordenação por data de um mês recém-carregado (calcula a permutação)"""
+    t = MonthTable.from_records(synthetic_records(size))
+
+    def run():
+        table = MonthTable(t.ids, t.cents, t.has_value, t.dates, t.codes, t.vocabularies,
+                           t.descriptions)
+        return transaction_service.table_page(table.select(order_by="data", direction="asc"))
+    return run
+
+
+@benchmark("historical_pagina_cursor")
+def bench_cursor_page(size):
+    """Próxima página a partir de um cursor no meio do mês, com a permutação pronta"""
+    table = MonthTable.from_records(synthetic_records(size))
+    middle = transaction_service.table_page(table.select(order_by="descricao"),
+                                            "descricao", page_number=size // 20)
+    after = transaction_service.decode_cursor(middle.next_cursor, "descricao", "desc")
+
+    def run():
+        rows = table.select(order_by="descricao")
+        return transaction_service.table_page(rows, "descricao", after=after)
+    return run
+
+
+@benchmark("get_billing_month_for_date")
+def bench_billing_month(size):
+    card = CreditCard(name="Benchmark", closing_day=25, due_day=5, limit=Decimal("1000"))
+    rng = random.Random(42)
+    dates = [date(2020, 1, 1) + timedelta(days=rng.randrange(365 * 5)) for _ in range(size)]
+    return lambda: [card.get_billing_month_for_date(d) for d in dates]
+
+
+@benchmark("orm_criar_transacao", orm=True)
+def bench_orm_create(size):
+    """Criação com fila do Sheets e signals (resumo mensal e faturas), como na view"""
+    rng = random.Random(42)
+    values = [Decimal(str(round(rng.uniform(1, 500), 2))) for _ in range(size)]
+
+    def run():
+        for value in values:
+            transaction_service.save_and_enqueue(Transaction(
+                transaction_type="gasto", description="benchmark", value=value,
+                payment_method="debito", category="outros", date=date(2025, 1, 15),
+            ))
+    return run
+
+
+@benchmark("orm_editar_transacao", orm=True)
+def bench_orm_edit(size):
+    created = Transaction.objects.bulk_create([
+        Transaction(transaction_type="gasto", description="benchmark", value=Decimal("10"),
+                    payment_method="debito", category="outros", date=date(2025, 1, 15))
+        for _ in range(size)
+    ])
+
+    def run():
+        for transaction in created:
+            old_period = transaction.get_sheet_period()
+            transaction.value += 1
+            transaction_service.save_and_enqueue(transaction, "update", old_period=old_period)
+    return run
+
+
+@benchmark("orm_busca_historico", orm=True)
+def bench_orm_search(size):
+    """Busca por prefixo sem acento em todo o histórico (índice FTS5), página por relevância"""
+    rng = random.Random(42)
+    Transaction.objects.bulk_create([
+        Transaction(transaction_type="gasto", value=Decimal("10"), category="outros",
+                    description=f"Compra {rng.choice(['mercado', 'uber', 'farmácia'])} {i}",
+                    date=date(2020 + i % 6, i % 12 + 1, 15))
+        for i in range(size)
+    ])
+
+    def run():
+        list(transaction_service.search_page("farmacia"))
+        list(transaction_service.search_page("merc", order_by="data"))
+    return run
+
+
+def measure(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run_benchmarks(sizes, repeat=5, only=None, orm_max_size=1000, progress=None):
+    """
+    Roda os benchmarks registrados para cada tamanho. Os que usam o banco rodam
+    dentro de uma transação desfeita no fim (nada fica gravado) e com no máximo
+    `orm_max_size` linhas. Retorna a lista de resultados (tempos em segundos).
+    """
+    results = []
+    for name, setup, orm in BENCHMARKS:
+        if only and not any(part in name for part in only):
+            continue
+        for size in sorted({min(size, orm_max_size) if orm else size for size in sizes}):
+            if orm:
+                with db_transaction.atomic():
+                    timings = measure(setup(size), repeat)
+                    db_transaction.set_rollback(True)
+            else:
+                timings = measure(setup(size), repeat)
+
+            result = {
+                "name": name,
+                "size": size,
+                "repeat": repeat,
+                "min": min(timings),
+                "median": statistics.median(timings),
+                "mean": statistics.mean(timings),
+                "per_item_us": statistics.median(timings) / size * 1e6,
+            }
+            results.append(result)
+            if progress:
+                progress(result)
+    return results
+
+
+def environment():
+    """Dados do ambiente gravados junto com os resultados"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "created_at": timezone.now().isoformat(),
+    }
+
+
+def compare(current, previous, threshold=1.10):
+    """
+    Compara com resultados anteriores pela mediana. Retorna (nome, tamanho, anterior,
+    atual, razão, regrediu?) para cada benchmark presente nos dois
+    """
+    old = {(r["name"], r["size"]): r["median"] for r in previous}
+    comparison = []
+    for result in current:
+        key = (result["name"], result["size"])
+        if key in old and old[key]:
+            ratio = result["median"] / old[key]
+            comparison.append((*key, old[key], result["median"], ratio, ratio > threshold))
+    return comparison
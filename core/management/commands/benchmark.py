@@ -0,0 +1,61 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import benchmarks
+
+
+class Command(BaseCommand):
+    help = ("Roda os micro-benchmarks dos caminhos mais usados (offline, com dados "
+            "sintéticos) e grava os resultados em JSON para comparar entre commits")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000,100000",
+                            help="Tamanhos das massas de dados, separados por vírgula")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--only", action="append",
+                            help="Só os benchmarks cujo nome contém este texto (repetível)")
+        parser.add_argument("--orm-max-size", type=int, default=1000,
+                            help="Tamanho máximo dos benchmarks que gravam no banco")
+        parser.add_argument("--output", help="Arquivo JSON para gravar os resultados")
+        parser.add_argument("--compare", help="JSON de uma rodada anterior para comparar")
+        parser.add_argument("--threshold", type=float, default=1.10,
+                            help="Razão da mediana a partir da qual conta como regressão")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options["sizes"].split(",") if size.strip()]
+        except ValueError:
+            raise CommandError("--sizes deve ser uma lista de inteiros separados por vírgula")
+
+        def progress(result):
+            self.stdout.write(
+                f"{result['name']:<40} {result['size']:>7}  "
+                f"mediana {result['median'] * 1000:10.2f} ms  "
+                f"{result['per_item_us']:8.2f} µs/item"
+            )
+
+        results = benchmarks.run_benchmarks(sizes, repeat=options["repeat"],
+                                            only=options["only"],
+                                            orm_max_size=options["orm_max_size"],
+                                            progress=progress)
+        report = {"environment": benchmarks.environment(), "results": results}
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f"Resultados gravados em {options['output']}")
+
+        if options["compare"]:
+            with open(options["compare"], encoding="utf-8") as previous_file:
+                previous = json.load(previous_file)["results"]
+
+            regressions = 0
+            for name, size, old, new, ratio, regressed in benchmarks.compare(
+                    results, previous, options["threshold"]):
+                regressions += regressed
+                flag = "  <-- regressão" if regressed else ""
+                self.stdout.write(f"{name:<40} {size:>7}  {old * 1000:9.2f} -> "
+                                  f"{new * 1000:9.2f} ms  x{ratio:.2f}{flag}")
+            if regressions:
+                raise CommandError(f"{regressions} benchmark(s) mais lento(s) que o limite")
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import CreditCard
+from core.services.import_service import import_statement, parse_statement
+from core.services.sheets_service import GoogleSheetsService
+
+
+class Command(BaseCommand):
+    help = "Importa um extrato bancário (CSV ou OFX) para o banco e o Google Sheets"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Arquivo .csv ou .ofx")
+        parser.add_argument("--card", type=int,
+                            help="ID do cartão de crédito (os gastos entram na fatura)")
+        parser.add_argument("--encoding", default="utf-8-sig")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        credit_card = None
+        if options["card"]:
+            try:
+                credit_card = CreditCard.objects.get(id=options["card"])
+            except CreditCard.DoesNotExist:
+                raise CommandError(f"Cartão {options['card']} não encontrado")
+
+        with open(options["path"], encoding=options["encoding"], newline="") as lines:
+            try:
+                imported, failed = import_statement(
+                    parse_statement(lines, options["path"]),
+                    GoogleSheetsService(),
+                    credit_card=credit_card,
+                    chunk_size=options["chunk_size"],
+                )
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        self.stdout.write(f"{imported} lançamento(s) importado(s)")
+        for year, month in failed:
+            self.stdout.write(f"Aba {month:02d}-{year} ficou na fila para nova tentativa")
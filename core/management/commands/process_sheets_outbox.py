@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.services.outbox_service import outbox_stats, process_outbox
+from core.services.sheets_service import GoogleSheetsService
+
+
+class Command(BaseCommand):
+    help = "Envia para o Google Sheets as operações pendentes da fila"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true",
+                            help="Continua rodando e processando a fila")
+        parser.add_argument("--interval", type=float, default=2.0,
+                            help="Segundos de espera quando a fila está vazia (com --loop)")
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument("--stats", action="store_true",
+                            help="Só mostra o tamanho e o atraso da fila")
+
+    def handle(self, *args, **options):
+        if options["stats"]:
+            self.print_stats()
+            return
+
+        sheets_service = GoogleSheetsService()
+
+        while True:
+            processed = process_outbox(sheets_service, batch_size=options["batch_size"])
+            if processed:
+                self.stdout.write(f"{processed} operação(ões) sincronizada(s)")
+
+            if not options["loop"]:
+                self.print_stats()
+                return
+            if not processed:
+                time.sleep(options["interval"])
+
+    def print_stats(self):
+        stats = outbox_stats()
+        self.stdout.write(
+            f"Pendentes: {stats['pending']} - Falharam: {stats['failed']} - "
+            f"Atraso: {stats['lag_seconds']:.1f}s"
+        )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import CreditCard
+from core.services import invoice_service
+
+
+class Command(BaseCommand):
+    help = "Recalcula as faturas dos cartões a partir das transações"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--card", type=int, help="ID do cartão (padrão: todos)")
+
+    def handle(self, *args, **options):
+        card = None
+        if options["card"] is not None:
+            card = CreditCard.objects.filter(pk=options["card"]).first()
+            if card is None:
+                raise CommandError(f"Cartão {options['card']} não encontrado")
+
+        created = invoice_service.rebuild(card)
+        self.stdout.write(f"{created} fatura(s) recriada(s)")
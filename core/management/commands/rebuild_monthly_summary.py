@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services import summary_service
+
+
+class Command(BaseCommand):
+    help = "Reconstrói (ou só confere, com --verify) a tabela de resumos mensais"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verify", action="store_true",
+                            help="Só compara a tabela com as transações, sem alterar nada")
+
+    def handle(self, *args, **options):
+        if options["verify"]:
+            differences = summary_service.verify()
+            for key, expected, stored in differences:
+                self.stdout.write(f"{key}: esperado {expected}, gravado {stored}")
+            if differences:
+                raise CommandError(f"{len(differences)} resumo(s) divergente(s)")
+            self.stdout.write("Resumos mensais conferem com as transações")
+            return
+
+        created = summary_service.rebuild()
+        self.stdout.write(f"{created} linha(s) de resumo recriada(s)")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import CreditCard
+from core.services import billing_service
+
+
+class Command(BaseCommand):
+    help = ("Recalcula o mês de faturamento das transações de um cartão (ex.: depois de "
+            "mudar o dia de fechamento) e enfileira a mudança de aba no Google Sheets "
+            "(enviada pelo worker ou por process_sheets_outbox)")
+
+    def add_arguments(self, parser):
+        parser.add_argument("card", type=int, help="ID do cartão")
+
+    def handle(self, *args, **options):
+        card = CreditCard.objects.filter(pk=options["card"]).first()
+        if card is None:
+            raise CommandError(f"Cartão {options['card']} não encontrado")
+
+        moved = billing_service.recompute_billing(card)
+        self.stdout.write(f"{moved} transação(ões) mudaram de mês de fatura")
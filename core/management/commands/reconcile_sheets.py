@@ -0,0 +1,50 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from core.services.reconcile_service import POLICIES, reconcile
+from core.services.sheets_service import GoogleSheetsService
+
+
+class Command(BaseCommand):
+    help = "Concilia as abas mensais do Google Sheets com as transações do banco"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--policy", choices=POLICIES,
+                            help="Quem manda quando os lados divergem "
+                                 "(padrão: SHEETS_RECONCILE_POLICY)")
+        parser.add_argument("--year", type=int, help="Só as abas deste ano")
+        parser.add_argument("--month", type=int, help="Só este mês (exige --year)")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Só mostra as diferenças, sem corrigir nada")
+        parser.add_argument("--loop", action="store_true",
+                            help="Continua rodando e concilia a cada --interval segundos")
+        parser.add_argument("--interval", type=float,
+                            default=getattr(settings, "SHEETS_RECONCILE_INTERVAL", 86400))
+
+    def handle(self, *args, **options):
+        months = None
+        if options["month"] is not None:
+            if options["year"] is None:
+                raise CommandError("--month exige --year")
+            months = [(options["year"], options["month"])]
+        elif options["year"] is not None:
+            months = [(options["year"], month) for month in range(1, 13)]
+
+        sheets_service = GoogleSheetsService()
+
+        while True:
+            close_old_connections()
+            results = reconcile(sheets_service, policy=options["policy"], months=months,
+                                dry_run=options["dry_run"])
+            for (year, month), counts in sorted(results.items()):
+                details = ", ".join(f"{name}: {count}" for name, count in counts.items()
+                                    if count)
+                self.stdout.write(f"{month:02d}-{year}: {details}")
+            self.stdout.write(f"{len(results)} aba(s) com diferenças")
+
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,60 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from core.services import metrics
+
+
+class MetricsMiddleware:
+    """
+    Mede cada requisição: latência por view, consultas e tempo no banco e tempo
+    gasto em chamadas ao Google Sheets. Funciona com views síncronas e assíncronas.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        stats, token, start = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+        self.finish(request, response, stats, start)
+        return response
+
+    async def __acall__(self, request):
+        stats, token, start = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+        self.finish(request, response, stats, start)
+        return response
+
+    @staticmethod
+    def start():
+        stats = metrics.RequestStats()
+        return stats, metrics.current_request.set(stats), time.perf_counter()
+
+    @staticmethod
+    def finish(request, response, stats, start):
+        elapsed = time.perf_counter() - start
+        match = getattr(request, "resolver_match", None)
+        # Nome da rota (não a URL) para não criar uma série por ID
+        view = match.view_name if match else "<sem rota>"
+
+        metrics.REQUEST_LATENCY.observe(elapsed, view=view, method=request.method,
+                                        status=response.status_code)
+        metrics.REQUEST_DB_QUERIES.observe(stats.db_queries, view=view)
+        metrics.REQUEST_DB_TIME.observe(stats.db_seconds, view=view)
+        metrics.REQUEST_SHEETS_TIME.observe(stats.sheets_seconds, view=view)
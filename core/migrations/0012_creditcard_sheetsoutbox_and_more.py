@@ -0,0 +1,71 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:51
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_delete_category'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditCard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Nome do Cartão')),
+                ('closing_day', models.PositiveIntegerField(help_text='Dia do mês em que a fatura fecha', verbose_name='Dia de Fechamento')),
+                ('due_day', models.PositiveIntegerField(help_text='Dia do mês em que a fatura vence', verbose_name='Dia de Vencimento')),
+                ('limit', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Limite')),
+                ('active', models.BooleanField(default=True, verbose_name='Ativo')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='billing_month',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Mês de Faturamento'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='billing_year',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Ano de Faturamento'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='category',
+            field=models.CharField(blank=True, choices=[('alimentacao', 'Alimentação'), ('transporte', 'Transporte'), ('salario', 'Salário'), ('outros', 'Outros')], max_length=20),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='credit_card',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.creditcard', verbose_name='Cartão de Crédito'),
+        ),
+        migrations.CreateModel(
+            name='SheetsOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('operation', models.CharField(choices=[('save', 'Salvar'), ('update', 'Atualizar'), ('delete', 'Excluir')], max_length=10)),
+                ('transaction_id', models.PositiveBigIntegerField()),
+                ('old_year', models.PositiveIntegerField(blank=True, null=True)),
+                ('old_month', models.PositiveIntegerField(blank=True, null=True)),
+                ('year', models.PositiveIntegerField(blank=True, null=True)),
+                ('month', models.PositiveIntegerField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pendente'), ('done', 'Concluída'), ('failed', 'Falhou')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'fila do Google Sheets',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='core_sheets_status_5826b1_idx'), models.Index(fields=['transaction_id'], name='core_sheets_transac_ebbf70_idx')],
+            },
+        ),
+    ]
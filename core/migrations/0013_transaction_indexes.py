@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_creditcard_sheetsoutbox_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['date'], name='core_transa_date_2d33ba_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['billing_year', 'billing_month'], name='core_transa_billing_ff1b07_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['transaction_type'], name='core_transa_transac_6780f1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['category'], name='core_transa_categor_ea0e9d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['payment_method'], name='core_transa_payment_b0c938_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_transaction_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField()),
+                ('month', models.PositiveIntegerField()),
+                ('category', models.CharField(blank=True, max_length=20)),
+                ('transaction_type', models.CharField(max_length=10)),
+                ('payment_method', models.CharField(blank=True, max_length=10)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('credit_card', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.creditcard')),
+            ],
+            options={
+                'verbose_name_plural': 'resumos mensais',
+                'indexes': [models.Index(fields=['year', 'month'], name='core_monthl_year_e0596b_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_monthlysummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditCardInvoice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('billing_year', models.PositiveIntegerField(verbose_name='Ano de Faturamento')),
+                ('billing_month', models.PositiveIntegerField(verbose_name='Mês de Faturamento')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('count', models.IntegerField(default=0)),
+                ('closing_date', models.DateField(verbose_name='Fechamento')),
+                ('due_date', models.DateField(verbose_name='Vencimento')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('credit_card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='invoices', to='core.creditcard', verbose_name='Cartão de Crédito')),
+            ],
+            options={
+                'verbose_name_plural': 'faturas',
+                'ordering': ['credit_card', 'billing_year', 'billing_month'],
+                'indexes': [models.Index(fields=['credit_card', 'due_date'], name='core_credit_credit__d50dfe_idx')],
+                'constraints': [models.UniqueConstraint(fields=('credit_card', 'billing_year', 'billing_month'), name='unique_invoice_per_card_month')],
+            },
+        ),
+    ]
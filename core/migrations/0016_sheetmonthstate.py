@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_creditcardinvoice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SheetMonthState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField()),
+                ('month', models.PositiveIntegerField()),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('rows', models.JSONField(default=dict)),
+                ('checked_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'estados das abas',
+                'constraints': [models.UniqueConstraint(fields=('year', 'month'), name='unique_sheet_month_state')],
+            },
+        ),
+    ]
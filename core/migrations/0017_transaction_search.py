@@ -0,0 +1,67 @@
+from django.db import migrations
+
+# Índice de texto (FTS5) das descrições. "external content": o índice não guarda
+# outra cópia do texto, só os termos; os gatilhos o mantêm em dia em qualquer
+# escrita (save, bulk_create, update, delete). remove_diacritics 2 tira os acentos
+# nos dois lados: "alimentacao" encontra "Alimentação".
+FORWARD = [
+    """
+    CREATE VIRTUAL TABLE core_transaction_search USING fts5(
+        description,
+        content='core_transaction',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER core_transaction_search_insert AFTER INSERT ON core_transaction BEGIN
+        INSERT INTO core_transaction_search(rowid, description)
+        VALUES (new.id, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER core_transaction_search_delete AFTER DELETE ON core_transaction BEGIN
+        INSERT INTO core_transaction_search(core_transaction_search, rowid, description)
+        VALUES ('delete', old.id, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER core_transaction_search_update AFTER UPDATE OF description
+    ON core_transaction BEGIN
+        INSERT INTO core_transaction_search(core_transaction_search, rowid, description)
+        VALUES ('delete', old.id, old.description);
+        INSERT INTO core_transaction_search(rowid, description)
+        VALUES (new.id, new.description);
+    END
+    """,
+    # Indexa as transações que já existem
+    "INSERT INTO core_transaction_search(core_transaction_search) VALUES ('rebuild')",
+]
+
+BACKWARD = [
+    "DROP TRIGGER IF EXISTS core_transaction_search_update",
+    "DROP TRIGGER IF EXISTS core_transaction_search_delete",
+    "DROP TRIGGER IF EXISTS core_transaction_search_insert",
+    "DROP TABLE IF EXISTS core_transaction_search",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        # Só o SQLite tem FTS5; nos outros bancos a busca continua com icontains
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_sheetmonthstate'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(FORWARD), run(BACKWARD)),
+    ]
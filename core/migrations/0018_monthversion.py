@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_transaction_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField()),
+                ('month', models.PositiveIntegerField()),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'versões dos meses',
+                'constraints': [models.UniqueConstraint(fields=('year', 'month'), name='unique_month_version')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_monthversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sheetsoutbox',
+            name='claim',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='sheetsoutbox',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='sheetsoutbox',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pendente'), ('processing', 'Em envio'), ('done', 'Concluída'), ('failed', 'Falhou')], default='pending', max_length=10),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:48
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+KEY_FIELDS = ('year', 'month', 'category', 'transaction_type', 'payment_method',
+              'credit_card')
+
+
+def merge_duplicates(apps, schema_editor):
+    """Junta na primeira linha as linhas de resumo repetidas antes da restrição"""
+    MonthlySummary = apps.get_model('core', 'MonthlySummary')
+    duplicated = (MonthlySummary.objects.values(*KEY_FIELDS)
+                  .annotate(keep=Min('id'), rows=Count('id'), sum_total=Sum('total'),
+                            sum_count=Sum('count'))
+                  .filter(rows__gt=1).order_by())
+    for row in duplicated:
+        key = {field: row[field] for field in KEY_FIELDS}
+        MonthlySummary.objects.filter(pk=row['keep']).update(total=row['sum_total'],
+                                                            count=row['sum_count'])
+        MonthlySummary.objects.filter(**key).exclude(pk=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_sheetsoutbox_claim'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='monthlysummary',
+            constraint=models.UniqueConstraint(condition=models.Q(('credit_card__isnull', False)), fields=('year', 'month', 'category', 'transaction_type', 'payment_method', 'credit_card'), name='unique_summary_per_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='monthlysummary',
+            constraint=models.UniqueConstraint(condition=models.Q(('credit_card__isnull', True)), fields=('year', 'month', 'category', 'transaction_type', 'payment_method'), name='unique_summary_per_key_without_card'),
+        ),
+    ]
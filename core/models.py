@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 class CreditCard(models.Model):
@@ -21,19 +22,45 @@ class CreditCard(models.Model):
         if reference_date is None:
             reference_date = datetime.now()
 
-        # Se a data atual é antes do dia de fechamento, a fatura é do mês atual
-        if reference_date.day <= self.closing_day:
-            start_date = datetime(reference_date.year,
-                                  reference_date.month - 1 if reference_date.month > 1 else 12,
-                                  self.closing_day + 1)
-            end_date = datetime(reference_date.year, reference_date.month, self.closing_day)
+        # Se a data atual é até o dia de fechamento, a fatura fecha neste mês
+        closing_this_month = self.get_closing_date(reference_date.year, reference_date.month)
+        if reference_date.day <= closing_this_month.day:
+            end_date = closing_this_month
+            previous_year, previous_month = self._shift_month(reference_date.year,
+                                                              reference_date.month, -1)
+            start_date = self.get_closing_date(previous_year, previous_month) + timedelta(days=1)
         else:
-            start_date = datetime(reference_date.year, reference_date.month, self.closing_day + 1)
-            end_date = datetime(reference_date.year,
-                                reference_date.month + 1 if reference_date.month < 12 else 1,
-                                self.closing_day)
+            start_date = closing_this_month + timedelta(days=1)
+            next_year, next_month = self._shift_month(reference_date.year,
+                                                      reference_date.month, 1)
+            end_date = self.get_closing_date(next_year, next_month)
 
-        return start_date, end_date
+        return (datetime.combine(start_date, datetime.min.time()),
+                datetime.combine(end_date, datetime.min.time()))
+
+    @staticmethod
+    def _shift_month(year, month, delta):
+        """Soma `delta` meses a (ano, mês), virando o ano quando preciso"""
+        index = year * 12 + month - 1 + delta
+        return index // 12, index % 12 + 1
+
+    @staticmethod
+    def _clamped_date(year, month, day):
+        """Data com o dia limitado ao último dia do mês (ex.: dia 31 em fevereiro)"""
+        import calendar
+        from datetime import date
+        return date(year, month, min(day, calendar.monthrange(year, month)[1]))
+
+    def get_closing_date(self, year, month):
+        """Data em que fecha a fatura do mês (ano, mês)"""
+        return self._clamped_date(year, month, self.closing_day)
+
+    def get_due_date(self, year, month):
+        """Data de vencimento da fatura do mês (ano, mês): no mesmo mês ou no seguinte"""
+        if self.due_day > self.closing_day:
+            return self._clamped_date(year, month, self.due_day)
+        next_year, next_month = self._shift_month(year, month, 1)
+        return self._clamped_date(next_year, next_month, self.due_day)
 
     def get_billing_month_for_date(self, transaction_date):
         """Determina em qual mês de fatura uma transação deve cair"""
@@ -53,8 +80,30 @@ class CreditCard(models.Model):
                 return transaction_date.month + 1, transaction_date.year
 
 
+class TransactionQuerySet(models.QuerySet):
+    def in_sheet_period(self, year, month):
+        """Transações que ficam na aba (ano, mês): mês de fatura no crédito, senão a data"""
+        return self.filter(
+            models.Q(billing_year=year, billing_month=month)
+            | models.Q(billing_year__isnull=True, date__year=year, date__month=month)
+        )
+
+    def in_sheet_range(self, start, end):
+        """Transações das abas de `start` até `end` (pares (ano, mês), inclusive)"""
+        from django.db.models.functions import Coalesce, ExtractMonth, ExtractYear
+        period = (Coalesce('billing_year', ExtractYear('date')) * 12
+                  + Coalesce('billing_month', ExtractMonth('date')) - 1)
+        return self.annotate(sheet_period=period).filter(
+            sheet_period__range=(start[0] * 12 + start[1] - 1, end[0] * 12 + end[1] - 1))
+
+
 class Transaction(models.Model):
-    """Dados de receitas ou gastos"""
+    """
+    Dados de receitas ou gastos. No SQLite, a descrição é indexada na tabela FTS5
+    core_transaction_search por gatilhos (migração 0017). Migrações que refazem esta
+    tabela (AlterField, RemoveField) apagam os gatilhos; o post_migrate
+    signals.restore_search_index os recria e reindexa.
+    """
     TIPO_CHOICES = [
         ('receita', 'Receita'),
         ('gasto', 'Gasto')
@@ -85,8 +134,23 @@ class Transaction(models.Model):
     date = models.DateField(null=True)
     date_added = models.DateTimeField(auto_now_add=True)
 
+    objects = TransactionQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = 'transações'
+        indexes = [
+            models.Index(fields=['date']),
+            models.Index(fields=['billing_year', 'billing_month']),
+            models.Index(fields=['transaction_type']),
+            models.Index(fields=['category']),
+            models.Index(fields=['payment_method']),
+        ]
+
+    def get_sheet_period(self):
+        """Retorna (ano, mês) da aba do Google Sheets onde a transação fica"""
+        if self.billing_year and self.billing_month:
+            return self.billing_year, self.billing_month
+        return self.date.year, self.date.month
 
     def __str__(self):
         """Devolve uma representação em string do modelo"""
@@ -94,3 +158,169 @@ class Transaction(models.Model):
                 f"Tipo: {self.transaction_type} - "
                 f"Categoria: {self.category} - "
                 f"Data: {self.date}")
+
+
+class MonthlySummary(models.Model):
+    """
+    Soma e quantidade de transações por mês (o mesmo mês da aba do Sheets),
+    categoria, tipo, método de pagamento e cartão. Mantida por deltas a cada
+    alteração de Transaction; o comando rebuild_monthly_summary reconstrói do zero.
+    """
+    year = models.PositiveIntegerField()
+    month = models.PositiveIntegerField()
+    category = models.CharField(max_length=20, blank=True)
+    transaction_type = models.CharField(max_length=10)
+    payment_method = models.CharField(max_length=10, blank=True)
+    credit_card = models.ForeignKey(CreditCard, on_delete=models.SET_NULL, null=True,
+                                    blank=True)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'resumos mensais'
+        # Uma linha por chave (summary_service.KEY_FIELDS). NULLs não se repetem
+        # numa restrição única, então as linhas sem cartão têm a sua
+        constraints = [
+            models.UniqueConstraint(
+                fields=['year', 'month', 'category', 'transaction_type', 'payment_method',
+                        'credit_card'],
+                condition=models.Q(credit_card__isnull=False),
+                name='unique_summary_per_key'),
+            models.UniqueConstraint(
+                fields=['year', 'month', 'category', 'transaction_type', 'payment_method'],
+                condition=models.Q(credit_card__isnull=True),
+                name='unique_summary_per_key_without_card'),
+        ]
+        indexes = [
+            models.Index(fields=['year', 'month']),
+        ]
+
+    def __str__(self):
+        return (f"{self.month:02d}/{self.year} - {self.transaction_type} - "
+                f"{self.category}: R${self.total} ({self.count})")
+
+
+class CreditCardInvoice(models.Model):
+    """
+    Fatura de um cartão em um mês de faturamento: total das compras (menos
+    estornos), quantidade, fechamento e vencimento. Mantida por deltas a cada
+    alteração de Transaction no crédito.
+    """
+    credit_card = models.ForeignKey(CreditCard, on_delete=models.CASCADE,
+                                    related_name='invoices', verbose_name="Cartão de Crédito")
+    billing_year = models.PositiveIntegerField(verbose_name="Ano de Faturamento")
+    billing_month = models.PositiveIntegerField(verbose_name="Mês de Faturamento")
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+    closing_date = models.DateField(verbose_name="Fechamento")
+    due_date = models.DateField(verbose_name="Vencimento")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'faturas'
+        ordering = ['credit_card', 'billing_year', 'billing_month']
+        constraints = [
+            models.UniqueConstraint(fields=['credit_card', 'billing_year', 'billing_month'],
+                                    name='unique_invoice_per_card_month'),
+        ]
+        indexes = [
+            models.Index(fields=['credit_card', 'due_date']),
+        ]
+
+    def __str__(self):
+        return f"{self.credit_card} - {self.billing_month:02d}/{self.billing_year}"
+
+    @property
+    def is_open(self):
+        """A fatura está aberta até o dia do fechamento"""
+        from datetime import date
+        return date.today() <= self.closing_date
+
+
+class SheetsOutbox(models.Model):
+    """
+    Operações pendentes de sincronização com o Google Sheets. Cada linha é gravada
+    na mesma transação do banco que altera a Transaction e é processada depois
+    pelo comando process_sheets_outbox.
+    """
+    OPERATION_CHOICES = [
+        ('save', 'Salvar'),
+        ('update', 'Atualizar'),
+        ('delete', 'Excluir'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'Pendente'),
+        ('processing', 'Em envio'),
+        ('done', 'Concluída'),
+        ('failed', 'Falhou'),
+    ]
+
+    operation = models.CharField(max_length=10, choices=OPERATION_CHOICES)
+    # Não é ForeignKey: a operação precisa sobreviver à exclusão da transação
+    transaction_id = models.PositiveBigIntegerField()
+    old_year = models.PositiveIntegerField(null=True, blank=True)
+    old_month = models.PositiveIntegerField(null=True, blank=True)
+    year = models.PositiveIntegerField(null=True, blank=True)
+    month = models.PositiveIntegerField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    # Worker que reservou a operação (ver outbox_service.claim) e quando
+    claim = models.CharField(max_length=32, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'fila do Google Sheets'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['transaction_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.operation} #{self.transaction_id} ({self.status})"
+
+
+class SheetMonthState(models.Model):
+    """
+    Último estado conciliado de uma aba mensal: impressão digital da aba inteira e
+    de cada linha (ID -> hash). Serve de base para saber qual lado mudou desde então.
+    """
+    year = models.PositiveIntegerField()
+    month = models.PositiveIntegerField()
+    fingerprint = models.CharField(max_length=64)
+    rows = models.JSONField(default=dict)
+    checked_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'estados das abas'
+        constraints = [
+            models.UniqueConstraint(fields=['year', 'month'], name='unique_sheet_month_state'),
+        ]
+
+    def __str__(self):
+        return f"{self.month:02d}-{self.year}"
+
+
+class MonthVersion(models.Model):
+    """
+    Versão das transações de um mês (o mesmo mês da aba do Sheets): aumenta a cada
+    alteração que afeta o mês. Serve de base para os ETags da API, sem reler as
+    transações para saber se algo mudou.
+    """
+    year = models.PositiveIntegerField()
+    month = models.PositiveIntegerField()
+    version = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'versões dos meses'
+        constraints = [
+            models.UniqueConstraint(fields=['year', 'month'], name='unique_month_version'),
+        ]
+
+    def __str__(self):
+        return f"{self.month:02d}-{self.year} v{self.version}"
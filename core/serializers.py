@@ -1,9 +1,66 @@
 from rest_framework import serializers
 
-from core.models import Transaction
+from core.models import CreditCard, Transaction
+from core.utils import MoneyParseError, parse_money
 
 
-class TransactionSerializer(serializers.ModelSerializer):
+class MoneyField(serializers.DecimalField):
+    """Valor em reais: aceita número ou texto ("1.234,56", "R$ 10,00") como o resto do app"""
+
+    def to_internal_value(self, data):
+        try:
+            data = parse_money(data)
+        except MoneyParseError:
+            self.fail('invalid')
+        return super().to_internal_value(data)
+
+
+class FieldsMixin:
+    """
+    Resposta só com os campos pedidos em ?fields=a,b (sparse fieldset). Campos
+    desconhecidos são ignorados; sem o parâmetro, vêm todos.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        requested = request.query_params.get('fields') if request is not None else None
+        if requested and request.method == 'GET':
+            wanted = {name.strip() for name in requested.split(',')}
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
+class CreditCardSerializer(FieldsMixin, serializers.ModelSerializer):
+    limit = MoneyField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        model = CreditCard
+        fields = ['id', 'name', 'closing_day', 'due_day', 'limit', 'active', 'created_at',
+                  'updated_at']
+        read_only_fields = ['active', 'created_at', 'updated_at']
+
+
+class TransactionSerializer(FieldsMixin, serializers.ModelSerializer):
+    value = MoneyField(max_digits=10, decimal_places=2)
+    # Vem do select_related('credit_card') da listagem, sem consulta por linha
+    credit_card_name = serializers.CharField(source='credit_card.name', read_only=True,
+                                             default=None)
+
     class Meta:
         model = Transaction
         fields = '__all__'
+        # O mês de fatura é calculado pelo cartão, como nas telas
+        read_only_fields = ['billing_month', 'billing_year', 'date_added']
+        extra_kwargs = {'date': {'required': True, 'allow_null': False}}
+
+    def validate(self, attrs):
+        transaction_type = attrs.get('transaction_type',
+                                     getattr(self.instance, 'transaction_type', None))
+        # Método de pagamento só em gastos, como no formulário de nova transação
+        if transaction_type != 'gasto':
+            attrs['payment_method'] = ''
+        credit_card = attrs.get('credit_card')
+        if credit_card is not None and not credit_card.active:
+            raise serializers.ValidationError({'credit_card': 'Cartão inativo.'})
+        return attrs
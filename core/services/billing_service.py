@@ -0,0 +1,73 @@
+from django.db import transaction as db_transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+from core.models import SheetsOutbox, Transaction
+from core.services import invoice_service, summary_service
+
+
+def billing_expressions(closing_day):
+    """
+    Mês e ano de faturamento calculados no banco, com a mesma regra de
+    CreditCard.get_billing_month_for_date: até o fechamento fica no mês da compra,
+    depois vai para o mês seguinte (dezembro vira janeiro do ano seguinte)
+    """
+    same_month = Q(date__day__lte=closing_day)
+    billing_month = Case(
+        When(same_month, then=ExtractMonth('date')),
+        When(date__month=12, then=Value(1)),
+        default=ExtractMonth('date') + Value(1),
+        output_field=IntegerField(),
+    )
+    billing_year = Case(
+        When(same_month | ~Q(date__month=12), then=ExtractYear('date')),
+        default=ExtractYear('date') + Value(1),
+        output_field=IntegerField(),
+    )
+    return billing_month, billing_year
+
+
+def card_transactions(card):
+    """Transações do cartão que entram em fatura"""
+    return Transaction.objects.filter(credit_card=card, date__isnull=False,
+                                      billing_month__isnull=False)
+
+
+def recompute_billing(card):
+    """
+    Reatribui o mês de faturamento de todas as transações do cartão depois de uma
+    mudança no dia de fechamento, com um único UPDATE no banco. Ajusta o resumo
+    mensal, recalcula as faturas e enfileira a mudança de aba de cada transação
+    afetada na fila do Google Sheets, na mesma transação do banco: o worker junta
+    com o que já estiver pendente para elas. Retorna quantas transações mudaram de mês.
+    """
+    billing_month, billing_year = billing_expressions(card.closing_day)
+
+    with db_transaction.atomic():
+        # Só as transações que mudam de mês precisam ir para a planilha e para o resumo
+        stale = list(
+            card_transactions(card)
+            .annotate(new_billing_month=billing_month, new_billing_year=billing_year)
+            .filter(~Q(billing_month=F('new_billing_month'))
+                    | ~Q(billing_year=F('new_billing_year')))
+        )
+
+        card_transactions(card).update(billing_month=billing_month,
+                                       billing_year=billing_year)
+
+        # update() não dispara signals: desconta as versões antigas do resumo e soma as novas
+        summary_service.add_transactions(stale, sign=-1)
+        pending = []
+        for t in stale:
+            old_year, old_month = t.get_sheet_period()
+            t.billing_month, t.billing_year = t.new_billing_month, t.new_billing_year
+            pending.append(SheetsOutbox(operation='update', transaction_id=t.id,
+                                        old_year=old_year, old_month=old_month,
+                                        year=t.billing_year, month=t.billing_month))
+        summary_service.add_transactions(stale)
+        SheetsOutbox.objects.bulk_create(pending, batch_size=1000)
+
+        # As datas de fechamento e vencimento também mudaram
+        invoice_service.rebuild(card)
+
+    return len(stale)
@@ -0,0 +1,77 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+
+from core.models import MonthlySummary, Transaction
+from core.services import metrics
+
+CATEGORY_LABELS = dict(Transaction.CATEGORY_CHOICES)
+
+
+def cache_key(year, month):
+    return f"dashboard:{year}:{month:02d}"
+
+
+def invalidate(year, month):
+    """Descarta o painel em cache do mês assim que a alteração for confirmada no banco"""
+    db_transaction.on_commit(lambda: cache.delete(cache_key(year, month)))
+
+
+def get_dashboard_data(year, month):
+    """Indicadores do mês, calculados a partir do resumo mensal e guardados em cache"""
+    key = cache_key(year, month)
+    data = cache.get(key)
+    metrics.cache_result("dashboard", data is not None)
+    if data is None:
+        data = compute_dashboard_data(year, month)
+        cache.set(key, data, getattr(settings, "DASHBOARD_CACHE_TTL", 60))
+    return data
+
+
+def compute_dashboard_data(year, month):
+    """
+    Soma as linhas de resumo do mês (uma por categoria/tipo/pagamento/cartão),
+    sem percorrer as transações
+    """
+    rows = (MonthlySummary.objects
+            .filter(year=year, month=month)
+            .exclude(count=0)
+            .values('transaction_type', 'payment_method', 'category', 'credit_card__name',
+                    'total', 'count'))
+
+    receitas = gastos = gastos_credito = gastos_debito = Decimal('0')
+    quantidade = 0
+    categorias = {}
+    cartoes = {}
+
+    for row in rows:
+        quantidade += row['count']
+        if row['transaction_type'] == 'receita':
+            receitas += row['total']
+            continue
+
+        gastos += row['total']
+        if row['payment_method'] == 'credito':
+            gastos_credito += row['total']
+        else:
+            gastos_debito += row['total']
+
+        categoria = CATEGORY_LABELS.get(row['category'], row['category'] or 'Sem categoria')
+        categorias[categoria] = categorias.get(categoria, Decimal('0')) + row['total']
+
+        if row['credit_card__name']:
+            cartao = row['credit_card__name']
+            cartoes[cartao] = cartoes.get(cartao, Decimal('0')) + row['total']
+
+    return {
+        "receitas": receitas,
+        "gastos": gastos,
+        "gastos_credito": gastos_credito,
+        "gastos_debito": gastos_debito,
+        "saldo": receitas - gastos,
+        "quantidade": quantidade,
+        "top_categorias": sorted(categorias.items(), key=lambda item: item[1], reverse=True)[:5],
+        "gastos_por_cartao": sorted(cartoes.items(), key=lambda item: item[1], reverse=True),
+    }
@@ -0,0 +1,113 @@
+import csv
+import itertools
+import tempfile
+
+import xlsxwriter
+from asgiref.sync import sync_to_async
+
+from core.templatetags.current_filters import moeda
+
+HEADER = ["ID", "Data", "Descrição", "Valor", "Tipo", "Categoria", "Método Pagamento",
+          "Cartão", "Mês Fatura"]
+
+CHUNK_SIZE = 2000
+
+# Linhas do CSV juntadas a cada passagem pela thread do banco no modo ASGI
+ASYNC_BATCH_ROWS = 500
+
+# Bytes do XLSX lidos do arquivo temporário a cada bloco no modo ASGI
+FILE_BLOCK_SIZE = 64 * 1024
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+class Echo:
+    """Objeto com write() que só devolve o valor, para o csv.writer gerar linhas sob demanda"""
+
+    def write(self, value):
+        return value
+
+
+def export_queryset(queryset):
+    """Seleciona só as colunas exportadas e ordena de forma estável"""
+    return (queryset
+            .select_related('credit_card')
+            .only('id', 'date', 'description', 'value', 'transaction_type', 'category',
+                  'payment_method', 'billing_month', 'billing_year', 'credit_card__name')
+            .order_by('date', 'id'))
+
+
+def export_row(transaction, format_value=True):
+    """Linha exportada; o valor sai como o filtro `moeda` ou numérico (para planilhas)"""
+    return [
+        transaction.id,
+        transaction.date.strftime("%d/%m/%Y") if transaction.date else "",
+        transaction.description,
+        moeda(transaction.value) if format_value else float(transaction.value),
+        transaction.get_transaction_type_display(),
+        transaction.get_category_display(),
+        transaction.get_payment_method_display(),
+        transaction.credit_card.name if transaction.credit_card else "",
+        (f"{transaction.billing_month:02d}/{transaction.billing_year}"
+         if transaction.billing_month else ""),
+    ]
+
+
+def iter_csv(queryset):
+    """Gera o CSV linha a linha, lendo o banco em blocos com iterator()"""
+    writer = csv.writer(Echo(), delimiter=";")
+    # BOM para o Excel reconhecer UTF-8
+    yield "\ufeff" + writer.writerow(HEADER)
+    for transaction in export_queryset(queryset).iterator(chunk_size=CHUNK_SIZE):
+        yield writer.writerow(export_row(transaction))
+
+
+async def aiter_csv(queryset):
+    """
+    iter_csv para o ASGI: com um gerador síncrono, o StreamingHttpResponse junta o
+    CSV inteiro na memória antes de enviar. Aqui cada bloco de linhas é lido na
+    thread do banco (sync_to_async, sempre a mesma) e enviado em seguida.
+    """
+    rows = iter_csv(queryset)
+
+    def next_block():
+        return "".join(itertools.islice(rows, ASYNC_BATCH_ROWS))
+
+    while block := await sync_to_async(next_block)():
+        yield block
+
+
+def write_xlsx(queryset):
+    """
+    Escreve o XLSX num arquivo temporário em modo constant_memory (cada linha é
+    descarregada no disco assim que escrita) e devolve o arquivo posicionado no início
+    """
+    output = tempfile.TemporaryFile()
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+    worksheet = workbook.add_worksheet("Transações")
+    money = workbook.add_format({"num_format": '"R$" #,##0.00'})
+
+    worksheet.write_row(0, 0, HEADER)
+    for row_number, transaction in enumerate(
+            export_queryset(queryset).iterator(chunk_size=CHUNK_SIZE), start=1):
+        row = export_row(transaction, format_value=False)
+        worksheet.write_row(row_number, 0, row[:3])
+        worksheet.write_number(row_number, 3, row[3], money)
+        worksheet.write_row(row_number, 4, row[4:])
+
+    workbook.close()
+    output.seek(0)
+    return output
+
+
+async def aiter_file(output):
+    """
+    Arquivo (o XLSX temporário) para o ASGI: o FileResponse o lê com um iterador
+    síncrono, que também fica inteiro na memória. Cada bloco é lido com sync_to_async,
+    como em aiter_csv, e o arquivo é fechado no fim.
+    """
+    try:
+        while block := await sync_to_async(output.read)(FILE_BLOCK_SIZE):
+            yield block
+    finally:
+        output.close()
@@ -0,0 +1,202 @@
+import csv
+import logging
+import re
+from datetime import datetime, timedelta
+from itertools import islice
+
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from core.models import SheetsOutbox, Transaction
+from core.services import invoice_service, summary_service
+from core.utils import MoneyParseError, parse_date, parse_money
+
+logger = logging.getLogger(__name__)
+
+# Nomes de coluna aceitos no CSV -> campo interno
+CSV_COLUMNS = {
+    "data": "data",
+    "date": "data",
+    "descricao": "descricao",
+    "descrição": "descricao",
+    "description": "descricao",
+    "historico": "descricao",
+    "histórico": "descricao",
+    "valor": "valor",
+    "value": "valor",
+    "tipo": "tipo",
+    "categoria": "categoria",
+    "pagamento": "pagamento",
+}
+
+OFX_TAG = re.compile(r"<(\w+)>([^<\r\n]*)")
+
+
+def parse_csv(lines):
+    """
+    Lê um extrato CSV linha a linha (separador ";" ou ",") e gera um dicionário
+    por lançamento com data, descricao, valor e, se existirem, tipo/categoria/pagamento
+    """
+    lines = iter(lines)
+    header_line = next(lines, "")
+    if not header_line.strip():
+        return
+
+    delimiter = ";" if header_line.count(";") >= header_line.count(",") else ","
+    header = next(csv.reader([header_line], delimiter=delimiter))
+    fields = [CSV_COLUMNS.get(name.strip().lower()) for name in header]
+
+    for line_number, values in enumerate(csv.reader(lines, delimiter=delimiter), start=2):
+        if not any(value.strip() for value in values):
+            continue
+
+        row = {field: value.strip() for field, value in zip(fields, values) if field}
+        try:
+            yield {
+                "data": parse_date(row["data"]),
+                "descricao": row.get("descricao", ""),
+                "valor": parse_money(row["valor"]),
+                "tipo": row.get("tipo", ""),
+                "categoria": row.get("categoria", ""),
+                "pagamento": row.get("pagamento", ""),
+            }
+        except KeyError as e:
+            raise ValueError(f"Linha {line_number}: coluna {e} ausente")
+        except MoneyParseError as e:
+            raise ValueError(f"Linha {line_number}: {e}")
+
+
+def parse_ofx(lines):
+    """
+    Lê um extrato OFX (SGML ou XML) linha a linha e gera um dicionário por
+    <STMTTRN>, sem carregar o arquivo inteiro
+    """
+    current = None
+    for line in lines:
+        for tag, value in OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == "STMTTRN":
+                current = {}
+            elif current is not None:
+                current[tag] = value.strip()
+
+        if current is not None and "</STMTTRN>" in line.upper():
+            try:
+                yield {
+                    "data": datetime.strptime(current["DTPOSTED"][:8], "%Y%m%d").date(),
+                    "descricao": current.get("MEMO") or current.get("NAME", ""),
+                    "valor": parse_money(current["TRNAMT"]),
+                    "tipo": "",
+                    "categoria": "",
+                    "pagamento": "",
+                }
+            except (KeyError, MoneyParseError) as e:
+                raise ValueError(f"Lançamento OFX inválido: {e}")
+            current = None
+
+
+def parse_statement(lines, filename):
+    """Escolhe o leitor pelo formato do arquivo (.ofx ou CSV)"""
+    if filename.lower().endswith(".ofx"):
+        return parse_ofx(lines)
+    return parse_csv(lines)
+
+
+def build_transaction(row, credit_card=None):
+    """Converte um lançamento lido do extrato em Transaction (ainda não salva)"""
+    valor = row["valor"]
+    tipo = row["tipo"] or ("receita" if valor > 0 else "gasto")
+
+    billing_month = None
+    billing_year = None
+    if credit_card:
+        # Extrato do cartão: estornos (receitas) também ficam na fatura, descontando
+        billing_month, billing_year = credit_card.get_billing_month_for_date(row["data"])
+
+    payment_method = row["pagamento"]
+    if tipo != "gasto":
+        payment_method = ""
+    elif credit_card:
+        payment_method = "credito"
+    elif not payment_method:
+        payment_method = "debito"
+
+    return Transaction(
+        transaction_type=tipo,
+        description=row["descricao"][:250],
+        value=abs(valor),
+        payment_method=payment_method,
+        category=row["categoria"],
+        date=row["data"],
+        credit_card=credit_card,
+        billing_month=billing_month,
+        billing_year=billing_year,
+    )
+
+
+def import_statement(rows, sheets_service, credit_card=None, chunk_size=1000):
+    """
+    Importa os lançamentos em blocos com bulk_create e envia cada mês para o
+    Google Sheets de uma vez (uma chamada append_rows por aba).
+
+    Cada bloco grava também as entradas da fila do Sheets; as que forem enviadas
+    aqui são marcadas como concluídas e as que falharem ficam para o worker.
+    Retorna (quantidade importada, lista de abas que falharam). Um lançamento
+    inválido interrompe a importação com ValueError, mantendo os blocos anteriores.
+    """
+    # Adia as entradas para o worker não concorrer com o envio feito aqui; o horário
+    # também identifica as entradas desta importação
+    postponed = timezone.now() + timedelta(minutes=30)
+    periods = set()
+    first_id = last_id = None
+    imported = 0
+
+    error = None
+
+    transactions = (build_transaction(row, credit_card) for row in rows)
+    try:
+        while True:
+            chunk = list(islice(transactions, chunk_size))
+            if not chunk:
+                break
+
+            with db_transaction.atomic():
+                created = Transaction.objects.bulk_create(chunk)
+                SheetsOutbox.objects.bulk_create([
+                    SheetsOutbox(operation='save', transaction_id=t.id, year=year,
+                                 month=month, next_attempt_at=postponed)
+                    for t in created
+                    for year, month in [t.get_sheet_period()]
+                ])
+                # bulk_create não dispara signals: atualiza o resumo mensal e as faturas aqui
+                summary_service.add_transactions(created)
+                invoice_service.add_transactions(created)
+
+            periods.update(t.get_sheet_period() for t in created)
+            first_id = created[0].id if first_id is None else first_id
+            last_id = created[-1].id
+            imported += len(created)
+    except ValueError as e:
+        # Os blocos anteriores já estão no banco: envia-os antes de reportar o erro
+        error = e
+
+    failed = []
+    for year, month in sorted(periods):
+        entries = SheetsOutbox.objects.filter(operation='save', status='pending', year=year,
+                                              month=month, next_attempt_at=postponed)
+        upserts = (Transaction.objects
+                   .in_sheet_period(year, month)
+                   .filter(id__range=(first_id, last_id))
+                   .order_by('id'))
+        try:
+            sheets_service.sync_worksheet(year, month, upserts)
+        except Exception as e:
+            logger.exception("Erro ao enviar importação para a aba %02d-%d", month, year)
+            entries.update(next_attempt_at=timezone.now(), last_error=str(e))
+            failed.append((year, month))
+        else:
+            entries.update(status='done', processed_at=timezone.now())
+
+    if error:
+        raise ValueError(f"{error} ({imported} lançamentos importados antes do erro)")
+    return imported, failed
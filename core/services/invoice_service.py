@@ -0,0 +1,149 @@
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from core.models import CreditCard, CreditCardInvoice, Transaction
+
+KEY_FIELDS = ('credit_card_id', 'billing_year', 'billing_month')
+
+
+def invoice_key(transaction):
+    """Chave da fatura de uma transação (ou None se ela não entra em fatura de cartão)"""
+    if not (transaction.credit_card_id and transaction.billing_year
+            and transaction.billing_month):
+        return None
+    return transaction.credit_card_id, transaction.billing_year, transaction.billing_month
+
+
+def signed_value(transaction):
+    """Valor que a transação soma na fatura: gastos somam, receitas (estornos) descontam"""
+    value = Decimal(str(transaction.value))
+    return -value if transaction.transaction_type == 'receita' else value
+
+
+def apply_delta(key, total, count):
+    """Soma `total` e `count` na fatura da chave, criando-a com as datas do cartão se preciso"""
+    card_id, year, month = key
+    invoice = CreditCardInvoice.objects.filter(
+        credit_card_id=card_id, billing_year=year, billing_month=month)
+    with db_transaction.atomic():
+        updated = invoice.update(total=F('total') + total, count=F('count') + count)
+        if not updated:
+            card = CreditCard.objects.get(pk=card_id)
+            try:
+                with db_transaction.atomic():
+                    CreditCardInvoice.objects.create(
+                        credit_card=card, billing_year=year, billing_month=month,
+                        total=total, count=count,
+                        closing_date=card.get_closing_date(year, month),
+                        due_date=card.get_due_date(year, month),
+                    )
+            except IntegrityError:
+                # Outra requisição criou a fatura depois do update: soma nela
+                invoice.update(total=F('total') + total, count=F('count') + count)
+
+
+def apply_change(old, new):
+    """Desconta a versão antiga da transação (se houver) e soma a nova (se houver)"""
+    old_key = invoice_key(old) if old is not None else None
+    new_key = invoice_key(new) if new is not None else None
+    if old_key is not None:
+        apply_delta(old_key, -signed_value(old), -1)
+    if new_key is not None:
+        apply_delta(new_key, signed_value(new), 1)
+
+
+def add_transactions(transactions, sign=1):
+    """Aplica de uma vez os deltas de várias transações (ex.: depois de um bulk_create)"""
+    deltas = defaultdict(lambda: [Decimal('0'), 0])
+    for transaction in transactions:
+        key = invoice_key(transaction)
+        if key is None:
+            continue
+        deltas[key][0] += signed_value(transaction) * sign
+        deltas[key][1] += sign
+
+    for key, (total, count) in deltas.items():
+        apply_delta(key, total, count)
+
+
+def compute_invoices(card=None):
+    """Agrega as transações de cartão no banco, no mesmo formato das faturas"""
+    queryset = Transaction.objects.filter(credit_card__isnull=False,
+                                          billing_year__isnull=False,
+                                          billing_month__isnull=False)
+    if card is not None:
+        queryset = queryset.filter(credit_card=card)
+
+    return (queryset
+            .values(*KEY_FIELDS)
+            .annotate(
+                gastos=Coalesce(Sum('value', filter=~Q(transaction_type='receita')),
+                                Value(Decimal('0'))),
+                estornos=Coalesce(Sum('value', filter=Q(transaction_type='receita')),
+                                  Value(Decimal('0'))),
+                count=Count('id'),
+            )
+            .order_by())
+
+
+def rebuild(card=None):
+    """
+    Recalcula as faturas do zero (de um cartão ou de todos), refazendo também as
+    datas de fechamento e vencimento. Retorna quantas faturas foram criadas
+    """
+    cards = {c.pk: c for c in (CreditCard.objects.filter(pk=card.pk) if card is not None
+                               else CreditCard.objects.all())}
+    invoices = []
+    for row in compute_invoices(card):
+        owner = cards[row['credit_card_id']]
+        year, month = row['billing_year'], row['billing_month']
+        invoices.append(CreditCardInvoice(
+            credit_card=owner, billing_year=year, billing_month=month,
+            total=row['gastos'] - row['estornos'], count=row['count'],
+            closing_date=owner.get_closing_date(year, month),
+            due_date=owner.get_due_date(year, month),
+        ))
+
+    with db_transaction.atomic():
+        existing = CreditCardInvoice.objects.all()
+        if card is not None:
+            existing = existing.filter(credit_card=card)
+        existing.delete()
+        CreditCardInvoice.objects.bulk_create(invoices, batch_size=1000)
+    return len(invoices)
+
+
+def card_statements(cards, today=None):
+    """
+    Resumo de fatura de cada cartão para a página de cartões, lido só das faturas
+    gravadas: fatura aberta, faturas fechadas ainda a vencer e limite disponível
+    (limite menos tudo que ainda não venceu)
+    """
+    today = today or date.today()
+    cards = list(cards)
+    pending = defaultdict(list)
+    for invoice in (CreditCardInvoice.objects
+                    .filter(credit_card__in=cards, due_date__gte=today)
+                    .exclude(count=0)
+                    .order_by('billing_year', 'billing_month')):
+        pending[invoice.credit_card_id].append(invoice)
+
+    statements = []
+    for card in cards:
+        invoices = pending[card.pk]
+        open_invoice = next((i for i in invoices if i.closing_date >= today), None)
+        closed = [i for i in invoices if i.closing_date < today]
+        used = sum((i.total for i in invoices), Decimal('0'))
+        statements.append({
+            'cartao': card,
+            'fatura_aberta': open_invoice,
+            'faturas_fechadas': closed,
+            'limite_usado': used,
+            'limite_disponivel': card.limit - used,
+        })
+    return statements
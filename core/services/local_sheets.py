@@ -0,0 +1,258 @@
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+
+import gspread
+from gspread.exceptions import APIError
+from gspread.utils import a1_to_rowcol, numericise
+
+from core.services import metrics
+
+RANGE_WITH_TITLE = re.compile(r"^'?(?P<title>.*?)'?!(?P<range>.+)$")
+
+
+class LocalResponse:
+    """Resposta mínima para montar um APIError igual ao do gspread"""
+
+    def __init__(self, code, message):
+        self.status_code = code
+        self.text = message
+        self._error = {"error": {"code": code, "message": message, "status": "LOCAL"}}
+
+    def json(self):
+        return self._error
+
+
+def api_error(code, message):
+    return APIError(LocalResponse(code, message))
+
+
+class LocalStore:
+    """Estado de todas as planilhas locais do processo, compartilhado entre clientes"""
+
+    def __init__(self):
+        self.spreadsheets = {}
+        self.calls = Counter()
+        self.lock = threading.RLock()
+
+    def clear(self):
+        with self.lock:
+            self.spreadsheets.clear()
+            self.calls.clear()
+
+
+store = LocalStore()
+
+
+class LocalClient:
+    """
+    Equivalente local, em memória, do gspread.Client, com o subconjunto da API do
+    gspread usado pelo GoogleSheetsService (SHEETS_BACKEND = "local"). Serve para
+    rodar o app, testes e benchmarks sem rede, com latência artificial por chamada.
+    """
+
+    def __init__(self, latency=0.0, store=store):
+        self.latency = latency
+        self.store = store
+
+    def call(self, name):
+        """Conta a chamada e aplica a latência artificial, como uma ida à API"""
+        with metrics.sheets_call(name):
+            self.store.calls[name] += 1
+            if self.latency:
+                time.sleep(self.latency)
+
+    def open(self, title):
+        self.call("open")
+        with self.store.lock:
+            for spreadsheet in self.store.spreadsheets.values():
+                if spreadsheet.title == title:
+                    return spreadsheet
+            spreadsheet = LocalSpreadsheet(self, title)
+            self.store.spreadsheets[spreadsheet.id] = spreadsheet
+            return spreadsheet
+
+    def open_by_key(self, key):
+        self.call("open_by_key")
+        with self.store.lock:
+            spreadsheet = self.store.spreadsheets.get(key)
+            if spreadsheet is None:
+                spreadsheet = LocalSpreadsheet(self, "Financeiro", key=key)
+                self.store.spreadsheets[key] = spreadsheet
+            return spreadsheet
+
+
+class LocalSpreadsheet:
+    def __init__(self, client, title, key=None):
+        self.client = client
+        self.title = title
+        self.id = key or uuid.uuid4().hex
+        self._worksheets = {}
+        self._next_id = 1
+
+    def worksheets(self):
+        self.client.call("worksheets")
+        with self.client.store.lock:
+            return list(self._worksheets.values())
+
+    def worksheet(self, title):
+        self.client.call("worksheet")
+        with self.client.store.lock:
+            if title not in self._worksheets:
+                raise gspread.WorksheetNotFound(title)
+            return self._worksheets[title]
+
+    def add_worksheet(self, title, rows=100, cols=10):
+        self.client.call("add_worksheet")
+        with self.client.store.lock:
+            if title in self._worksheets:
+                raise api_error(400, f'A sheet with the name "{title}" already exists.')
+            worksheet = LocalWorksheet(self, title, self._next_id)
+            self._next_id += 1
+            self._worksheets[title] = worksheet
+            return worksheet
+
+    def _by_id(self, sheet_id):
+        for worksheet in self._worksheets.values():
+            if worksheet.id == sheet_id:
+                return worksheet
+        raise api_error(400, f"No grid with id: {sheet_id}")
+
+    def batch_update(self, body):
+        """
+        Aceita os pedidos usados pelo serviço: updateCells, deleteDimension (linhas) e
+        appendCells, aplicados na ordem e todos de uma vez, como na API
+        """
+        self.client.call("batch_update")
+        with self.client.store.lock:
+            for request in body["requests"]:
+                if "deleteDimension" in request:
+                    grid = request["deleteDimension"]["range"]
+                    rows = self._by_id(grid["sheetId"]).rows
+                    del rows[grid["startIndex"]:grid["endIndex"]]
+                elif "updateCells" in request:
+                    update = request["updateCells"]
+                    worksheet = self._by_id(update["start"]["sheetId"])
+                    for offset, row in enumerate(update["rows"]):
+                        for col, cell in enumerate(row["values"], start=1):
+                            worksheet._set(update["start"]["rowIndex"] + offset + 1, col,
+                                           next(iter(cell["userEnteredValue"].values())))
+                elif "appendCells" in request:
+                    append = request["appendCells"]
+                    self._by_id(append["sheetId"]).rows.extend(
+                        [next(iter(cell["userEnteredValue"].values())) for cell in row["values"]]
+                        for row in append["rows"]
+                    )
+                else:
+                    raise api_error(400, f"Pedido não suportado localmente: {list(request)}")
+            return {"spreadsheetId": self.id, "replies": [{} for _ in body["requests"]]}
+
+    def values_batch_get(self, ranges, params=None):
+        self.client.call("values_batch_get")
+        value_ranges = []
+        with self.client.store.lock:
+            for a1_range in ranges:
+                match = RANGE_WITH_TITLE.match(a1_range)
+                title = match.group("title") if match else a1_range
+                if title not in self._worksheets:
+                    raise api_error(400, f"Unable to parse range: {a1_range}")
+                value_ranges.append({
+                    "range": a1_range,
+                    "values": self._worksheets[title].values(),
+                })
+        return {"spreadsheetId": self.id, "valueRanges": value_ranges}
+
+
+class LocalWorksheet:
+    """Aba local: uma lista de linhas, com os mesmos números de linha (1..n) do Sheets"""
+
+    def __init__(self, spreadsheet, title, sheet_id):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        self.rows = []
+
+    def _call(self, name):
+        self.spreadsheet.client.call(name)
+        return self.spreadsheet.client.store.lock
+
+    def values(self):
+        """Cópia das linhas sem as células vazias do fim, como a API devolve"""
+        values = []
+        for row in self.rows:
+            row = list(row)
+            while row and row[-1] in ("", None):
+                row.pop()
+            values.append(row)
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def _set(self, row, col, value):
+        while len(self.rows) < row:
+            self.rows.append([])
+        cells = self.rows[row - 1]
+        while len(cells) < col:
+            cells.append("")
+        cells[col - 1] = value
+
+    def col_values(self, col, **kwargs):
+        with self._call("col_values"):
+            values = [row[col - 1] if len(row) >= col else "" for row in self.values()]
+            while values and values[-1] == "":
+                values.pop()
+            return [str(value) for value in values]
+
+    def acell(self, label, **kwargs):
+        with self._call("acell"):
+            row, col = a1_to_rowcol(label)
+            value = self.rows[row - 1][col - 1] if (row <= len(self.rows)
+                                                    and col <= len(self.rows[row - 1])) else None
+            return gspread.Cell(row, col, None if value is None else str(value))
+
+    def row_values(self, row, **kwargs):
+        with self._call("row_values"):
+            values = self.values()
+            return list(values[row - 1]) if row <= len(values) else []
+
+    def get_all_records(self, **kwargs):
+        with self._call("get_all_records"):
+            values = self.values()
+            if not values:
+                return []
+            header = values[0]
+            return [
+                dict(zip(header, [numericise(value) if isinstance(value, str) else value
+                                  for value in row + [""] * (len(header) - len(row))]))
+                for row in values[1:]
+            ]
+
+    def append_row(self, values, **kwargs):
+        with self._call("append_row"):
+            self.rows.append(list(values))
+
+    def append_rows(self, values, **kwargs):
+        with self._call("append_rows"):
+            self.rows.extend(list(row) for row in values)
+
+    def _update(self, a1_range, values):
+        start = a1_range.split(":")[0]
+        first_row, first_col = a1_to_rowcol(start)
+        for row_offset, row in enumerate(values):
+            for col_offset, value in enumerate(row):
+                self._set(first_row + row_offset, first_col + col_offset, value)
+
+    def update(self, range_name, values, **kwargs):
+        with self._call("update"):
+            self._update(range_name, values)
+
+    def batch_update(self, data, **kwargs):
+        with self._call("batch_update_values"):
+            for item in data:
+                self._update(item["range"], item["values"])
+
+    def delete_rows(self, start_index, end_index=None):
+        with self._call("delete_rows"):
+            del self.rows[start_index - 1:end_index or start_index]
@@ -0,0 +1,268 @@
+import contextlib
+import contextvars
+import math
+import threading
+import time
+
+# Limites (em segundos) dos histogramas de latência
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base das métricas: valores por combinação de labels, protegidos por um lock"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple((name, labels.get(name, "")) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        """Linhas (nome, labels, valor) no formato de exposição do Prometheus"""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}"
+                     for name, labels, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((f"{self.name}_bucket", key + (("le", _format_value(bound)),),
+                                    count))
+                samples.append((f"{self.name}_sum", key, total))
+                samples.append((f"{self.name}_count", key, counts[-1]))
+        return samples
+
+
+class Gauge(Metric):
+    """Valor lido na hora da coleta, por uma função que devolve {labels: valor} ou um número"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, collect, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def samples(self):
+        values = self.collect()
+        if not isinstance(values, dict):
+            return [(self.name, (), values)]
+        return [(self.name, tuple(zip(self.labelnames, key)), value)
+                for key, value in sorted(values.items())]
+
+
+class CollectedCounter(Gauge):
+    """
+    Contador mantido fora do registro (ex.: QuotaStats), lido na hora da coleta como o
+    Gauge, mas exposto como counter: os valores só crescem
+    """
+
+    kind = "counter"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def collected_counter(self, *args, **kwargs):
+        return self.register(CollectedCounter(*args, **kwargs))
+
+    def render(self):
+        """Todas as métricas no formato texto do Prometheus (text/plain; version=0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # Uma coleta com erro (ex.: banco fora) não derruba as outras métricas
+                lines.append(f"# erro ao coletar {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "Tempo de resposta por view",
+    ["view", "method", "status"])
+REQUEST_DB_QUERIES = REGISTRY.histogram(
+    "http_request_db_queries", "Consultas ao banco por requisição",
+    ["view"], buckets=COUNT_BUCKETS)
+REQUEST_DB_TIME = REGISTRY.histogram(
+    "http_request_db_seconds", "Tempo no banco por requisição", ["view"])
+REQUEST_SHEETS_TIME = REGISTRY.histogram(
+    "http_request_sheets_seconds", "Tempo em chamadas ao Google Sheets por requisição",
+    ["view"])
+DB_QUERIES = REGISTRY.counter("db_queries_total", "Consultas ao banco", ["alias"])
+DB_QUERY_TIME = REGISTRY.histogram(
+    "db_query_duration_seconds", "Duração de cada consulta ao banco", ["alias"])
+SHEETS_CALLS = REGISTRY.counter(
+    "sheets_api_calls_total", "Idas à API do Google Sheets (cada tentativa) por operação",
+    ["operation"])
+SHEETS_ERRORS = REGISTRY.counter(
+    "sheets_api_errors_total", "Idas à API do Google Sheets que falharam", ["operation"])
+SHEETS_LATENCY = REGISTRY.histogram(
+    "sheets_api_duration_seconds", "Duração das idas à API do Google Sheets", ["operation"])
+CACHE_REQUESTS = REGISTRY.counter(
+    "cache_requests_total", "Consultas aos caches por resultado (hit/miss)", ["cache", "result"])
+
+
+class RequestStats:
+    """Totais de uma requisição (banco e Sheets), somados inclusive de outras threads"""
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.sheets_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, name, amount):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+
+# Totais da requisição em andamento. O contexto acompanha o sync_to_async e o pool
+# de threads do Sheets, então as consultas feitas fora da thread da view também contam
+current_request = contextvars.ContextVar("metrics_current_request", default=None)
+
+
+def cache_result(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    """execute_wrapper do Django: conta e cronometra cada consulta"""
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        alias = context["connection"].alias
+        DB_QUERIES.inc(alias=alias)
+        DB_QUERY_TIME.observe(elapsed, alias=alias)
+        stats = current_request.get()
+        if stats is not None:
+            stats.add("db_queries", 1)
+            stats.add("db_seconds", elapsed)
+
+
+def install_db_wrapper(connection):
+    """Instala o wrapper numa conexão (uma vez por conexão aberta)"""
+    if db_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_execute_wrapper)
+
+
+@contextlib.contextmanager
+def sheets_call(operation):
+    """
+    Mede uma ida à API do Sheets (ou ao backend local): conta a chamada e o erro, se
+    houver, por operação e soma a duração no tempo de Sheets da requisição
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        SHEETS_ERRORS.inc(operation=operation)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        SHEETS_CALLS.inc(operation=operation)
+        SHEETS_LATENCY.observe(elapsed, operation=operation)
+        stats = current_request.get()
+        if stats is not None:
+            stats.add("sheets_seconds", elapsed)
+
+
+def _quota_stats():
+    from core.services.sheets_client import stats
+    return {(field,): value for field, value in stats.snapshot().items()}
+
+
+def _outbox_stats():
+    from core.services.outbox_service import outbox_stats
+    return {(field,): value for field, value in outbox_stats().items()}
+
+
+REGISTRY.collected_counter(
+    "sheets_quota_client_total", "Contadores do cliente com cotas do Sheets (desde o início)",
+    _quota_stats, ["field"])
+REGISTRY.gauge("sheets_outbox", "Fila de envio ao Sheets: pendentes, falhas e atraso (s)",
+               _outbox_stats, ["field"])
@@ -0,0 +1,266 @@
+import bisect
+import sys
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+
+from core.utils import MoneyParseError, fold_text, parse_date, parse_money
+
+# Colunas com poucos valores diferentes, guardadas como códigos (int16) + vocabulário
+CODED_COLUMNS = ("tipo", "categoria", "pagamento")
+
+# Campos de ordenação do histórico que viram uma chave numérica
+NUMERIC_KEYS = {"valor": "cents", "data": "dates"}
+
+# Campos pelos quais o histórico pode ordenar
+SORT_FIELDS = ("data", "valor", "descricao", "tipo", "categoria", "pagamento")
+
+# Ordinal guardado para data ilegível: fica antes de qualquer data válida (como date.min)
+NO_DATE = 0
+
+
+class MonthTable:
+    """
+    Transações de um ou mais meses do Sheets em colunas NumPy: centavos (int64),
+    datas como ordinal (int32), tipo/categoria/pagamento como códigos pequenos
+    (int16) e as descrições numa lista de strings internadas. Ocupa uma fração das
+    linhas em dicionário e permite filtrar com máscaras vetorizadas. Os dados não
+    mudam depois de montada (só as ordenações são guardadas conforme são usadas):
+    pode ser compartilhada pelo cache entre requisições.
+    """
+
+    def __init__(self, ids, cents, has_value, dates, codes, vocabularies, descriptions):
+        self.ids = ids
+        self.cents = cents
+        self.has_value = has_value
+        self.dates = dates
+        self.codes = codes
+        self.vocabularies = vocabularies
+        self.descriptions = descriptions
+        self._folded = None
+        self._keys = {}
+        self._orders = {}
+
+    def __len__(self):
+        return len(self.cents)
+
+    @classmethod
+    def empty(cls):
+        return cls.from_records([])
+
+    @classmethod
+    def from_records(cls, records):
+        """Monta a tabela a partir dos registros da aba (cabeçalho -> valor)"""
+        count = len(records)
+        ids = np.full(count, -1, dtype=np.int64)
+        cents = np.zeros(count, dtype=np.int64)
+        has_value = np.zeros(count, dtype=bool)
+        dates = np.full(count, NO_DATE, dtype=np.int32)
+        codes = {column: np.zeros(count, dtype=np.int16) for column in CODED_COLUMNS}
+        vocabularies = {column: {} for column in CODED_COLUMNS}
+        descriptions = []
+
+        # Um mês tem poucas datas diferentes: cada texto é convertido uma vez só
+        ordinals = {}
+        for i, row in enumerate(records):
+            transaction_id = row.get("ID")
+            if isinstance(transaction_id, float) and transaction_id.is_integer():
+                transaction_id = int(transaction_id)
+            if isinstance(transaction_id, int) or str(transaction_id).isdigit():
+                ids[i] = int(transaction_id)
+
+            try:
+                cents[i] = parse_money(row.get("Valor", 0), cents=True)
+                has_value[i] = True
+            except MoneyParseError:
+                pass
+
+            data_text = str(row.get("Data", ""))[:10]
+            if data_text not in ordinals:
+                try:
+                    ordinals[data_text] = parse_date(data_text).toordinal()
+                except ValueError:
+                    ordinals[data_text] = NO_DATE
+            dates[i] = ordinals[data_text]
+
+            for column, header in (("tipo", "Tipo"), ("categoria", "Categoria"),
+                                   ("pagamento", "Método Pagamento")):
+                vocabulary = vocabularies[column]
+                value = str(row.get(header, ""))
+                code = vocabulary.get(value)
+                if code is None:
+                    code = vocabulary[value] = len(vocabulary)
+                codes[column][i] = code
+
+            descriptions.append(sys.intern(str(row.get("Descrição", ""))))
+
+        return cls(ids, cents, has_value, dates, codes,
+                   {column: list(vocabulary) for column, vocabulary in vocabularies.items()},
+                   descriptions)
+
+    @classmethod
+    def concat(cls, tables):
+        """Junta as tabelas de vários meses (na ordem dada) numa só"""
+        tables = [table for table in tables if len(table)]
+        if not tables:
+            return cls.empty()
+        if len(tables) == 1:
+            return tables[0]
+
+        codes = {}
+        vocabularies = {}
+        for column in CODED_COLUMNS:
+            # Vocabulário comum; cada tabela traduz os seus códigos com um array de consulta
+            merged = {}
+            parts = []
+            for table in tables:
+                lookup = np.array([merged.setdefault(value, len(merged))
+                                   for value in table.vocabularies[column]], dtype=np.int16)
+                parts.append(lookup[table.codes[column]])
+            codes[column] = np.concatenate(parts)
+            vocabularies[column] = list(merged)
+
+        return cls(
+            np.concatenate([table.ids for table in tables]),
+            np.concatenate([table.cents for table in tables]),
+            np.concatenate([table.has_value for table in tables]),
+            np.concatenate([table.dates for table in tables]),
+            codes,
+            vocabularies,
+            [description for table in tables for description in table.descriptions],
+        )
+
+    def mask(self, busca=None, tipo=None, categoria=None, pagamento=None):
+        """Máscara das linhas que passam pelos filtros do histórico"""
+        mask = np.ones(len(self), dtype=bool)
+        for column, value, everything in (("tipo", tipo, "todos"),
+                                          ("categoria", categoria, "todas"),
+                                          ("pagamento", pagamento, "todos")):
+            if value and value != everything:
+                vocabulary = self.vocabularies[column]
+                if value not in vocabulary:
+                    return np.zeros(len(self), dtype=bool)
+                mask &= self.codes[column] == vocabulary.index(value)
+
+        if busca:
+            # Sem acentos, como o índice de texto do banco: "acougue" encontra "Açougue"
+            busca = fold_text(busca)
+            if self._folded is None:
+                self._folded = [fold_text(description) for description in self.descriptions]
+            mask &= np.fromiter((busca in description for description in self._folded),
+                                dtype=bool, count=len(self))
+        return mask
+
+    def sort_key(self, field):
+        """
+        Chave inteira (array) do campo para ordenar, e os valores distintos em ordem
+        para os campos de texto (None nos numéricos). Textos viram o dobro da posição
+        em ordem alfabética, para que um valor ausente caiba entre dois (ver seek_key).
+        """
+        if field not in self._keys:
+            if field in NUMERIC_KEYS:
+                self._keys[field] = (getattr(self, NUMERIC_KEYS[field]), None)
+            elif field in CODED_COLUMNS:
+                vocabulary = self.vocabularies[field]
+                ordered = sorted(vocabulary)
+                ranks = np.array([2 * ordered.index(value) for value in vocabulary],
+                                 dtype=np.int32)
+                self._keys[field] = (ranks[self.codes[field]], ordered)
+            else:
+                ordered, inverse = np.unique(np.array(self.descriptions, dtype=object),
+                                             return_inverse=True)
+                self._keys[field] = (2 * inverse.astype(np.int32).ravel(), list(ordered))
+        return self._keys[field]
+
+    def seek_key(self, field, value):
+        """Converte o valor de um cursor na chave inteira do campo (mesma escala de sort_key)"""
+        _, ordered = self.sort_key(field)
+        if ordered is None:
+            return int(value)
+        position = bisect.bisect_left(ordered, str(value))
+        exact = position < len(ordered) and ordered[position] == str(value)
+        return 2 * position if exact else 2 * position - 1
+
+    def order(self, field, descending):
+        """
+        Permutação de todas as linhas ordenadas por (campo, ID), calculada na primeira
+        vez e guardada na tabela (que fica no cache): trocar de página ou voltar a uma
+        ordenação já usada não ordena de novo
+        """
+        if (field, descending) not in self._orders:
+            key, _ = self.sort_key(field)
+            order = np.lexsort((-self.ids, -key) if descending else (self.ids, key))
+            self._orders[field, descending] = order.astype(np.int32)
+        return self._orders[field, descending]
+
+    def select(self, busca=None, tipo=None, categoria=None, pagamento=None, order_by="data",
+               direction="desc"):
+        """Linhas filtradas e ordenadas como o histórico pede, sem montar nenhuma linha"""
+        field = order_by if order_by in SORT_FIELDS else "data"
+        descending = direction == "desc"
+        indices = self.order(field, descending)
+        if busca or tipo or categoria or pagamento:
+            # A permutação já está ordenada: filtrar mantém a ordem, sem ordenar de novo
+            indices = indices[self.mask(busca, tipo, categoria, pagamento)[indices]]
+        return TableRows(self, indices, field, descending)
+
+    def row(self, i):
+        """Uma linha no formato do histórico (valor em Decimal e data em date, ou None)"""
+        return {
+            "id": int(self.ids[i]) if self.ids[i] >= 0 else None,
+            "descricao": self.descriptions[i],
+            "valor": Decimal(int(self.cents[i])).scaleb(-2) if self.has_value[i] else None,
+            "tipo": self.vocabularies["tipo"][self.codes["tipo"][i]],
+            "categoria": self.vocabularies["categoria"][self.codes["categoria"][i]],
+            "pagamento": self.vocabularies["pagamento"][self.codes["pagamento"][i]],
+            "data": date.fromordinal(int(self.dates[i])) if self.dates[i] != NO_DATE else None,
+        }
+
+    def nbytes(self):
+        """Memória aproximada das colunas (arrays e a lista de descrições)"""
+        arrays = [self.ids, self.cents, self.has_value, self.dates, *self.codes.values()]
+        return (sum(array.nbytes for array in arrays) + sys.getsizeof(self.descriptions)
+                + sum(sys.getsizeof(d) for d in set(self.descriptions)))
+
+
+class TableRows:
+    """
+    Sequência ordenada de linhas selecionadas de uma MonthTable: o dicionário de
+    cada linha só é montado quando ela é lida (a página atual)
+    """
+
+    def __init__(self, table, indices, field="data", descending=True):
+        self.table = table
+        self.indices = indices
+        self.field = field
+        self.descending = descending
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self.table.row(i) for i in self.indices[item]]
+        return self.table.row(self.indices[item])
+
+    def __iter__(self):
+        return (self.table.row(i) for i in self.indices)
+
+    def seek(self, value, transaction_id, after=True):
+        """
+        Posição da primeira linha depois (after=True) ou da primeira linha não
+        anterior (after=False) a (valor, ID), por busca binária: O(log n)
+        """
+        key, _ = self.table.sort_key(self.field)
+        ids = self.table.ids
+        # Em ordem decrescente, as chaves negadas ficam crescentes
+        sign = -1 if self.descending else 1
+
+        def position_key(position):
+            i = self.indices[position]
+            return sign * int(key[i]), sign * int(ids[i])
+
+        target = (sign * self.table.seek_key(self.field, value), sign * transaction_id)
+        find = bisect.bisect_right if after else bisect.bisect_left
+        return find(range(len(self.indices)), target, key=position_key)
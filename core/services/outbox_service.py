@@ -0,0 +1,227 @@
+import logging
+import random
+import threading
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Min
+from django.utils import timezone
+
+from core.models import SheetsOutbox, Transaction
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(operation, transaction, old_period=None):
+    """
+    Registra uma operação para o Google Sheets. Deve ser chamada dentro do mesmo
+    transaction.atomic() que grava a Transaction, para que as duas andem juntas.
+    """
+    old_year, old_month = old_period if old_period else (None, None)
+    year, month = (None, None) if operation == 'delete' else transaction.get_sheet_period()
+
+    return SheetsOutbox.objects.create(
+        operation=operation,
+        transaction_id=transaction.id,
+        old_year=old_year,
+        old_month=old_month,
+        year=year,
+        month=month,
+    )
+
+
+def coalesce(entries, periods=None):
+    """
+    Junta as operações pendentes de cada transação no efeito final por aba.
+
+    `periods` traz a aba atual de cada transação no banco (ID -> (ano, mês)), lida
+    na hora do envio: vale mais que a gravada na fila, que pode ter ficado velha se
+    a transação mudou de mês depois. A origem é a aba onde a linha estava antes da
+    primeira operação pendente.
+
+    Retorna {(ano, mês): {"upserts": set(ids), "deletes": set(ids)}} e o mapa
+    (ano, mês) -> entradas envolvidas, usado para marcar sucesso ou falha.
+    """
+    periods = periods or {}
+    by_transaction = defaultdict(list)
+    for entry in entries:
+        by_transaction[entry.transaction_id].append(entry)
+
+    plan = defaultdict(lambda: {"upserts": set(), "deletes": set()})
+    involved = defaultdict(list)
+
+    for transaction_id, items in by_transaction.items():
+        first, last = items[0], items[-1]
+        if first.old_year:
+            origin = (first.old_year, first.old_month)
+        elif first.operation == 'update':
+            origin = (first.year, first.month)
+        else:
+            origin = None
+        if last.operation == 'delete':
+            destination = None
+        else:
+            destination = periods.get(transaction_id, (last.year, last.month))
+
+        if origin and origin != destination:
+            plan[origin]["deletes"].add(transaction_id)
+            involved[origin].extend(items)
+        if destination:
+            plan[destination]["upserts"].add(transaction_id)
+            involved[destination].extend(items)
+
+    return plan, involved
+
+
+def claim(batch_size=200):
+    """
+    Reserva para este worker as operações prontas de até `batch_size` transações e
+    devolve a reserva. Cada reserva é um único UPDATE condicional (status pending ->
+    processing), então dois workers (threads de processos web diferentes ou o
+    comando) nunca pegam a mesma operação. Transações com operações já em envio
+    por outro worker ficam de fora, para a ordem delas ser mantida.
+    """
+    now = timezone.now()
+    # Reservas antigas são de um worker que parou no meio: voltam para a fila
+    timeout = getattr(settings, "SHEETS_OUTBOX_CLAIM_TIMEOUT", 300)
+    SheetsOutbox.objects.filter(
+        status='processing', claimed_at__lt=now - timedelta(seconds=timeout),
+    ).update(status='pending', claim='')
+
+    busy = SheetsOutbox.objects.filter(status='processing').values('transaction_id')
+    ready_ids = set(
+        SheetsOutbox.objects
+        .filter(status='pending', next_attempt_at__lte=now)
+        .exclude(transaction_id__in=busy)
+        .values_list('transaction_id', flat=True)[:batch_size]
+    )
+    if not ready_ids:
+        return None
+
+    # Todas as pendências dessas transações, para coalescer a sequência inteira
+    token = uuid.uuid4().hex
+    SheetsOutbox.objects.filter(status='pending', transaction_id__in=ready_ids).exclude(
+        transaction_id__in=busy).update(status='processing', claim=token, claimed_at=now)
+    return token
+
+
+def process_outbox(sheets_service, batch_size=200):
+    """
+    Processa as operações pendentes, agrupadas por aba e enviadas numa requisição
+    só (sync_worksheets). Retorna quantas foram concluídas. Vários workers podem
+    rodar ao mesmo tempo: cada um só envia o que reservou com claim().
+    """
+    token = claim(batch_size)
+    if token is None:
+        return 0
+
+    entries = list(SheetsOutbox.objects.filter(status='processing', claim=token))
+    if not entries:
+        return 0
+    ready_ids = {entry.transaction_id for entry in entries}
+    # A aba de destino sai do estado atual da transação, não da fila
+    transactions = Transaction.objects.in_bulk(ready_ids)
+    plan, involved = coalesce(entries, {transaction_id: transaction.get_sheet_period()
+                                        for transaction_id, transaction in transactions.items()
+                                        if transaction.date is not None})
+
+    # Todas as abas numa requisição só: uma mudança de aba sai da antiga e entra na
+    # nova juntas. Transação apagada do banco depois de enfileirada: não há o que gravar
+    changes = {period: ([transactions[i] for i in sorted(change["upserts"])
+                         if i in transactions], change["deletes"])
+               for period, change in plan.items()}
+    failed = {}
+    try:
+        if changes:
+            sheets_service.sync_worksheets(changes)
+    except Exception as e:
+        logger.exception("Erro ao sincronizar as abas %s",
+                         ", ".join(f"{month:02d}-{year}" for year, month in sorted(changes)))
+        for entries_of_period in involved.values():
+            for entry in entries_of_period:
+                failed[entry.id] = str(e)
+
+    done = [entry.id for entry in entries if entry.id not in failed]
+    SheetsOutbox.objects.filter(id__in=done).update(status='done', claim='',
+                                                    processed_at=timezone.now())
+
+    for entry in entries:
+        if entry.id in failed:
+            _schedule_retry(entry, failed[entry.id])
+
+    return len(done)
+
+
+def _schedule_retry(entry, error):
+    """Reagenda a operação com backoff exponencial e jitter, ou desiste após o limite"""
+    max_attempts = getattr(settings, "SHEETS_OUTBOX_MAX_ATTEMPTS", 8)
+    base_delay = getattr(settings, "SHEETS_OUTBOX_RETRY_BASE", 5)
+
+    entry.attempts += 1
+    entry.last_error = error
+    entry.claim = ''
+    if entry.attempts >= max_attempts:
+        entry.status = 'failed'
+    else:
+        entry.status = 'pending'
+        delay = base_delay * 2 ** (entry.attempts - 1)
+        entry.next_attempt_at = timezone.now() + timedelta(
+            seconds=delay * random.uniform(0.5, 1.5))
+    entry.save(update_fields=['attempts', 'last_error', 'claim', 'status',
+                             'next_attempt_at'])
+
+
+def outbox_stats():
+    """Profundidade da fila e atraso (em segundos) da operação pendente mais antiga"""
+    pending = SheetsOutbox.objects.filter(status='pending')
+    oldest = pending.aggregate(oldest=Min('created_at'))['oldest']
+
+    return {
+        "pending": pending.count(),
+        "failed": SheetsOutbox.objects.filter(status='failed').count(),
+        "lag_seconds": (timezone.now() - oldest).total_seconds() if oldest else 0.0,
+    }
+
+
+class OutboxWorker:
+    """
+    Worker em thread que drena a fila dentro do próprio processo web, usando o
+    mesmo GoogleSheetsService (e o mesmo cache) das views. Usado quando
+    SHEETS_OUTBOX_WORKER = "thread"; com "command" a fila fica para o comando
+    process_sheets_outbox.
+    """
+
+    def __init__(self, sheets_service, interval=2.0):
+        self.sheets_service = sheets_service
+        self.interval = interval
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def wake(self):
+        """Acorda o worker (iniciando a thread na primeira vez)"""
+        if getattr(settings, "SHEETS_OUTBOX_WORKER", "thread") != "thread":
+            return
+
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sheets-outbox",
+                                                daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            # Acorda quando chamado ou a cada intervalo, para pegar as retentativas
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                while process_outbox(self.sheets_service):
+                    pass
+            except Exception:
+                logger.exception("Erro no worker da fila do Google Sheets")
+            finally:
+                close_old_connections()
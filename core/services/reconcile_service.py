@@ -0,0 +1,375 @@
+import copy
+import hashlib
+import logging
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce, ExtractMonth, ExtractYear
+
+from core.models import SheetMonthState, SheetsOutbox, Transaction
+from core.services import invoice_service, summary_service, transaction_service
+from core.services.sheets_service import HEADER, GoogleSheetsService
+from core.utils import MoneyParseError, parse_date, parse_money
+
+logger = logging.getLogger(__name__)
+
+# db: o banco manda; sheets: a planilha manda; merge: vale o lado que mudou desde
+# a última conciliação (em conflito, o banco)
+POLICIES = ("db", "sheets", "merge")
+
+SHEET_TITLE = re.compile(r"^(\d{2})-(\d{4})$")
+
+# Colunas comparadas: do ID até a Data (a Data Registro não entra)
+COMPARED_COLUMNS = 7
+
+TYPES = dict(Transaction.TIPO_CHOICES)
+CATEGORIES = dict(Transaction.CATEGORY_CHOICES)
+PAYMENT_METHODS = dict(Transaction.PAYMENT_METHOD)
+
+# A fila ainda vai gravar essas transações: a conciliação não mexe nelas
+UNSENT_STATUS = ('pending', 'processing')
+
+
+class SheetChanged(Exception):
+    """A aba mudou entre a leitura e a escrita da conciliação (ex.: o worker da fila)"""
+
+
+def canonical_row(values):
+    """Normaliza uma linha da planilha (ou de build_row) para comparar os dois lados"""
+    values = list(values[:COMPARED_COLUMNS]) + [""] * (COMPARED_COLUMNS - len(values))
+    transaction_id, value, tipo, description, payment_method, category, data = values
+
+    if isinstance(transaction_id, float) and transaction_id.is_integer():
+        transaction_id = int(transaction_id)
+    if value != "":
+        try:
+            value = str(parse_money(value))
+        except MoneyParseError:
+            # Mantém o texto: difere do banco e a linha não é importada (row_fields)
+            value = str(value).strip()
+    try:
+        data = parse_date(str(data)[:10]).isoformat() if data else ""
+    except ValueError:
+        data = str(data).strip()
+
+    return (str(transaction_id).strip(), value, str(tipo).strip(), str(description).strip(),
+            str(payment_method).strip(), str(category).strip(), data)
+
+
+def row_fingerprint(canonical):
+    return hashlib.sha1("\x1f".join(canonical).encode()).hexdigest()[:16]
+
+
+def month_fingerprint(row_fingerprints):
+    """Impressão digital da aba: independe da ordem das linhas"""
+    return hashlib.sha1("".join(sorted(row_fingerprints)).encode()).hexdigest()
+
+
+def row_fields(canonical):
+    """
+    Campos da Transaction a partir de uma linha normalizada da planilha, ou None
+    se a linha não tem valor, tipo e data válidos
+    """
+    _, value, tipo, description, payment_method, category, data = canonical
+    try:
+        date = parse_date(data)
+        value = parse_money(value)
+    except ValueError:
+        return None
+    if tipo not in TYPES:
+        return None
+
+    return {
+        "value": value,
+        "transaction_type": tipo,
+        "description": description[:250],
+        "payment_method": payment_method if payment_method in PAYMENT_METHODS else "",
+        "category": category if category in CATEGORIES else "",
+        "date": date,
+    }
+
+
+@dataclass
+class MonthDiff:
+    """Diferenças de uma aba e o que fazer com cada uma"""
+    year: int
+    month: int
+    push_updates: list = field(default_factory=list)   # (linha, transação)
+    push_appends: list = field(default_factory=list)   # transações
+    sheet_deletes: list = field(default_factory=list)  # linhas
+    pull_updates: list = field(default_factory=list)   # (transação, campos)
+    pull_creates: list = field(default_factory=list)   # (linha, campos)
+    db_deletes: list = field(default_factory=list)     # transações
+    # ID lido na coluna A de cada linha, conferido de novo antes de escrever
+    row_ids: dict = field(default_factory=dict)        # linha -> ID
+
+    @property
+    def empty(self):
+        return not (self.push_updates or self.push_appends or self.sheet_deletes
+                    or self.pull_updates or self.pull_creates or self.db_deletes)
+
+    def counts(self):
+        return {
+            "planilha_atualizadas": len(self.push_updates),
+            "planilha_incluidas": len(self.push_appends),
+            "planilha_excluidas": len(self.sheet_deletes),
+            "banco_atualizadas": len(self.pull_updates),
+            "banco_incluidas": len(self.pull_creates),
+            "banco_excluidas": len(self.db_deletes),
+        }
+
+
+def db_months(months=None):
+    """Transações do banco agrupadas pela aba onde devem estar: {(ano, mês): {id: t}}"""
+    queryset = (Transaction.objects
+                .filter(date__isnull=False)
+                .annotate(sheet_year=Coalesce('billing_year', ExtractYear('date')),
+                          sheet_month=Coalesce('billing_month', ExtractMonth('date'))))
+    if months is not None:
+        ordinals = {year * 12 + month for year, month in months}
+        queryset = (queryset
+                    .annotate(sheet_period=Coalesce('billing_year', ExtractYear('date'))
+                              * Value(12)
+                              + Coalesce('billing_month', ExtractMonth('date')))
+                    .filter(sheet_period__in=ordinals))
+
+    by_month = defaultdict(dict)
+    for transaction in queryset.iterator(chunk_size=2000):
+        period = (transaction.sheet_year, transaction.sheet_month)
+        by_month[period][str(transaction.id)] = transaction
+    return by_month
+
+
+def diff_month(year, month, sheet_rows, db_rows, known_ids, base, policy, pending_ids):
+    """
+    Compara uma aba com as transações do banco para o mesmo mês e decide, conforme
+    a política, quem corrige quem. Linhas de transações com operação pendente na
+    fila são ignoradas (o worker ainda vai gravá-las).
+    """
+    diff = MonthDiff(year, month)
+    seen = {}
+
+    for row_number, values in enumerate(sheet_rows[1:], start=2):
+        canonical = canonical_row(values)
+        if not any(canonical):
+            continue
+        transaction_id = canonical[0]
+        if transaction_id in pending_ids:
+            continue
+        diff.row_ids[row_number] = transaction_id
+
+        if transaction_id not in known_ids:
+            # Linha sem ID ou com ID que o banco não conhece
+            if policy == "db" or (policy == "merge" and transaction_id in base):
+                diff.sheet_deletes.append(row_number)
+            else:
+                fields = row_fields(canonical)
+                if fields is None:
+                    logger.warning("Linha %d da aba %02d-%d ignorada: dados inválidos",
+                                   row_number, month, year)
+                else:
+                    diff.pull_creates.append((row_number, fields))
+        elif transaction_id in seen or transaction_id not in db_rows:
+            # Linha repetida ou de uma transação que pertence a outra aba
+            diff.sheet_deletes.append(row_number)
+        else:
+            seen[transaction_id] = (row_number, canonical)
+
+    for transaction_id, transaction in db_rows.items():
+        if transaction_id in pending_ids:
+            continue
+        db_fingerprint = row_fingerprint(
+            canonical_row(GoogleSheetsService.build_row(transaction)))
+
+        if transaction_id not in seen:
+            if policy == "sheets" or (policy == "merge" and transaction_id in base):
+                diff.db_deletes.append(transaction)
+            else:
+                diff.push_appends.append(transaction)
+            continue
+
+        row_number, canonical = seen[transaction_id]
+        if row_fingerprint(canonical) == db_fingerprint:
+            continue
+
+        pull = policy == "sheets" or (policy == "merge"
+                                      and base.get(transaction_id) == db_fingerprint)
+        fields = row_fields(canonical) if pull else None
+        if fields is not None:
+            diff.pull_updates.append((transaction, fields))
+        else:
+            diff.push_updates.append((row_number, transaction))
+
+    return diff
+
+
+def check_rows(sheets_service, worksheet, diff):
+    """
+    Relê a coluna A e confere se as linhas que serão alteradas ou excluídas ainda têm
+    o ID lido na comparação. O worker da fila pode ter excluído linhas desde então,
+    deslocando as de baixo: nesse caso levanta SheetChanged em vez de escrever na
+    linha errada (o mês é conciliado de novo na próxima execução).
+    """
+    ids = worksheet.col_values(1)
+    sheets_service.row_index.load(worksheet.title, ids)
+    rows = ([row for row, _ in diff.push_updates] + diff.sheet_deletes
+            + [row for row, _ in diff.pull_creates])
+    for row in rows:
+        current = canonical_row(ids[row - 1:row])[0]
+        if current != diff.row_ids[row]:
+            raise SheetChanged(f"A linha {row} da aba {worksheet.title} mudou desde a "
+                               f"leitura")
+
+
+def apply_diff(sheets_service, diff, sheet_exists):
+    """
+    Aplica as correções de uma aba: primeiro no banco (em lote, ajustando resumo e
+    faturas), depois na planilha com no máximo quatro chamadas (conferência das
+    linhas, atualizações, exclusões e inclusões). Tudo dentro de uma transação, para
+    que uma falha na planilha desfaça o que foi gravado no banco.
+    """
+    year, month = diff.year, diff.month
+    period = (year, month)
+    moved = []
+
+    with db_transaction.atomic():
+        if diff.pull_updates:
+            old = [copy.copy(t) for t, _ in diff.pull_updates]
+            changed = []
+            for transaction, fields in diff.pull_updates:
+                for name, value in fields.items():
+                    setattr(transaction, name, value)
+                # A data pode ter mudado: refaz o mês de fatura pelo cartão, como nas telas
+                transaction_service.assign_billing(transaction)
+                changed.append(transaction)
+            Transaction.objects.bulk_update(changed, ["value", "transaction_type", "description",
+                                                      "payment_method", "category", "date",
+                                                      "billing_month", "billing_year"])
+            # bulk_update não dispara signals: ajusta os agregados aqui
+            summary_service.add_transactions(old, sign=-1)
+            invoice_service.add_transactions(old, sign=-1)
+            summary_service.add_transactions(changed)
+            invoice_service.add_transactions(changed)
+            moved.extend(t for t in changed if t.get_sheet_period() != period)
+
+        created = []
+        if diff.pull_creates:
+            created = Transaction.objects.bulk_create(
+                [Transaction(**fields) for _, fields in diff.pull_creates])
+            summary_service.add_transactions(created)
+            moved.extend(t for t in created if t.get_sheet_period() != period)
+
+        if diff.db_deletes:
+            # delete() dispara os signals, que já ajustam resumo e faturas
+            Transaction.objects.filter(id__in=[t.id for t in diff.db_deletes]).delete()
+
+        # A data mudou de mês: a fila leva a linha para a aba certa
+        SheetsOutbox.objects.bulk_create([
+            SheetsOutbox(operation='update', transaction_id=t.id, old_year=year,
+                         old_month=month, year=t.get_sheet_period()[0],
+                         month=t.get_sheet_period()[1])
+            for t in moved
+        ])
+
+        worksheet = sheets_service.get_or_create_sheet(year, month)
+        if sheet_exists:
+            check_rows(sheets_service, worksheet, diff)
+        else:
+            sheets_service.row_index.load(worksheet.title, [])
+
+        updates = [{"range": f"A{row}:H{row}", "values": [sheets_service.build_row(t)]}
+                   for row, t in diff.push_updates]
+        # Linhas criadas no banco a partir da planilha recebem o ID novo na coluna A
+        updates.extend({"range": f"A{row}", "values": [[t.id]]}
+                       for (row, _), t in zip(diff.pull_creates, created))
+        appends = [] if sheets_service.row_index.last_row(worksheet.title) else [HEADER]
+        appends.extend(sheets_service.build_row(t) for t in diff.push_appends)
+        if appends == [HEADER]:
+            appends = []
+
+        sheets_service.write_changes(worksheet, updates, diff.sheet_deletes, appends)
+        sheets_service.cache.invalidate(year, month)
+
+
+def save_state(year, month, db_rows, pending_ids):
+    """Grava o estado conciliado da aba (base para a política merge)"""
+    rows = {
+        transaction_id: row_fingerprint(canonical_row(GoogleSheetsService.build_row(t)))
+        for transaction_id, t in db_rows.items() if transaction_id not in pending_ids
+    }
+    SheetMonthState.objects.update_or_create(
+        year=year, month=month,
+        defaults={"fingerprint": month_fingerprint(rows.values()), "rows": rows},
+    )
+
+
+def reconcile(sheets_service, policy=None, months=None, dry_run=False):
+    """
+    Concilia as abas mensais com o banco. Lê todas as abas em lote (uma chamada a
+    cada 50 abas), compara a impressão digital de cada uma com a do banco e só
+    calcula e aplica diferenças nos meses em que elas não batem.
+
+    Retorna {(ano, mês): contagens} dos meses com diferenças.
+    """
+    policy = policy or getattr(settings, "SHEETS_RECONCILE_POLICY", "db")
+    if policy not in POLICIES:
+        raise ValueError(f"Política inválida: {policy} (use {', '.join(POLICIES)})")
+
+    titles = {}
+    for title in sheets_service.registry.refresh():
+        match = SHEET_TITLE.match(title)
+        if match:
+            titles[(int(match.group(2)), int(match.group(1)))] = title
+
+    by_month = db_months(months)
+    periods = set(titles) | set(by_month)
+    if months is not None:
+        periods &= set(months)
+
+    contents = sheets_service.read_worksheets([titles[p] for p in sorted(periods) if p in titles])
+    known_ids = set(str(i) for i in Transaction.objects.values_list('id', flat=True))
+    pending_ids = set(str(i) for i in SheetsOutbox.objects.filter(status__in=UNSENT_STATUS)
+                      .values_list('transaction_id', flat=True))
+    states = {(s.year, s.month): s for s in SheetMonthState.objects.all()}
+
+    results = {}
+    for year, month in sorted(periods):
+        db_rows = by_month.get((year, month), {})
+        sheet_rows = contents.get(titles.get((year, month)), [])
+
+        sheet_prints = [row_fingerprint(canonical)
+                        for canonical in map(canonical_row, sheet_rows[1:])
+                        if any(canonical) and canonical[0] not in pending_ids]
+        db_prints = [row_fingerprint(canonical_row(GoogleSheetsService.build_row(t)))
+                     for transaction_id, t in db_rows.items()
+                     if transaction_id not in pending_ids]
+        if month_fingerprint(sheet_prints) == month_fingerprint(db_prints):
+            state = states.get((year, month))
+            if not dry_run and (state is None
+                                or state.fingerprint != month_fingerprint(db_prints)):
+                save_state(year, month, db_rows, pending_ids)
+            continue
+
+        state = states.get((year, month))
+        diff = diff_month(year, month, sheet_rows, db_rows, known_ids,
+                          state.rows if state else {}, policy, pending_ids)
+        if diff.empty:
+            continue
+        results[(year, month)] = diff.counts()
+        if dry_run:
+            continue
+
+        try:
+            apply_diff(sheets_service, diff, (year, month) in titles)
+        except Exception as e:
+            logger.exception("Erro ao conciliar aba %02d-%d", month, year)
+            sheets_service.forget_sheet(sheets_service.get_sheet_name(year, month))
+            results[(year, month)]["erro"] = str(e)
+            continue
+        save_state(year, month, db_months([(year, month)]).get((year, month), {}), pending_ids)
+
+    return results
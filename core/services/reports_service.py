@@ -0,0 +1,124 @@
+import numpy as np
+from django.db.models import F, IntegerField, Value
+from django.db.models.functions import Cast, Coalesce, ExtractMonth, ExtractYear, Round
+
+from core.models import Transaction
+
+CATEGORY_LABELS = dict(Transaction.CATEGORY_CHOICES)
+
+
+def month_ordinal(year, month):
+    """Converte (ano, mês) em um inteiro sequencial: ano * 12 + (mês - 1)"""
+    return year * 12 + month - 1
+
+
+def load_arrays(start=None, end=None):
+    """
+    Carrega as colunas usadas nos relatórios em arrays NumPy:
+    centavos (int64), mês ordinal (int32), gasto? (bool) e código da categoria.
+    O banco já devolve centavos e o mês ordinal calculados; `start` e `end` são
+    meses ordinais (inclusivos) para limitar o período.
+    """
+    period = (Coalesce('billing_year', ExtractYear('date')) * Value(12)
+              + Coalesce('billing_month', ExtractMonth('date')) - Value(1))
+    queryset = (Transaction.objects
+                .filter(date__isnull=False)
+                .annotate(period=period,
+                          cents=Cast(Round(F('value') * 100), IntegerField()))
+                .order_by())
+    if start is not None:
+        queryset = queryset.filter(period__gte=start)
+    if end is not None:
+        queryset = queryset.filter(period__lte=end)
+
+    rows = list(queryset.values_list('cents', 'period', 'transaction_type', 'category'))
+    count = len(rows)
+
+    cents = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+    periods = np.fromiter((row[1] for row in rows), dtype=np.int32, count=count)
+    types = np.array([row[2] for row in rows], dtype=object)
+    categories = np.array([row[3] or '' for row in rows], dtype=object)
+
+    category_names, category_codes = np.unique(categories, return_inverse=True)
+    return {
+        "cents": cents,
+        "periods": periods,
+        "is_expense": types == 'gasto',
+        "category_codes": category_codes.astype(np.int16),
+        "category_names": list(category_names),
+    }
+
+
+def rolling_mean(series, window):
+    """Média móvel (janela `window`) via soma acumulada; os primeiros meses usam o que há"""
+    sums = np.cumsum(series, dtype=np.float64)
+    sums[window:] = sums[window:] - sums[:-window]
+    sizes = np.minimum(np.arange(1, len(series) + 1), window)
+    return sums / sizes
+
+
+def pivot(codes, index, weights, rows, columns):
+    """Soma `weights` na matriz rows x columns indexada por (codes, index) de uma vez"""
+    flat = np.bincount(codes.astype(np.int64) * columns + index, weights=weights,
+                       minlength=rows * columns)
+    return flat.reshape(rows, columns)
+
+
+def build_report(start=None, end=None, window=3):
+    """
+    Séries mensais de receitas/gastos/saldo (com acumulado e média móvel) e as
+    tabelas categoria x mês e categoria x ano, calculadas com operações vetorizadas
+    """
+    data = load_arrays(start, end)
+    periods = data["periods"]
+    if not len(periods):
+        return {"meses": [], "anos": [], "categorias": [], "serie": {}, "por_categoria": {}}
+
+    first = int(periods.min()) if start is None else start
+    last = int(periods.max()) if end is None else end
+    n_months = last - first + 1
+    month_index = periods - first
+
+    cents = data["cents"].astype(np.float64)
+    expenses = np.where(data["is_expense"], cents, 0.0)
+    incomes = np.where(data["is_expense"], 0.0, cents)
+
+    income_series = np.bincount(month_index, weights=incomes, minlength=n_months)
+    expense_series = np.bincount(month_index, weights=expenses, minlength=n_months)
+    balance = income_series - expense_series
+
+    first_year = first // 12
+    n_years = last // 12 - first_year + 1
+    year_index = periods // 12 - first_year
+
+    codes = data["category_codes"]
+    n_categories = len(data["category_names"])
+    expense_by_month = pivot(codes, month_index, expenses, n_categories, n_months)
+    expense_by_year = pivot(codes, year_index, expenses, n_categories, n_years)
+    income_by_year = pivot(codes, year_index, incomes, n_categories, n_years)
+
+    def reais(values):
+        return np.round(np.asarray(values) / 100, 2).tolist()
+
+    return {
+        "meses": [f"{p // 12}-{p % 12 + 1:02d}" for p in range(first, last + 1)],
+        "anos": list(range(first_year, first_year + n_years)),
+        "categorias": [CATEGORY_LABELS.get(name, name or "Sem categoria")
+                       for name in data["category_names"]],
+        "serie": {
+            "receitas": reais(income_series),
+            "gastos": reais(expense_series),
+            "saldo": reais(balance),
+            "saldo_acumulado": reais(np.cumsum(balance)),
+            "media_movel_gastos": reais(rolling_mean(expense_series, window)),
+            "media_movel_receitas": reais(rolling_mean(income_series, window)),
+        },
+        "por_categoria": {
+            "gastos_por_mes": reais(expense_by_month),
+            "gastos_por_ano": reais(expense_by_year),
+            "receitas_por_ano": reais(income_by_year),
+            "media_mensal_gastos": reais(expense_by_month.mean(axis=1)),
+            "total_gastos": reais(expense_by_month.sum(axis=1)),
+            "total_receitas": reais(income_by_year.sum(axis=1)),
+        },
+    }
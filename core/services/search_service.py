@@ -0,0 +1,124 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+# Tabela FTS5 criada pela migração 0017 (só no SQLite)
+SEARCH_TABLE = "core_transaction_search"
+
+# Palavras da busca: letras e números, sem a sintaxe do FTS5 (aspas, *, NOT, ...)
+TERM = re.compile(r"\w+")
+
+# Gatilhos que mantêm o índice em dia (os mesmos da migração 0017). O SQLite refaz a
+# tabela core_transaction em AlterField/RemoveField e os gatilhos somem junto:
+# restore_triggers os recria depois de cada migrate (signals.restore_search_index)
+TRIGGERS = {
+    "core_transaction_search_insert": f"""
+        CREATE TRIGGER core_transaction_search_insert AFTER INSERT ON core_transaction
+        BEGIN
+            INSERT INTO {SEARCH_TABLE}(rowid, description) VALUES (new.id, new.description);
+        END
+    """,
+    "core_transaction_search_delete": f"""
+        CREATE TRIGGER core_transaction_search_delete AFTER DELETE ON core_transaction
+        BEGIN
+            INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, description)
+            VALUES ('delete', old.id, old.description);
+        END
+    """,
+    "core_transaction_search_update": f"""
+        CREATE TRIGGER core_transaction_search_update AFTER UPDATE OF description
+        ON core_transaction BEGIN
+            INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, description)
+            VALUES ('delete', old.id, old.description);
+            INSERT INTO {SEARCH_TABLE}(rowid, description) VALUES (new.id, new.description);
+        END
+    """,
+}
+
+MATCH_SQL = f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s"
+
+# IDs encontrados, do mais para o menos relevante (rank é o bm25: menor é melhor)
+RANKED_SQL = (f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s{{restrict}} "
+              f"ORDER BY rank, rowid DESC LIMIT %s")
+
+
+def available():
+    """Se o banco tem o índice de texto das descrições"""
+    return connection.vendor == "sqlite" and getattr(settings, "SEARCH_FTS_ENABLED", True)
+
+
+def match_expression(busca):
+    """
+    Converte o texto digitado numa consulta FTS5: cada palavra vira um prefixo entre
+    aspas ("merc"* encontra "Mercado") e todas precisam aparecer. None se não sobra
+    nenhuma palavra.
+    """
+    terms = TERM.findall(busca or "")
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def matching(queryset, busca):
+    """
+    Filtra as transações cuja descrição contém as palavras da busca, pelo índice
+    FTS5 (sem acentos e sem diferenciar maiúsculas). Sem o índice, usa icontains.
+    """
+    expression = match_expression(busca) if available() else None
+    if expression is None:
+        return queryset.filter(description__icontains=busca) if busca else queryset
+    return queryset.filter(id__in=RawSQL(MATCH_SQL, [expression]))
+
+
+def ranked_ids(queryset, busca, limit=None):
+    """
+    IDs das transações de `queryset` cuja descrição contém as palavras da busca, da
+    mais para a menos relevante (até `limit`). A ordenação sai direto do índice, numa
+    consulta só; sem o índice, as mais recentes primeiro.
+    """
+    limit = limit or getattr(settings, "SEARCH_MAX_RESULTS", 500)
+    expression = match_expression(busca) if available() else None
+    if expression is None:
+        queryset = matching(queryset, busca).order_by("-date", "-id")
+        return list(queryset.values_list("id", flat=True)[:limit])
+
+    # Os demais filtros entram como subconsulta; sem filtros, só o índice é lido. O
+    # "+" impede o FTS5 de usar o IN como busca por rowid (uma consulta por ID)
+    restrict, params = "", []
+    if queryset.query.where:
+        subquery, params = queryset.values("id").query.sql_with_params()
+        restrict = f" AND +rowid IN ({subquery})"
+    with connection.cursor() as cursor:
+        cursor.execute(RANKED_SQL.format(restrict=restrict), [expression, *params, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def missing_triggers(using=connection):
+    """Gatilhos do índice que não existem no banco (vazio se o índice não existe)"""
+    if using.vendor != "sqlite":
+        return []
+    names = [SEARCH_TABLE, *TRIGGERS]
+    with using.cursor() as cursor:
+        cursor.execute(f"SELECT name FROM sqlite_master WHERE name IN "
+                       f"({', '.join(['%s'] * len(names))})", names)
+        existing = {row[0] for row in cursor.fetchall()}
+    if SEARCH_TABLE not in existing:
+        return []
+    return [name for name in TRIGGERS if name not in existing]
+
+
+def restore_triggers(using=connection):
+    """
+    Recria os gatilhos que sumiram (tabela refeita por uma migração) e reindexa as
+    descrições, já que as escritas sem gatilho não chegaram ao índice. Retorna os
+    nomes recriados.
+    """
+    missing = missing_triggers(using)
+    if missing:
+        with using.cursor() as cursor:
+            for name in missing:
+                cursor.execute(TRIGGERS[name])
+            cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+    return missing
@@ -0,0 +1,229 @@
+import functools
+import random
+import threading
+import time
+from concurrent.futures import Future
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from gspread.exceptions import APIError
+from gspread.http_client import HTTPClient
+
+from core.services import metrics
+
+# Códigos que valem uma nova tentativa: limite de uso, timeout e erros do servidor
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+# 429 é recusado antes de executar: dá para repetir qualquer chamada
+REJECTED_STATUS = {429}
+
+# Escritas POST que podem ser repetidas sem efeito a mais: gravam ou limpam faixas
+# explícitas. values:append e o batchUpdate da planilha (excluir linha pelo número,
+# criar aba) não entram: repetir um que chegou a ser aplicado duplica o efeito
+IDEMPOTENT_POST_SUFFIXES = ("values:batchUpdate", "values:batchClear", ":clear")
+
+
+class TokenBucket:
+    """
+    Balde de fichas: guarda até `capacity` fichas e repõe `rate` fichas por segundo.
+    Cada chamada à API consome uma; sem ficha, espera a próxima ser reposta.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Consome uma ficha, esperando se preciso. Retorna quantos segundos esperou"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity,
+                                   self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class SingleFlight:
+    """
+    Junta chamadas idênticas em andamento: a primeira executa e as que chegam
+    enquanto ela não termina recebem o mesmo resultado (ou a mesma exceção)
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """Retorna (resultado, compartilhado?)"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            future.set_result(func())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+        return future.result(), False
+
+
+class QuotaStats:
+    """Contadores do cliente: chamadas, esperas por cota, novas tentativas e leituras juntadas"""
+
+    FIELDS = ("reads", "writes", "throttled", "throttle_seconds", "retries", "coalesced",
+              "errors")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def add(self, name, amount=1):
+        with self._lock:
+            self._values[name] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        with self._lock:
+            self._values = dict.fromkeys(self.FIELDS, 0)
+
+
+stats = QuotaStats()
+
+# As cotas do Google valem por projeto/usuário, não por instância: baldes do processo todo
+_buckets = {}
+_buckets_lock = threading.Lock()
+_single_flight = SingleFlight()
+
+
+def get_bucket(kind):
+    """Balde de leituras ("read") ou de escritas ("write"), criado conforme os settings"""
+    with _buckets_lock:
+        if kind not in _buckets:
+            per_minute = getattr(settings, f"SHEETS_{kind.upper()}S_PER_MINUTE", 60)
+            _buckets[kind] = TokenBucket(rate=per_minute / 60, capacity=per_minute)
+        return _buckets[kind]
+
+
+def is_idempotent(method, endpoint):
+    """Se repetir a chamada depois de um timeout ou 5xx não muda o resultado"""
+    method = method.upper()
+    if method in ("GET", "PUT"):
+        return True
+    return method == "POST" and endpoint.endswith(IDEMPOTENT_POST_SUFFIXES)
+
+
+def api_operation(method, endpoint):
+    """
+    Operação da API para as métricas, sem a chave da planilha nem a faixa: "GET values",
+    "POST values:append", "POST batchUpdate", "GET spreadsheets", "GET files" (Drive)
+    """
+    path = urlsplit(endpoint).path
+    if "/values" in path:
+        # A faixa vem codificada (":" vira %3A): o ":" que sobra é o da ação
+        action = path.partition("/values")[2].rpartition(":")[2] if ":" in path else ""
+        name = f"values:{action}" if action else "values"
+    else:
+        last = path.rstrip("/").rpartition("/")[2]
+        if ":" in last:
+            name = last.rpartition(":")[2]
+        else:
+            name = "spreadsheets" if "/spreadsheets/" in path else last
+    return f"{method.upper()} {name}"
+
+
+def backoff_delay(attempt):
+    """Espera exponencial com jitter ("full jitter"), limitada a SHEETS_BACKOFF_MAX"""
+    base = getattr(settings, "SHEETS_BACKOFF_BASE", 1.0)
+    limit = getattr(settings, "SHEETS_BACKOFF_MAX", 32.0)
+    return random.uniform(0, min(limit, base * 2 ** attempt))
+
+
+class QuotaHTTPClient(HTTPClient):
+    """
+    Cliente HTTP do gspread que respeita as cotas do Google Sheets: separa leituras
+    (GET) e escritas em baldes de fichas próprios, repete com backoff exponencial e
+    jitter as chamadas recusadas com 429 e as idempotentes que falham com 5xx ou
+    erro de rede, e junta leituras idênticas que estão em andamento ao mesmo tempo
+    numa só chamada.
+    """
+
+    def request(self, method, endpoint, params=None, data=None, json=None, files=None,
+                headers=None):
+        call = functools.partial(self._request_with_retry, method, endpoint, params=params,
+                                 data=data, json=json, files=files, headers=headers)
+        if method.upper() != "GET":
+            return call()
+
+        response, shared = _single_flight.do(self._read_key(endpoint, params), call)
+        if shared:
+            stats.add("coalesced")
+        return response
+
+    @staticmethod
+    def _read_key(endpoint, params):
+        """Chave de uma leitura: URL e parâmetros (em qualquer ordem)"""
+        if params is None:
+            return endpoint
+        items = params.items() if hasattr(params, "items") else params
+        return endpoint, tuple(sorted((str(k), str(v)) for k, v in items))
+
+    def _request_with_retry(self, method, endpoint, **kwargs):
+        kind = "read" if method.upper() == "GET" else "write"
+        operation = api_operation(method, endpoint)
+        max_retries = getattr(settings, "SHEETS_MAX_RETRIES", 5)
+
+        attempt = 0
+        while True:
+            waited = get_bucket(kind).acquire()
+            if waited:
+                stats.add("throttled")
+                stats.add("throttle_seconds", waited)
+            stats.add(f"{kind}s")
+
+            # Timeout ou 5xx não dizem se a escrita foi aplicada: só repete as idempotentes.
+            # Uma inclusão que falhou volta pela fila, que relê os IDs da aba e atualiza
+            # a linha se ela chegou a ser gravada
+            try:
+                # Cada tentativa conta como uma ida à API (exportado em /metrics)
+                with metrics.sheets_call(operation):
+                    return super().request(method, endpoint, **kwargs)
+            except APIError as e:
+                retry = e.code in REJECTED_STATUS or (
+                    e.code in RETRY_STATUS and is_idempotent(method, endpoint))
+                error = e
+            except requests.ConnectTimeout as e:
+                # A conexão nem foi aberta: nada chegou ao servidor
+                retry = True
+                error = e
+            except (requests.ConnectionError, requests.Timeout) as e:
+                retry = is_idempotent(method, endpoint)
+                error = e
+
+            if not retry or attempt >= max_retries:
+                stats.add("errors")
+                raise error
+
+            stats.add("retries")
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
@@ -0,0 +1,35 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Pool de threads limitado para as chamadas bloqueantes ao Google Sheets. O tamanho
+    limita quantas chamadas à API ficam em andamento ao mesmo tempo no processo.
+    """
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "SHEETS_THREAD_POOL_SIZE", 8),
+                thread_name_prefix="sheets",
+            )
+        return _executor
+
+
+async def run(func, *args, **kwargs):
+    """Executa uma chamada bloqueante (gspread) no pool, sem travar o event loop"""
+    loop = asyncio.get_running_loop()
+    # Leva o contexto junto (ex.: métricas da requisição), como o sync_to_async faz
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(),
+                                      functools.partial(context.run, func, *args, **kwargs))
+
@@ -1,198 +1,560 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
 import gspread
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from gspread.utils import ValueRenderOption
 from google.oauth2.service_account import Credentials
 
+from core.services import metrics, version_service
+from core.services.month_table import MonthTable
+from core.services.sheets_client import QuotaHTTPClient
+
+logger = logging.getLogger(__name__)
+
+HEADER = [
+    "ID", "Valor", "Tipo", "Descrição",
+    "Método Pagamento", "Categoria", "Data", "Data Registro"
+]
+
+
+class MonthCache:
+    """
+    Cache em memória das transações de cada mês (ano, mês), como MonthTable, com
+    expiração por tempo (TTL) e limite de meses guardados (o menos usado
+    recentemente sai primeiro).
+
+    Com `versions` (o version_service), cada entrada guarda a versão do mês no banco
+    lida antes da leitura da aba e só vale enquanto ela não mudar. A versão aumenta na
+    mesma transação que enfileira a alteração (signals) e de novo em invalidate, depois
+    que a aba é gravada: os caches de todos os processos deixam de valer, inclusive o
+    que foi preenchido por uma leitura feita antes da gravação.
+    """
+
+    def __init__(self, ttl=300, max_entries=24, versions=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.versions = versions
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, year, month, version=None):
+        """
+        (transações do mês ou None se não estiverem em cache, versão atual do mês). A
+        versão pode vir já lida do banco (as views leem antes de ir ao pool de threads) e
+        deve ser passada ao set da leitura feita a seguir
+        """
+        key = (year, month)
+        if version is None and self.versions:
+            version = self.versions.current(year, month)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] < time.monotonic() or entry[2] != version):
+                del self._entries[key]
+                entry = None
+
+            metrics.cache_result("sheets_month", entry is not None)
+            if entry is None:
+                return None, version
+
+            self._entries.move_to_end(key)
+            # A tabela é imutável: pode ser devolvida sem cópia
+            return entry[1], version
+
+    def get(self, year, month):
+        """Retorna as transações do mês ou None se não estiverem em cache"""
+        return self.lookup(year, month)[0]
+
+    def set(self, year, month, transactions, version=None):
+        key = (year, month)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, transactions, version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, year, month):
+        """Descarta o mês depois de gravar na aba, neste e nos outros processos"""
+        with self._lock:
+            self._entries.pop((year, month), None)
+        if self.versions:
+            self.versions.bump(year, month)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RowIndex:
+    """
+    Índice ID da transação -> número da linha, por aba. É carregado da coluna A (ou
+    de uma leitura completa do mês) e ajustado a cada inclusão ou exclusão de linha.
+    """
 
-class GoogleSheetsService:
     def __init__(self):
-        scopes = [
-            "https://www.googleapis.com/auth/spreadsheets",
-            "https://www.googleapis.com/auth/drive"
-        ]
-        creds = Credentials.from_service_account_file("credentials.json", scopes=scopes)
-        self.client = gspread.authorize(creds)
+        self._sheets = {}
+        self._lock = threading.Lock()
+
+    def load(self, sheet_name, ids):
+        """Carrega o índice a partir dos valores da coluna A (incluindo o cabeçalho)"""
+        with self._lock:
+            self._sheets[sheet_name] = {
+                "rows": {str(value): row for row, value in enumerate(ids, start=1)
+                         if row > 1 and value != ""},
+                "last_row": len(ids),
+            }
+
+    def is_loaded(self, sheet_name):
+        return sheet_name in self._sheets
+
+    def get(self, sheet_name, transaction_id):
+        with self._lock:
+            sheet = self._sheets.get(sheet_name)
+            return sheet["rows"].get(str(transaction_id)) if sheet else None
+
+    def last_row(self, sheet_name):
+        with self._lock:
+            return self._sheets[sheet_name]["last_row"]
+
+    def appended(self, sheet_name, ids):
+        """Registra linhas adicionadas ao fim da aba, na ordem de `ids` ("" para o cabeçalho)"""
+        with self._lock:
+            sheet = self._sheets.get(sheet_name)
+            if sheet is None:
+                return
+            for transaction_id in ids:
+                sheet["last_row"] += 1
+                if transaction_id != "":
+                    sheet["rows"][str(transaction_id)] = sheet["last_row"]
+
+    def removed(self, sheet_name, row):
+        """Registra a exclusão de uma linha, deslocando as de baixo"""
+        with self._lock:
+            sheet = self._sheets.get(sheet_name)
+            if sheet is None:
+                return
+            sheet["rows"] = {
+                transaction_id: (r - 1 if r > row else r)
+                for transaction_id, r in sheet["rows"].items() if r != row
+            }
+            sheet["last_row"] -= 1
+
+    def forget(self, sheet_name):
+        with self._lock:
+            self._sheets.pop(sheet_name, None)
+
+
+class SpreadsheetRegistry:
+    """
+    Mantém aberta a planilha "Financeiro" e o mapa título -> aba, carregado de uma
+    única leitura de metadados. Evita abrir a planilha e buscar a aba a cada chamada.
+    """
+
+    def __init__(self, client, title="Financeiro", key=None):
+        self.client = client
+        self.title = title
+        self.key = key
+        self._spreadsheet = None
+        self._worksheets = None
+        self._lock = threading.RLock()
+
+    @property
+    def spreadsheet(self):
+        """Abre a planilha uma vez (pela chave, quando conhecida) e reaproveita"""
+        with self._lock:
+            if self._spreadsheet is None:
+                if self.key:
+                    self._spreadsheet = self.client.open_by_key(self.key)
+                else:
+                    self._spreadsheet = self.client.open(self.title)
+                    self.key = self._spreadsheet.id
+            return self._spreadsheet
+
+    def refresh(self):
+        """Recarrega o mapa de abas com uma leitura de metadados"""
+        with self._lock:
+            self._worksheets = {ws.title: ws for ws in self.spreadsheet.worksheets()}
+            return self._worksheets
+
+    def get(self, title):
+        """Retorna a aba pelo título, recarregando o mapa uma vez se ela não estiver nele"""
+        with self._lock:
+            worksheets = self._worksheets if self._worksheets is not None else self.refresh()
+            worksheet = worksheets.get(title)
+            if worksheet is None:
+                worksheet = self.refresh().get(title)
+            if worksheet is None:
+                raise gspread.WorksheetNotFound(title)
+            return worksheet
+
+    def existing(self, titles):
+        """Dos títulos pedidos, os que existem como aba (recarrega o mapa se faltar algum)"""
+        with self._lock:
+            worksheets = self._worksheets if self._worksheets is not None else self.refresh()
+            if any(title not in worksheets for title in titles):
+                worksheets = self.refresh()
+            return [title for title in titles if title in worksheets]
+
+    def get_or_create(self, title, rows=100, cols=10):
+        """Retorna a aba pelo título ou cria sem precisar de uma nova busca"""
+        with self._lock:
+            worksheets = self._worksheets if self._worksheets is not None else self.refresh()
+            worksheet = worksheets.get(title)
+            if worksheet is not None:
+                return worksheet
+
+            try:
+                worksheet = self.spreadsheet.add_worksheet(title=title, rows=rows, cols=cols)
+            except gspread.exceptions.APIError:
+                # Outro processo pode ter criado a aba depois da nossa leitura do mapa
+                return self.get(title)
+            self._worksheets[title] = worksheet
+            return worksheet
+
+    def forget(self, title):
+        """Descarta a aba do mapa (ex.: foi apagada ou renomeada na planilha)"""
+        with self._lock:
+            if self._worksheets is not None:
+                self._worksheets.pop(title, None)
+
+
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive"
+]
+
+
+def google_client():
+    """Cliente do gspread autenticado com a conta de serviço de credentials.json"""
+    creds = Credentials.from_service_account_file("credentials.json", scopes=SCOPES)
+    # Cliente HTTP com cotas, backoff e leituras em andamento compartilhadas
+    return gspread.authorize(creds, http_client=QuotaHTTPClient)
+
+
+def local_client():
+    """Planilha local em memória, sem rede (latência artificial em SHEETS_LOCAL_LATENCY)"""
+    from core.services.local_sheets import LocalClient
+    return LocalClient(latency=getattr(settings, "SHEETS_LOCAL_LATENCY", 0.0))
+
+
+# Backends de armazenamento: funções que devolvem um cliente com a interface do gspread
+BACKENDS = {
+    "google": google_client,
+    "local": local_client,
+}
+
+
+def build_client():
+    """
+    Cria o cliente do backend em SHEETS_BACKEND: um nome de BACKENDS ou o caminho
+    pontilhado de uma função que devolva um cliente compatível com o gspread
+    """
+    backend = getattr(settings, "SHEETS_BACKEND", "google")
+    if backend in BACKENDS:
+        return BACKENDS[backend]()
+    if "." in backend:
+        return import_string(backend)()
+    raise ImproperlyConfigured(f"SHEETS_BACKEND inválido: {backend}")
+
+
+class GoogleSheetsService:
+    """
+    Acesso às abas mensais da planilha "Financeiro". Criar o serviço não abre
+    conexão: o cliente (e a autenticação) só é criado na primeira chamada à planilha.
+    """
+
+    def __init__(self, client=None):
+        self._client = client
+        self._registry = None
+        self._lock = threading.Lock()
+        self.cache = MonthCache(
+            ttl=getattr(settings, "SHEETS_CACHE_TTL", 300),
+            max_entries=getattr(settings, "SHEETS_CACHE_MAX_MONTHS", 24),
+            versions=version_service,
+        )
+        self.row_index = RowIndex()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = build_client()
+            return self._client
+
+    @property
+    def registry(self):
+        if self._registry is None:
+            client = self.client
+            with self._lock:
+                if self._registry is None:
+                    self._registry = SpreadsheetRegistry(
+                        client,
+                        key=getattr(settings, "SHEETS_SPREADSHEET_KEY", None),
+                    )
+        return self._registry
+
+    @staticmethod
+    def get_sheet_name(year, month):
+        return f"{month:02d}-{year}"
 
     def get_or_create_sheet(self, year, month):
         """Abre ou cria uma sheet para o mês"""
-        sheet_name = f"{month:02d}-{year}"
-        spreadsheet = self.client.open("Financeiro")
-
-        try:
-            return spreadsheet.worksheet(sheet_name)
-        except gspread.WorksheetNotFound:
-            return spreadsheet.add_worksheet(title=sheet_name, rows="100", cols="10")
+        return self.registry.get_or_create(self.get_sheet_name(year, month))
 
-    def save_transaction(self, transaction, year=None, month=None):
-        """Salva uma transação no mês correspondente"""
-        if year is None:
-            year = transaction.date.year
-        if month is None:
-            month = transaction.date.month
+    def forget_sheet(self, sheet_name):
+        """Descarta o que se sabe da aba (handle e índice de linhas) após um erro"""
+        self.registry.forget(sheet_name)
+        self.row_index.forget(sheet_name)
 
-        worksheet = self.get_or_create_sheet(year, month)
+    def load_row_index(self, worksheet):
+        """Relê só a coluna A da aba para reconstruir o índice de linhas"""
+        self.row_index.load(worksheet.title, worksheet.col_values(1))
 
-        # Cabeçalho (se estiver vazio)
-        if not worksheet.row_values(1):
-            worksheet.append_row([
-                "ID", "Valor", "Tipo", "Descrição",
-                "Método Pagamento", "Categoria", "Data", "Data Registro"
-            ])
+    def find_row(self, worksheet, transaction_id):
+        """
+        Retorna a linha da transação na aba (ou None). Usa o índice e confere só a
+        célula da coluna A; se o índice estiver desatualizado, relê a coluna A.
+        """
+        row = self.row_index.get(worksheet.title, transaction_id)
+        hit = bool(row) and worksheet.acell(f"A{row}").value == str(transaction_id)
+        metrics.cache_result("row_index", hit)
+        if hit:
+            return row
 
-        # Garante que o valor é float
-        valor_float = float(transaction.value) if not isinstance(transaction.value,
-                                                                 float) else transaction.value
+        self.load_row_index(worksheet)
+        return self.row_index.get(worksheet.title, transaction_id)
 
-        worksheet.append_row([
+    @staticmethod
+    def build_row(transaction):
+        """Monta a linha da planilha para uma transação"""
+        return [
             transaction.id,
-            valor_float,  # Já está como float
+            float(transaction.value),
             transaction.transaction_type,
             transaction.description,
             transaction.payment_method,
             transaction.category,
             str(transaction.date),
             str(transaction.date_added)
-        ])
+        ]
 
-    def update_transaction(self, transaction):
-        """Atualiza uma transação existente no Google Sheets"""
-        try:
-            # Determina em qual planilha a transação está
-            year = transaction.billing_year if transaction.billing_year else transaction.date.year
-            month = transaction.billing_month if transaction.billing_month else transaction.date.month
-
-            worksheet = self.get_or_create_sheet(year, month)
-            records = worksheet.get_all_records()
-
-            # Encontra a linha pelo ID
-            for i, record in enumerate(records, start=2):
-                if record.get("ID") == transaction.id:
-                    # Atualiza a linha
-                    worksheet.update(f"A{i}:H{i}", [[
-                        transaction.id,
-                        float(transaction.value),
-                        transaction.transaction_type,
-                        transaction.description,
-                        transaction.payment_method,
-                        transaction.category,
-                        str(transaction.date),
-                        str(transaction.date_added)
-                    ]])
-                    return True
-            return False
-        except Exception as e:
-            print(f"Erro ao atualizar transação: {e}")
-            return False
-
-    def delete_transaction(self, transaction_id, year, month):
-        """Exclui uma transação do Google Sheets"""
-        try:
-            worksheet = self.get_or_create_sheet(year, month)
-            records = worksheet.get_all_records()
-
-            # Encontra a linha pelo ID
-            for i, record in enumerate(records, start=2):  # start=2 porque a linha 1 é cabeçalho
-                if record.get("ID") == transaction_id:
-                    # Deleta a linha
-                    worksheet.delete_rows(i)
-                    return True
-            return False
-        except Exception as e:
-            print(f"Erro ao excluir transação: {e}")
-            return False
-
-    def get_transactions(self, year, month):
-        """Retorna todas transações de um mês"""
-        sheet_name = f"{month:02d}-{year}"
+    def sync_worksheet(self, year, month, upserts=(), delete_ids=()):
+        """
+        Aplica em lote as alterações de uma aba: atualiza ou adiciona as transações
+        de `upserts` e remove as linhas cujos IDs estão em `delete_ids` (ver
+        sync_worksheets)
+        """
+        self.sync_worksheets({(year, month): (upserts, delete_ids)})
+
+    def load_row_indexes(self, worksheets):
+        """Relê a coluna A de várias abas numa só chamada values_batch_get"""
+        worksheets = list(worksheets)
+        response = self.registry.spreadsheet.values_batch_get(
+            [f"'{worksheet.title}'!A:A" for worksheet in worksheets],
+            params={"valueRenderOption": ValueRenderOption.unformatted},
+        )
+        for worksheet, value_range in zip(worksheets, response.get("valueRanges", [])):
+            self.row_index.load(worksheet.title,
+                                [row[0] if row else "" for row in value_range.get("values", [])])
+
+    def sync_worksheets(self, changes):
+        """
+        Aplica as alterações de várias abas, {(ano, mês): (upserts, delete_ids)}: atualiza
+        ou adiciona as transações de upserts e remove as linhas dos IDs de delete_ids.
+
+        Lê a coluna de IDs de todas as abas numa chamada e grava tudo numa única
+        requisição batch_update da planilha, que é atômica: uma transação que muda de
+        aba sai da antiga e entra na nova juntas, ou nada acontece. Pode ser repetida
+        sem duplicar linhas (a nova leitura dos IDs mostra o que já foi gravado).
+        """
+        worksheets = {period: self.get_or_create_sheet(*period) for period in changes}
         try:
-            sheet = self.client.open("Financeiro").worksheet(sheet_name)
-            data = sheet.get_all_records()
+            self.load_row_indexes(worksheets.values())
+            index = self.row_index
+            requests = []
+            applied = []
+            for period, (upserts, delete_ids) in changes.items():
+                worksheet = worksheets[period]
+                title = worksheet.title
+                # Uma transação enviada para esta aba nunca é excluída dela
+                delete_ids = set(delete_ids) - {transaction.id for transaction in upserts}
+
+                appends = [] if index.last_row(title) else [HEADER]
+                for transaction in upserts:
+                    row = index.get(title, transaction.id)
+                    if row:
+                        # Atualiza antes de excluir, enquanto os números das linhas valem
+                        requests.append(self._update_cells(worksheet, row,
+                                                           self.build_row(transaction)))
+                    else:
+                        appends.append(self.build_row(transaction))
+                if appends == [HEADER]:
+                    appends = []
 
-            transactions = []
-            for row in data:
-                # Formata o valor corretamente
-                valor = row.get('Valor', 0)
-
-                # Se for string, converte para float primeiro
-                if isinstance(valor, str):
-                    # Remove possíveis formatações
-                    valor_limpo = valor.replace('R$', '').replace('.', '').replace(',',
-                                                                                   '.').strip()
-                    try:
-                        valor = float(valor_limpo)
-                    except ValueError:
-                        valor = 0.0
-
-                # Formata como moeda brasileira
-                valor_formatado = f"R$ {valor:,.2f}"
-                valor_formatado = valor_formatado.replace(',', 'X').replace('.', ',').replace('X',
-                                                                                              '.')
-
-                transactions.append({
-                    "id": row.get("ID"),
-                    "descricao": row.get("Descrição", ""),
-                    "valor": valor_formatado,
-                    "tipo": row.get("Tipo", ""),
-                    "categoria": row.get("Categoria", ""),
-                    "pagamento": row.get("Método Pagamento", ""),
-                    "data": row.get("Data", ""),
-                    "data_registro": row.get("Data Registro", ""),
-                })
+                # Exclusões de baixo para cima, para os números das linhas continuarem valendo
+                delete_rows = sorted({index.get(title, i) for i in delete_ids} - {None},
+                                     reverse=True)
+                requests.extend(self._delete_row(worksheet, row) for row in delete_rows)
+                if appends:
+                    requests.append({"appendCells": {
+                        "sheetId": worksheet.id,
+                        "rows": [{"values": [self._cell(value) for value in row]}
+                                 for row in appends],
+                        "fields": "userEnteredValue",
+                    }})
+                applied.append((period, title, delete_rows, appends))
+
+            if requests:
+                self.registry.spreadsheet.batch_update({"requests": requests})
+        except Exception:
+            for worksheet in worksheets.values():
+                self.forget_sheet(worksheet.title)
+            raise
+
+        for period, title, delete_rows, appends in applied:
+            for row in delete_rows:
+                index.removed(title, row)
+            index.appended(title, ["" if row is HEADER else row[0] for row in appends])
+            self.cache.invalidate(*period)
+
+    @classmethod
+    def _update_cells(cls, worksheet, row, values):
+        """Pedido updateCells que regrava a linha `row` (A:H) da aba"""
+        return {"updateCells": {
+            "start": {"sheetId": worksheet.id, "rowIndex": row - 1, "columnIndex": 0},
+            "rows": [{"values": [cls._cell(value) for value in values]}],
+            "fields": "userEnteredValue",
+        }}
+
+    @staticmethod
+    def _delete_row(worksheet, row):
+        return {"deleteDimension": {"range": {
+            "sheetId": worksheet.id,
+            "dimension": "ROWS",
+            "startIndex": row - 1,
+            "endIndex": row,
+        }}}
+
+    def write_changes(self, worksheet, updates=(), delete_rows=(), appends=()):
+        """
+        Grava na aba, com no máximo três chamadas, as atualizações (no formato do
+        batch_update do gspread), as exclusões (números de linha) e as inclusões.
+        Mantém o índice de linhas em dia; o índice da aba deve estar carregado.
+        """
+        delete_rows = sorted(set(delete_rows), reverse=True)
+
+        # Atualiza antes de excluir, enquanto os números das linhas ainda valem
+        if updates:
+            worksheet.batch_update(updates)
+        if delete_rows:
+            self.registry.spreadsheet.batch_update({"requests": [
+                self._delete_row(worksheet, row) for row in delete_rows]})
+            for row in delete_rows:
+                self.row_index.removed(worksheet.title, row)
+        if appends:
+            worksheet.append_rows(appends)
+            self.row_index.appended(worksheet.title,
+                                    ["" if row is HEADER else row[0] for row in appends])
+
+    def get_transactions(self, year, month, version=None):
+        """
+        Retorna todas transações de um mês numa MonthTable (usa o cache quando disponível).
+        `version` é a versão do mês no banco, se já foi lida (ver MonthCache)
+        """
+        transactions, version = self.cache.lookup(year, month, version)
+        if transactions is not None:
             return transactions
-        except Exception as e:
-            print(f"Erro ao buscar transações: {e}")
-            return []
 
-    def get_transaction_by_id(self, transaction_id, year, month):
-        """Busca uma transação específica pelo ID"""
+        sheet_name = self.get_sheet_name(year, month)
         try:
-            worksheet = self.get_or_create_sheet(year, month)
-            records = worksheet.get_all_records()
+            sheet = self.registry.get(sheet_name)
+            data = sheet.get_all_records()
+            # A leitura completa já dá a posição de cada ID: aproveita para o índice
+            self.row_index.load(sheet_name, ["ID"] + [row.get("ID", "") for row in data])
 
-            for record in records:
-                if record.get("ID") == transaction_id:
-                    return record
-            return None
-        except Exception as e:
-            print(f"Erro ao buscar transação: {e}")
-            return None
+            transactions = MonthTable.from_records(data)
+            self.cache.set(year, month, transactions, version)
+            return transactions
+        except gspread.WorksheetNotFound:
+            # Mês sem planilha: guarda o resultado vazio até alguém salvar nele
+            transactions = MonthTable.empty()
+            self.cache.set(year, month, transactions, version)
+            return transactions
+        except Exception:
+            logger.exception("Erro ao buscar transações")
+            self.forget_sheet(sheet_name)
+            return MonthTable.empty()
 
-    def move_transaction(self, transaction, old_year, old_month, new_year, new_month):
+    def read_worksheets(self, titles, chunk_size=50):
         """
-        Move uma transação de uma planilha para outra
+        Lê o conteúdo (colunas A:H) de várias abas com uma chamada values_batch_get
+        a cada `chunk_size` abas. Números vêm sem formatação e datas como texto.
+        Retorna {título: linhas} e já carrega o índice de linhas de cada aba.
         """
-        try:
-            # Remove da planilha antiga
-            old_worksheet = self.get_or_create_sheet(old_year, old_month)
-            old_records = old_worksheet.get_all_records()
-
-            for i, record in enumerate(old_records, start=2):
-                if record.get("ID") == transaction.id:
-                    old_worksheet.delete_rows(i)
-                    break
-
-            # Adiciona na nova planilha
-            new_worksheet = self.get_or_create_sheet(new_year, new_month)
-
-            # Verifica se a nova planilha tem cabeçalho
-            if not new_worksheet.row_values(1):
-                new_worksheet.append_row([
-                    "ID", "Valor", "Tipo", "Descrição",
-                    "Método Pagamento", "Categoria", "Data", "Data Registro"
-                ])
-
-            # Adiciona a transação na nova planilha
-            new_worksheet.append_row([
-                transaction.id,
-                float(transaction.value),
-                transaction.transaction_type,
-                transaction.description,
-                transaction.payment_method,
-                transaction.category,
-                str(transaction.date),
-                str(transaction.date_added)
-            ])
-
-            return True
-
-        except Exception as e:
-            print(f"Erro ao mover transação: {e}")
-            return False
\ No newline at end of file
+        titles = list(titles)
+        contents = {}
+        for start in range(0, len(titles), chunk_size):
+            chunk = titles[start:start + chunk_size]
+            response = self.registry.spreadsheet.values_batch_get(
+                [f"'{title}'!A:H" for title in chunk],
+                params={
+                    "valueRenderOption": ValueRenderOption.unformatted,
+                    "dateTimeRenderOption": "FORMATTED_STRING",
+                },
+            )
+            for title, value_range in zip(chunk, response.get("valueRanges", [])):
+                rows = value_range.get("values", [])
+                contents[title] = rows
+                self.row_index.load(title, [row[0] if row else "" for row in rows])
+        return contents
+
+    def get_transactions_range(self, months, versions=None):
+        """
+        Transações de vários meses numa só MonthTable, na ordem de `months`. Os meses
+        em cache vêm do cache; os demais são lidos juntos, com uma chamada values_batch_get.
+        `versions` é {(ano, mês): versão}, se já foram lidas do banco.
+        """
+        by_month = {}
+        missing = {}
+        versions = dict(versions or {})
+        for year, month in months:
+            transactions, versions[(year, month)] = self.cache.lookup(
+                year, month, versions.get((year, month)))
+            if transactions is None:
+                missing[self.get_sheet_name(year, month)] = (year, month)
+            else:
+                by_month[(year, month)] = transactions
+
+        if missing:
+            try:
+                contents = self.read_worksheets(self.registry.existing(missing))
+            except Exception:
+                logger.exception("Erro ao buscar transações")
+                # Cai para a leitura mês a mês (que já trata os próprios erros)
+                contents = {title: None for title in missing}
+
+            for title, (year, month) in missing.items():
+                rows = contents.get(title, [])
+                if rows is None:
+                    by_month[(year, month)] = self.get_transactions(year, month,
+                                                                    versions[(year, month)])
+                    continue
+                header = rows[0] if rows else []
+                transactions = MonthTable.from_records([dict(zip(header, row))
+                                                        for row in rows[1:]])
+                # Mês sem aba fica em cache vazio, como em get_transactions
+                self.cache.set(year, month, transactions, versions[(year, month)])
+                by_month[(year, month)] = transactions
+
+        return MonthTable.concat([by_month[period] for period in months])
+
+    @staticmethod
+    def _cell(value):
+        """Converte um valor da linha no formato de célula da API (como o RAW do append_row)"""
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return {"userEnteredValue": {"numberValue": value}}
+        return {"userEnteredValue": {"stringValue": str(value)}}
@@ -0,0 +1,98 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce, ExtractMonth, ExtractYear
+
+from core.models import MonthlySummary, Transaction
+from core.services import dashboard_service, version_service
+
+KEY_FIELDS = ('year', 'month', 'category', 'transaction_type', 'payment_method',
+              'credit_card_id')
+
+
+def summary_key(transaction):
+    """Chave do resumo mensal de uma transação (ou None se ela não tem data)"""
+    if transaction.date is None:
+        return None
+
+    year, month = transaction.get_sheet_period()
+    return (year, month, transaction.category or '', transaction.transaction_type,
+            transaction.payment_method or '', transaction.credit_card_id)
+
+
+def apply_delta(key, total, count):
+    """Soma `total` e `count` na linha de resumo da chave, criando-a se preciso"""
+    filters = dict(zip(KEY_FIELDS, key))
+    summary = MonthlySummary.objects.filter(**filters)
+    with db_transaction.atomic():
+        updated = summary.update(total=F('total') + total, count=F('count') + count)
+        if not updated:
+            try:
+                with db_transaction.atomic():
+                    MonthlySummary.objects.create(**filters, total=total, count=count)
+            except IntegrityError:
+                # Outra requisição criou a linha depois do update: soma nela
+                summary.update(total=F('total') + total, count=F('count') + count)
+        # O mês mudou: nova versão para os ETags da API
+        version_service.bump(filters['year'], filters['month'])
+    dashboard_service.invalidate(filters['year'], filters['month'])
+
+
+def add_transactions(transactions, sign=1):
+    """Aplica de uma vez os deltas de várias transações (ex.: depois de um bulk_create)"""
+    deltas = defaultdict(lambda: [Decimal('0'), 0])
+    for transaction in transactions:
+        key = summary_key(transaction)
+        if key is None:
+            continue
+        deltas[key][0] += Decimal(str(transaction.value)) * sign
+        deltas[key][1] += sign
+
+    for key, (total, count) in deltas.items():
+        apply_delta(key, total, count)
+
+
+def compute_summary():
+    """Agrega todas as transações no banco, no mesmo formato das linhas de resumo"""
+    return (
+        Transaction.objects
+        .filter(date__isnull=False)
+        .annotate(
+            year=Coalesce('billing_year', ExtractYear('date')),
+            month=Coalesce('billing_month', ExtractMonth('date')),
+        )
+        .values(*KEY_FIELDS)
+        .annotate(total=Sum('value'), count=Count('id'))
+        .order_by()
+    )
+
+
+def rebuild():
+    """Reconstrói a tabela de resumo do zero. Retorna quantas linhas foram criadas"""
+    rows = [MonthlySummary(**row) for row in compute_summary()]
+    with db_transaction.atomic():
+        months = set(MonthlySummary.objects.values_list('year', 'month').distinct())
+        months.update((row.year, row.month) for row in rows)
+        MonthlySummary.objects.all().delete()
+        MonthlySummary.objects.bulk_create(rows, batch_size=1000)
+        for year, month in months:
+            dashboard_service.invalidate(year, month)
+    return len(rows)
+
+
+def verify():
+    """
+    Compara a tabela de resumo com uma agregação feita do zero. Retorna a lista de
+    diferenças como (chave, (total, quantidade) esperado, (total, quantidade) gravado)
+    """
+    expected = {tuple(row[f] for f in KEY_FIELDS): (row['total'], row['count'])
+                for row in compute_summary()}
+    stored = {tuple(row[f] for f in KEY_FIELDS): (row['total'], row['count'])
+              for row in MonthlySummary.objects.exclude(count=0, total=0)
+              .values(*KEY_FIELDS, 'total', 'count')}
+
+    return [(key, expected.get(key), stored.get(key))
+            for key in sorted(set(expected) | set(stored), key=str)
+            if expected.get(key) != stored.get(key)]
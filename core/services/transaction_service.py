@@ -1,4 +1,33 @@
+import base64
+import json
+import math
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import Q
+
 from core.models import Transaction
+from core.services import outbox_service, search_service
+
+# Maior intervalo de meses aceito no histórico
+MAX_RANGE_MONTHS = 36
+
+# Linhas por página do histórico
+PER_PAGE = 10
+
+# Campos de ordenação do histórico -> campos do modelo
+ORDER_FIELDS = {
+    'data': 'date',
+    'valor': 'value',
+    'descricao': 'description',
+    'tipo': 'transaction_type',
+    'categoria': 'category',
+    'pagamento': 'payment_method',
+}
+
+# Ordenação das buscas em todo o histórico: da transação mais relevante para a menos
+RELEVANCE = 'relevancia'
 
 
 def create(request):
@@ -12,3 +41,356 @@ def create(request):
         date_added=request.date_added
     )
     return Transaction.save(transaction_obj)
+
+
+def filter_transactions(queryset, busca=None, tipo=None, categoria=None, pagamento=None):
+    """Aplica no banco os mesmos filtros do histórico"""
+    if busca:
+        queryset = search_service.matching(queryset, busca)
+    if tipo and tipo != "todos":
+        queryset = queryset.filter(transaction_type=tipo)
+    if categoria and categoria != "todas":
+        queryset = queryset.filter(category=categoria)
+    if pagamento and pagamento != "todos":
+        queryset = queryset.filter(payment_method=pagamento)
+    return queryset
+
+
+def order_transactions(queryset, order_by="data", direction="desc"):
+    """Ordena no banco, com o ID como desempate para a paginação ser estável"""
+    field = ORDER_FIELDS.get(order_by, 'date')
+    prefix = '-' if direction == 'desc' else ''
+    return queryset.order_by(f"{prefix}{field}", f"{prefix}id")
+
+
+def month_range(start, end):
+    """Lista de (ano, mês) de `start` até `end`, inclusive"""
+    first = start[0] * 12 + start[1] - 1
+    last = end[0] * 12 + end[1] - 1
+    return [(ordinal // 12, ordinal % 12 + 1) for ordinal in range(first, last + 1)]
+
+
+def selected_months(ano, mes, periodo=None, mes_de=None, mes_ate=None):
+    """
+    Meses pedidos no histórico: só (ano, mês); os últimos 3/6/12 meses terminando
+    nele (`periodo`); ou um intervalo livre `mes_de`..`mes_ate` no formato AAAA-MM
+    """
+    if periodo in ("3", "6", "12"):
+        ordinal = ano * 12 + mes - 1 - (int(periodo) - 1)
+        return month_range((ordinal // 12, ordinal % 12 + 1), (ano, mes))
+
+    if periodo == "intervalo" and mes_de and mes_ate:
+        try:
+            start = tuple(int(part) for part in mes_de.split("-")[:2])
+            end = tuple(int(part) for part in mes_ate.split("-")[:2])
+        except ValueError:
+            return [(ano, mes)]
+        if len(start) != 2 or len(end) != 2 or not (1 <= start[1] <= 12 and 1 <= end[1] <= 12):
+            return [(ano, mes)]
+        months = month_range(min(start, end), max(start, end))
+        # Intervalos muito longos ficam com os meses mais recentes
+        return months[-MAX_RANGE_MONTHS:]
+
+    return [(ano, mes)]
+
+
+def month_transactions(year, month, busca=None, tipo=None, categoria=None, pagamento=None,
+                       order_by="data", direction="desc"):
+    """Transações da aba (ano, mês), filtradas e ordenadas pelo banco"""
+    return period_transactions([(year, month)], busca, tipo, categoria, pagamento,
+                               order_by, direction)
+
+
+def period_transactions(months, busca=None, tipo=None, categoria=None, pagamento=None,
+                        order_by="data", direction="desc"):
+    """Transações das abas de `months` (meses consecutivos), filtradas e ordenadas pelo banco"""
+    if len(months) == 1:
+        queryset = Transaction.objects.in_sheet_period(*months[0])
+    else:
+        queryset = Transaction.objects.in_sheet_range(months[0], months[-1])
+    queryset = filter_transactions(queryset, busca, tipo, categoria, pagamento)
+    return order_transactions(queryset, order_by, direction)
+
+
+def to_historical_row(transaction):
+    """Converte a transação na mesma linha tipada usada pelo histórico do Sheets"""
+    return {
+        "id": transaction.id,
+        "descricao": transaction.description,
+        "valor": transaction.value,
+        "tipo": transaction.transaction_type,
+        "categoria": transaction.category,
+        "pagamento": transaction.payment_method,
+        "data": transaction.date,
+        "data_registro": str(transaction.date_added),
+    }
+
+
+def sort_field(order_by):
+    """Campo de ordenação efetivo (o histórico cai para a data se o campo não existe)"""
+    return order_by if order_by in ORDER_FIELDS or order_by == RELEVANCE else 'data'
+
+
+def cursor_value(row, field):
+    """
+    Valor de uma linha do histórico no campo de ordenação, como vai no cursor:
+    centavos para o valor, ordinal para a data, a posição no resultado para a
+    relevância e o texto para os demais
+    """
+    if field == RELEVANCE:
+        return row['posicao']
+    if field == 'valor':
+        return int(row['valor'] * 100) if row['valor'] is not None else 0
+    if field == 'data':
+        return row['data'].toordinal() if row['data'] else 0
+    return row[field] or ''
+
+
+def encode_cursor(order_by, direction, row, number):
+    """Cursor opaco (base64 de JSON) com a ordenação, a linha de referência e a página"""
+    field = sort_field(order_by)
+    data = [field, direction, cursor_value(row, field),
+            row['id'] if row['id'] is not None else -1, number]
+    token = base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode())
+    return token.decode().rstrip('=')
+
+
+def decode_cursor(token, order_by, direction):
+    """
+    (valor, ID, página) do cursor, ou None se estiver ausente, inválido ou for de
+    outra ordenação (aí o histórico volta para a primeira página)
+    """
+    if not token:
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        field, cursor_direction, value, transaction_id, number = data
+    except (ValueError, TypeError):
+        return None
+
+    expected = str if field in ('descricao', 'tipo', 'categoria', 'pagamento') else int
+    if ((field, cursor_direction) != (sort_field(order_by), direction)
+            or type(value) is not expected or type(transaction_id) is not int
+            or type(number) is not int):
+        return None
+    return value, transaction_id, max(number, 1)
+
+
+def page_number_or_first(page_number, count, per_page):
+    """Número de página pedido (?page=), limitado às páginas existentes, como get_page"""
+    num_pages = max(1, math.ceil(count / per_page))
+    try:
+        return min(max(int(page_number), 1), num_pages)
+    except (TypeError, ValueError):
+        return 1
+
+
+class KeysetPage:
+    """
+    Página do histórico paginada por cursor (keyset): a próxima página começa logo
+    depois da última linha desta na ordenação (campo, ID), então trocar de página
+    não depende de quantas linhas vêm antes. Tem a interface de Page usada no template.
+    """
+
+    def __init__(self, object_list, number, count, per_page, order_by, direction,
+                 has_previous, has_next):
+        self.object_list = object_list
+        self.number = number
+        self.count = count
+        self.per_page = per_page
+        self.order_by = order_by
+        self.direction = direction
+        self._has_previous = has_previous
+        self._has_next = has_next
+        # O template usa paginator.count e paginator.num_pages
+        self.paginator = self
+
+    @property
+    def num_pages(self):
+        return max(1, math.ceil(self.count / self.per_page))
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_previous(self):
+        return self._has_previous and bool(self.object_list)
+
+    def has_next(self):
+        return self._has_next and bool(self.object_list)
+
+    @property
+    def previous_cursor(self):
+        return encode_cursor(self.order_by, self.direction, self.object_list[0],
+                             max(self.number - 1, 1))
+
+    @property
+    def next_cursor(self):
+        return encode_cursor(self.order_by, self.direction, self.object_list[-1],
+                             self.number + 1)
+
+
+def table_page(rows, order_by="data", direction="desc", after=None, before=None,
+               page_number=None, per_page=PER_PAGE):
+    """
+    Página de linhas do Sheets (TableRows, já ordenadas pela permutação guardada na
+    MonthTable). Com cursor, a posição sai de uma busca binária; só as linhas da
+    página são montadas.
+    """
+    count = len(rows)
+    if after:
+        start = rows.seek(after[0], after[1], after=True)
+    elif before:
+        start = max(rows.seek(before[0], before[1], after=False) - per_page, 0)
+    else:
+        start = (page_number_or_first(page_number, count, per_page) - 1) * per_page
+
+    return KeysetPage(rows[start:start + per_page], start // per_page + 1, count, per_page,
+                      order_by, direction, start > 0, start + per_page < count)
+
+
+def db_cursor_value(field, value):
+    """Valor do cursor convertido para o campo do modelo"""
+    if field == 'value':
+        return Decimal(value).scaleb(-2)
+    if field == 'date':
+        return date.fromordinal(value) if value > 0 else date.min
+    return value
+
+
+def keyset_window(queryset, order_by="data", direction="desc", after=None, before=None,
+                  page_number=None, per_page=PER_PAGE):
+    """
+    Transações de uma página do queryset ordenado: (transações, número da página,
+    total, tem anterior, tem próxima). Com cursor, filtra por (campo, ID) depois (ou
+    antes) da linha de referência em vez de OFFSET, usando o índice do campo.
+    """
+    field = ORDER_FIELDS[sort_field(order_by)]
+    descending = direction == 'desc'
+    count = queryset.count()
+
+    if after or before:
+        value, transaction_id, number = after or before
+        value = db_cursor_value(field, value)
+        # "Depois" na ordem pedida é maior (crescente) ou menor (decrescente)
+        lookup = 'lt' if descending == bool(after) else 'gt'
+        queryset = queryset.filter(Q(**{f"{field}__{lookup}": value})
+                                   | Q(**{field: value, f"id__{lookup}": transaction_id}))
+        if after:
+            transactions = list(queryset[:per_page + 1])
+            has_previous, has_next = True, len(transactions) > per_page
+            transactions = transactions[:per_page]
+        else:
+            transactions = list(queryset.reverse()[:per_page + 1])
+            has_previous, has_next = len(transactions) > per_page, True
+            transactions = transactions[:per_page][::-1]
+            number = number if has_previous else 1
+    else:
+        number = page_number_or_first(page_number, count, per_page)
+        start = (number - 1) * per_page
+        transactions = list(queryset[start:start + per_page])
+        has_previous, has_next = start > 0, start + per_page < count
+
+    return transactions, number, count, has_previous, has_next
+
+
+def queryset_page(queryset, order_by="data", direction="desc", after=None, before=None,
+                  page_number=None, per_page=PER_PAGE):
+    """Página do histórico vinda do banco (keyset_window); só a página é convertida"""
+    transactions, number, count, has_previous, has_next = keyset_window(
+        queryset, order_by, direction, after, before, page_number, per_page)
+    return KeysetPage([to_historical_row(t) for t in transactions], number, count, per_page,
+                      order_by, direction, has_previous, has_next)
+
+
+def historical_page(months, page_number=None, busca=None, tipo=None, categoria=None,
+                    pagamento=None, order_by="data", direction="desc", after=None, before=None,
+                    per_page=PER_PAGE):
+    """Página do histórico vinda do banco: filtros, ordenação e cursor feitos pelo banco"""
+    transactions = period_transactions(months, busca, tipo, categoria, pagamento,
+                                       order_by, direction)
+    return queryset_page(transactions, order_by, direction, after, before, page_number,
+                         per_page)
+
+
+class RankedRows:
+    """
+    Resultado de uma busca em todo o histórico, na ordem de relevância: guarda só os
+    IDs ranqueados pelo FTS5 e lê do banco apenas as transações da página. Tem a
+    interface de TableRows usada por table_page.
+    """
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.positions = {transaction_id: position for position, transaction_id in enumerate(ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, item):
+        start = item.indices(len(self.ids))[0]
+        page_ids = self.ids[item]
+        transactions = Transaction.objects.in_bulk(page_ids)
+        return [dict(to_historical_row(transactions[transaction_id]), posicao=start + offset)
+                for offset, transaction_id in enumerate(page_ids)
+                if transaction_id in transactions]
+
+    def seek(self, value, transaction_id, after=True):
+        """Posição depois (after=True) ou a partir da linha do cursor no resultado"""
+        position = min(max(self.positions.get(transaction_id, value), 0), len(self.ids))
+        return position + 1 if after else position
+
+
+def search_page(busca, page_number=None, tipo=None, categoria=None, pagamento=None,
+                order_by=RELEVANCE, direction="asc", after=None, before=None,
+                per_page=PER_PAGE):
+    """
+    Página de uma busca pela descrição em todo o histórico, sem limite de período,
+    pelo índice FTS5 do banco. Em ordem de relevância os resultados vêm ranqueados
+    (até SEARCH_MAX_RESULTS); nos outros campos, paginação por cursor como no histórico.
+    """
+    if order_by == RELEVANCE:
+        queryset = filter_transactions(Transaction.objects.all(), None, tipo, categoria,
+                                       pagamento)
+        rows = RankedRows(search_service.ranked_ids(queryset, busca))
+        return table_page(rows, order_by, direction, after, before, page_number, per_page)
+
+    queryset = filter_transactions(Transaction.objects.all(), busca, tipo, categoria, pagamento)
+    return queryset_page(order_transactions(queryset, order_by, direction), order_by, direction,
+                         after, before, page_number, per_page)
+
+
+def assign_billing(transaction):
+    """Mês de fatura pela data e pelo fechamento do cartão; sem cartão, fica na aba da data"""
+    if transaction.credit_card is not None and transaction.date is not None:
+        transaction.billing_month, transaction.billing_year = (
+            transaction.credit_card.get_billing_month_for_date(transaction.date))
+    else:
+        transaction.billing_month = transaction.billing_year = None
+
+
+def save_and_enqueue(transaction, operation='save', old_period=None, on_commit=None):
+    """
+    Grava a transação e enfileira o envio para o Google Sheets na mesma transação
+    do banco; `on_commit` é chamado depois do commit (ex.: acordar o worker)
+    """
+    with db_transaction.atomic():
+        transaction.save()
+        outbox_service.enqueue(operation, transaction, old_period=old_period)
+        if on_commit:
+            db_transaction.on_commit(on_commit)
+    return transaction
+
+
+def delete_and_enqueue(transaction, on_commit=None):
+    """Exclui a transação e enfileira a exclusão na aba onde ela está (mês de fatura)"""
+    with db_transaction.atomic():
+        outbox_service.enqueue('delete', transaction, old_period=transaction.get_sheet_period())
+        transaction.delete()
+        if on_commit:
+            db_transaction.on_commit(on_commit)
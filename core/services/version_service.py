@@ -0,0 +1,68 @@
+import hashlib
+import json
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce, ExtractMonth, ExtractYear
+
+from core.models import MonthVersion, Transaction
+
+
+def bump(year, month):
+    """Aumenta a versão do mês (na mesma transação do banco da alteração)"""
+    versions = MonthVersion.objects.filter(year=year, month=month)
+    with db_transaction.atomic():
+        if not versions.update(version=F('version') + 1):
+            try:
+                with db_transaction.atomic():
+                    MonthVersion.objects.create(year=year, month=month, version=1)
+            except IntegrityError:
+                # Outra requisição criou o mês depois do update
+                versions.update(version=F('version') + 1)
+
+
+def versions(months):
+    """{(ano, mês): versão} dos meses pedidos (0 para os que nunca mudaram), numa consulta"""
+    months = list(months)
+    found = {}
+    if months:
+        ordinals = [year * 12 + month for year, month in months]
+        rows = (MonthVersion.objects
+                .annotate(ordinal=F('year') * 12 + F('month'))
+                .filter(ordinal__range=(min(ordinals), max(ordinals)))
+                .values_list('year', 'month', 'version'))
+        found = {(year, month): version for year, month, version in rows}
+    return {period: found.get(period, 0) for period in months}
+
+
+def current(year, month):
+    """Versão atual do mês (0 se ele nunca mudou)"""
+    return versions([(year, month)])[(year, month)]
+
+
+def bump_card(card):
+    """Aumenta a versão dos meses com transações do cartão (nome do cartão vai na API)"""
+    months = (Transaction.objects
+              .filter(credit_card=card, date__isnull=False)
+              .values_list(Coalesce('billing_year', ExtractYear('date')),
+                           Coalesce('billing_month', ExtractMonth('date')))
+              .distinct())
+    for year, month in months:
+        bump(year, month)
+
+
+def collection_etag(months, params):
+    """
+    ETag de uma listagem: as versões dos meses pedidos (todos, sem período) e os
+    parâmetros da consulta. As versões só aumentam, então a soma muda a cada
+    alteração; uma consulta só, sem ler as transações.
+    """
+    versions = MonthVersion.objects.all()
+    if months:
+        first, last = months[0][0] * 12 + months[0][1], months[-1][0] * 12 + months[-1][1]
+        versions = versions.annotate(ordinal=F('year') * 12 + F('month')).filter(
+            ordinal__range=(first, last))
+    state = versions.aggregate(total=Sum('version'), count=Count('id'))
+    key = json.dumps([state['total'], state['count'], sorted(params.items())],
+                     separators=(',', ':'), default=str)
+    return f'"{hashlib.sha1(key.encode()).hexdigest()}"'
@@ -0,0 +1,63 @@
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+
+from core.models import CreditCard, Transaction
+from core.services import (invoice_service, metrics, search_service, summary_service,
+                           version_service)
+
+
+@receiver(pre_save, sender=Transaction)
+def remember_previous(sender, instance, **kwargs):
+    """Guarda a versão antiga da transação para descontar dos agregados depois de salvar"""
+    instance._previous = None
+    if instance.pk is not None:
+        instance._previous = Transaction.objects.filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=Transaction)
+def update_aggregates_on_save(sender, instance, **kwargs):
+    old = getattr(instance, '_previous', None)
+    if old is not None:
+        key = summary_service.summary_key(old)
+        if key is not None:
+            summary_service.apply_delta(key, -old.value, -1)
+
+    key = summary_service.summary_key(instance)
+    if key is not None:
+        summary_service.apply_delta(key, instance.value, 1)
+
+    invoice_service.apply_change(old, instance)
+
+
+@receiver(post_delete, sender=Transaction)
+def update_aggregates_on_delete(sender, instance, **kwargs):
+    key = summary_service.summary_key(instance)
+    if key is not None:
+        summary_service.apply_delta(key, -instance.value, -1)
+
+    invoice_service.apply_change(instance, None)
+
+
+@receiver(post_save, sender=CreditCard)
+def bump_card_months(sender, instance, created, **kwargs):
+    """A API mostra o nome do cartão junto das transações: os meses dele mudam de versão"""
+    if not created:
+        version_service.bump_card(instance)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    """Conta e cronometra as consultas de cada conexão aberta (exportado em /metrics)"""
+    metrics.install_db_wrapper(connection)
+
+
+@receiver(post_migrate)
+def restore_search_index(sender, using, **kwargs):
+    """
+    Migrações que refazem core_transaction no SQLite (AlterField, RemoveField) apagam
+    os gatilhos do índice de texto: recria-os depois de cada migrate
+    """
+    if sender.name == 'core':
+        search_service.restore_triggers(connections[using])
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import date, datetime
 
 from django import template
 from django.template.defaultfilters import stringfilter
@@ -17,11 +17,16 @@ def moeda(valor):
 
 @register.filter()
 def data(data):
-    try:
-        data_obj = datetime.strptime(data, "%Y-%m-%d %H:%M:%S")
-        return data_obj.strftime("%d/%m/%Y")
-    except ValueError:
-        return "Data inválida"
+    if isinstance(data, date):
+        return data.strftime("%d/%m/%Y")
+    # A planilha guarda a data com ou sem horário, conforme a origem da transação
+    for formato in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            data_obj = datetime.strptime(str(data), formato)
+            return data_obj.strftime("%d/%m/%Y")
+        except ValueError:
+            continue
+    return "Data inválida"
 
 
 @register.simple_tag
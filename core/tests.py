@@ -1,3 +1,1429 @@
-from django.test import TestCase
+import warnings
+import zipfile
+from datetime import date
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import gspread
+import numpy as np
+import requests
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import QuerySet, Sum
+from django.http import FileResponse
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from core.models import CreditCard, CreditCardInvoice, MonthlySummary, SheetsOutbox, Transaction
+from core import benchmarks, signals
+from core.services import (billing_service, dashboard_service, export_service,
+                           import_service, invoice_service, metrics, outbox_service,
+                           reconcile_service, reports_service, search_service,
+                           summary_service, transaction_service)
+from core.services.local_sheets import LocalClient, LocalStore, api_error
+from core.services.month_table import MonthTable
+from core.services.sheets_client import QuotaHTTPClient, api_operation
+from core.services.sheets_service import (GoogleSheetsService, MonthCache, RowIndex,
+                                         SpreadsheetRegistry)
+from core.utils import MoneyParseError, parse_date, parse_many, parse_money
+
+# Planilha em memória e fila processada só quando o teste pede
+TEST_SETTINGS = {"SHEETS_BACKEND": "local", "SHEETS_OUTBOX_WORKER": "command"}
+
+
+def make_transaction(**fields):
+    values = {
+        "transaction_type": "gasto", "description": "Mercado", "value": Decimal("10.00"),
+        "payment_method": "debito", "category": "alimentacao", "date": date(2025, 1, 15),
+    }
+    values.update(fields)
+    return Transaction.objects.create(**values)
+
+
+def local_sheets():
+    """GoogleSheetsService com uma planilha em memória só do teste"""
+    return GoogleSheetsService(client=LocalClient(store=LocalStore()))
+
+
+def sheet_ids(sheets, year, month):
+    return sorted(int(i) for i in sheets.get_transactions(year, month).ids)
+
+
+def xlsx_rows(content):
+    """Número de linhas da aba do XLSX exportado"""
+    with zipfile.ZipFile(BytesIO(content)) as workbook:
+        return workbook.read("xl/worksheets/sheet1.xml").count(b"<row ")
+
+
+@override_settings(**TEST_SETTINGS)
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(5):
+            make_transaction(description=f"Compra {i}")
+
+    @mock.patch.object(export_service, "ASYNC_BATCH_ROWS", 2)
+    async def test_csv_streams_in_blocks_under_asgi(self):
+        response = await self.async_client.get(reverse("export_transactions"))
+
+        self.assertTrue(response.streaming)
+        self.assertTrue(response.is_async)
+        with warnings.catch_warnings():
+            # Um iterador síncrono no ASGI gera aviso e junta tudo na memória
+            warnings.simplefilter("error")
+            chunks = [chunk async for chunk in response.streaming_content]
+        # Cabeçalho + 5 linhas em blocos de 2
+        self.assertEqual(len(chunks), 3)
+        self.assertIn("Compra 4", b"".join(chunks).decode())
+
+    def test_csv_streams_under_wsgi(self):
+        response = self.client.get(reverse("export_transactions"))
+
+        self.assertTrue(response.streaming)
+        self.assertFalse(response.is_async)
+        self.assertEqual(b"".join(response.streaming_content).decode().count("Compra"), 5)
+
+    @mock.patch.object(export_service, "FILE_BLOCK_SIZE", 1024)
+    async def test_xlsx_streams_in_blocks_under_asgi(self):
+        response = await self.async_client.get(reverse("export_transactions"),
+                                                {"formato": "xlsx"})
+
+        self.assertTrue(response.is_async)
+        self.assertEqual(response["Content-Type"], export_service.XLSX_CONTENT_TYPE)
+        self.assertIn("transacoes.xlsx", response["Content-Disposition"])
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertGreater(len(chunks), 1)
+        content = b"".join(chunks)
+        self.assertEqual(len(content), int(response["Content-Length"]))
+        self.assertEqual(xlsx_rows(content), 6)
+
+    def test_xlsx_under_wsgi(self):
+        response = self.client.get(reverse("export_transactions"), {"formato": "xlsx"})
+
+        self.assertIsInstance(response, FileResponse)
+        self.assertEqual(xlsx_rows(b"".join(response.streaming_content)), 6)
+
+
+def outbox_entry(operation, transaction_id, old=None, new=None):
+    return SheetsOutbox(operation=operation, transaction_id=transaction_id,
+                        old_year=old[0] if old else None, old_month=old[1] if old else None,
+                        year=new[0] if new else None, month=new[1] if new else None)
+
+
+class CoalesceTests(TestCase):
+    def test_save_then_update_is_one_upsert(self):
+        plan, involved = outbox_service.coalesce([
+            outbox_entry("save", 1, new=(2025, 1)),
+            outbox_entry("update", 1, old=(2025, 1), new=(2025, 1)),
+        ])
+        self.assertEqual(dict(plan), {(2025, 1): {"upserts": {1}, "deletes": set()}})
+        self.assertEqual(len(involved[(2025, 1)]), 2)
+
+    def test_move_deletes_from_origin_and_upserts_in_destination(self):
+        plan, _ = outbox_service.coalesce([
+            outbox_entry("update", 1, old=(2025, 1), new=(2025, 2)),
+            outbox_entry("update", 1, old=(2025, 2), new=(2025, 3)),
+        ])
+        self.assertEqual(plan[(2025, 1)], {"upserts": set(), "deletes": {1}})
+        self.assertEqual(plan[(2025, 3)], {"upserts": {1}, "deletes": set()})
+        self.assertNotIn((2025, 2), plan)
+
+    def test_save_then_delete_touches_nothing(self):
+        plan, _ = outbox_service.coalesce([
+            outbox_entry("save", 1, new=(2025, 1)),
+            outbox_entry("delete", 1, old=(2025, 1)),
+        ])
+        self.assertEqual(plan[(2025, 1)], {"upserts": set(), "deletes": set()})
+
+    def test_current_period_wins_over_the_queued_one(self):
+        plan, _ = outbox_service.coalesce(
+            [outbox_entry("update", 1, old=(2025, 1), new=(2025, 1))], {1: (2025, 2)})
+        self.assertEqual(plan[(2025, 1)], {"upserts": set(), "deletes": {1}})
+        self.assertEqual(plan[(2025, 2)], {"upserts": {1}, "deletes": set()})
+
+
+@override_settings(**TEST_SETTINGS)
+class ProcessOutboxTests(TestCase):
+    def setUp(self):
+        self.sheets = local_sheets()
+
+    def test_writes_pending_changes_and_marks_them_done(self):
+        transaction = transaction_service.save_and_enqueue(Transaction(
+            transaction_type="gasto", description="Mercado", value=Decimal("10"),
+            date=date(2025, 1, 15)))
+
+        self.assertEqual(outbox_service.process_outbox(self.sheets), 1)
+        self.assertEqual(sheet_ids(self.sheets, 2025, 1), [transaction.id])
+        self.assertFalse(SheetsOutbox.objects.exclude(status="done").exists())
+
+    def test_row_moved_after_enqueue_goes_to_the_current_tab(self):
+        transaction = transaction_service.save_and_enqueue(Transaction(
+            transaction_type="gasto", description="Mercado", value=Decimal("10"),
+            date=date(2025, 1, 15)))
+        outbox_service.process_outbox(self.sheets)
+
+        transaction.description = "Feira"
+        transaction_service.save_and_enqueue(transaction, "update", old_period=(2025, 1))
+        # Mudança de mês fora da fila, antes do worker rodar
+        Transaction.objects.filter(id=transaction.id).update(date=date(2025, 2, 15))
+        outbox_service.process_outbox(self.sheets)
+
+        self.assertEqual(sheet_ids(self.sheets, 2025, 1), [])
+        self.assertEqual(sheet_ids(self.sheets, 2025, 2), [transaction.id])
+
+    def test_claims_do_not_overlap(self):
+        first = make_transaction()
+        SheetsOutbox.objects.create(operation="save", transaction_id=first.id, year=2025,
+                                    month=1)
+        token = outbox_service.claim()
+        second = make_transaction()
+        SheetsOutbox.objects.create(operation="save", transaction_id=second.id, year=2025,
+                                    month=1)
+        # Nova operação da primeira transação: espera a reserva em andamento
+        SheetsOutbox.objects.create(operation="update", transaction_id=first.id, year=2025,
+                                    month=1)
+
+        other = outbox_service.claim()
+
+        self.assertEqual(set(SheetsOutbox.objects.filter(claim=token)
+                             .values_list("transaction_id", flat=True)), {first.id})
+        self.assertEqual(set(SheetsOutbox.objects.filter(claim=other)
+                             .values_list("transaction_id", flat=True)), {second.id})
+        self.assertIsNone(outbox_service.claim())
+
+
+class RowIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = RowIndex()
+        self.index.load("01-2025", ["ID", "10", "", "12", "13"])
+
+    def test_load_skips_header_and_blank_ids(self):
+        self.assertEqual([self.index.get("01-2025", i) for i in (10, 11, 12, "13")],
+                         [2, None, 4, 5])
+        self.assertEqual(self.index.last_row("01-2025"), 5)
+        self.assertIsNone(self.index.get("02-2025", 10))
+
+    def test_removed_shifts_the_rows_below(self):
+        self.index.removed("01-2025", 2)
+        self.assertEqual([self.index.get("01-2025", i) for i in (10, 12, 13)], [None, 3, 4])
+        self.assertEqual(self.index.last_row("01-2025"), 4)
+
+    def test_appended_rows_go_to_the_end(self):
+        self.index.appended("01-2025", [14, ""])
+        self.assertEqual(self.index.get("01-2025", 14), 6)
+        self.assertEqual(self.index.last_row("01-2025"), 7)
+        self.index.forget("01-2025")
+        self.assertFalse(self.index.is_loaded("01-2025"))
+
+
+class MonthCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = MonthCache(ttl=60, max_entries=2)
+        self.table = MonthTable.empty()
+
+    def test_entries_expire_after_the_ttl(self):
+        with mock.patch("core.services.sheets_service.time.monotonic", return_value=100):
+            self.cache.set(2025, 1, self.table)
+        with mock.patch("core.services.sheets_service.time.monotonic", return_value=159):
+            self.assertIs(self.cache.get(2025, 1), self.table)
+        with mock.patch("core.services.sheets_service.time.monotonic", return_value=161):
+            self.assertIsNone(self.cache.get(2025, 1))
+
+    def test_least_recently_used_month_is_evicted(self):
+        self.cache.set(2025, 1, self.table)
+        self.cache.set(2025, 2, self.table)
+        self.cache.get(2025, 1)
+        self.cache.set(2025, 3, self.table)
+        self.assertIsNone(self.cache.get(2025, 2))
+        self.assertIs(self.cache.get(2025, 1), self.table)
+        self.assertIs(self.cache.get(2025, 3), self.table)
+
+    def test_invalidate_and_clear(self):
+        self.cache.set(2025, 1, self.table)
+        self.cache.set(2025, 2, self.table)
+        self.cache.invalidate(2025, 1)
+        self.assertIsNone(self.cache.get(2025, 1))
+        self.assertIs(self.cache.get(2025, 2), self.table)
+        self.cache.clear()
+        self.assertIsNone(self.cache.get(2025, 2))
+
+    def test_entry_only_matches_its_version(self):
+        self.cache.set(2025, 1, self.table, version=3)
+        self.assertEqual(self.cache.lookup(2025, 1, 3), (self.table, 3))
+        self.assertEqual(self.cache.lookup(2025, 1, 4), (None, 4))
+        # A entrada da versão antiga foi descartada
+        self.assertEqual(self.cache.lookup(2025, 1, 3), (None, 3))
+
+
+@override_settings(**TEST_SETTINGS)
+class SharedMonthCacheTests(TestCase):
+    """Dois serviços na mesma planilha e no mesmo banco, como dois processos"""
+
+    def setUp(self):
+        store = LocalStore()
+        self.reader = GoogleSheetsService(client=LocalClient(store=store))
+        self.writer = GoogleSheetsService(client=LocalClient(store=store))
+        self.calls = store.calls
+        self.first = make_transaction(date=date(2025, 1, 10))
+        self.writer.sync_worksheet(2025, 1, [self.first])
+
+    def read(self):
+        return sheet_ids(self.reader, 2025, 1)
+
+    def test_write_by_another_process_invalidates_the_cache(self):
+        self.assertEqual(self.read(), [self.first.id])
+        self.assertEqual(self.read(), [self.first.id])
+        self.assertEqual(self.calls["get_all_records"], 1)
+
+        second = make_transaction(date=date(2025, 1, 12))
+        self.writer.sync_worksheet(2025, 1, [second])
+        self.assertEqual(self.read(), [self.first.id, second.id])
+        self.assertEqual(self.calls["get_all_records"], 2)
+
+    def test_enqueued_change_invalidates_the_cache(self):
+        self.read()
+        transaction_service.save_and_enqueue(Transaction(
+            transaction_type="gasto", description="Padaria", value=Decimal("5.00"),
+            payment_method="debito", category="alimentacao", date=date(2025, 1, 20)))
+        self.read()
+        self.assertEqual(self.calls["get_all_records"], 2)
+
+    def test_read_started_before_a_write_is_not_reused(self):
+        transactions, version = self.reader.cache.lookup(2025, 1)
+        self.assertIsNone(transactions)
+
+        # A gravação termina entre a leitura da aba e o set do resultado antigo
+        second = make_transaction(date=date(2025, 1, 12))
+        self.writer.sync_worksheet(2025, 1, [second])
+        self.reader.cache.set(2025, 1, MonthTable.empty(), version)
+        self.assertEqual(self.read(), [self.first.id, second.id])
+
+
+class SpreadsheetRegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.store = LocalStore()
+        self.registry = SpreadsheetRegistry(LocalClient(store=self.store))
+        # Outro processo, com o próprio mapa de abas
+        self.other = SpreadsheetRegistry(LocalClient(store=self.store))
+
+    def test_spreadsheet_and_worksheets_are_read_once(self):
+        created = self.registry.get_or_create("01-2025")
+        self.assertIs(self.registry.get("01-2025"), created)
+        self.assertIs(self.registry.get_or_create("01-2025"), created)
+        self.assertEqual(self.registry.existing(["01-2025"]), ["01-2025"])
+        self.assertEqual((self.store.calls["open"], self.store.calls["worksheets"],
+                          self.store.calls["add_worksheet"]), (1, 1, 1))
+        self.assertEqual(self.registry.key, self.registry.spreadsheet.id)
+
+    def test_get_refreshes_once_for_a_worksheet_created_elsewhere(self):
+        self.registry.refresh()
+        created = self.other.get_or_create("02-2025")
+        self.assertIs(self.registry.get("02-2025"), created)
+        self.assertEqual(self.store.calls["worksheets"], 3)
+        with self.assertRaises(gspread.WorksheetNotFound):
+            self.registry.get("03-2025")
+        self.assertEqual(self.store.calls["worksheets"], 4)
+
+    def test_existing_filters_the_missing_titles(self):
+        self.registry.get_or_create("01-2025")
+        self.other.get_or_create("02-2025")
+        self.assertEqual(self.registry.existing(["01-2025", "02-2025", "03-2025"]),
+                         ["01-2025", "02-2025"])
+
+    def test_get_or_create_uses_the_worksheet_created_elsewhere(self):
+        self.registry.refresh()
+        created = self.other.get_or_create("02-2025")
+        self.assertIs(self.registry.get_or_create("02-2025"), created)
+
+    def test_forget_drops_the_worksheet_from_the_map(self):
+        self.registry.get_or_create("01-2025")
+        worksheets = self.store.calls["worksheets"]
+        self.registry.forget("01-2025")
+        self.registry.get("01-2025")
+        self.assertEqual(self.store.calls["worksheets"], worksheets + 1)
+
+
+@override_settings(**TEST_SETTINGS)
+class SyncWorksheetsTests(TestCase):
+    def setUp(self):
+        self.sheets = local_sheets()
+        self.calls = self.sheets.client.store.calls
+        self.first = make_transaction(date=date(2025, 1, 10))
+        self.second = make_transaction(date=date(2025, 1, 12))
+        self.sheets.sync_worksheet(2025, 1, [self.first, self.second])
+        self.worksheet = self.sheets.get_or_create_sheet(2025, 1)
+
+    def test_find_row_uses_the_index_and_reloads_when_stale(self):
+        self.assertEqual(self.sheets.find_row(self.worksheet, self.second.id), 3)
+        self.assertEqual(self.calls["col_values"], 0)
+        # Linha excluída por fora: o índice aponta para a linha errada
+        self.worksheet.delete_rows(2)
+        self.assertEqual(self.sheets.find_row(self.worksheet, self.second.id), 2)
+        self.assertEqual(self.calls["col_values"], 1)
+        self.assertIsNone(self.sheets.find_row(self.worksheet, self.first.id))
+
+    def test_move_between_tabs_is_a_single_write(self):
+        Transaction.objects.filter(id=self.first.id).update(date=date(2025, 2, 10))
+        self.first.refresh_from_db()
+        self.calls.clear()
+
+        self.sheets.sync_worksheets({(2025, 1): ([self.second], {self.first.id}),
+                                     (2025, 2): ([self.first], set())})
+
+        self.assertEqual(self.calls["batch_update"], 1)
+        self.assertEqual(self.calls["values_batch_get"], 1)
+        self.assertEqual(sheet_ids(self.sheets, 2025, 1), [self.second.id])
+        self.assertEqual(sheet_ids(self.sheets, 2025, 2), [self.first.id])
+        self.assertEqual(self.sheets.get_or_create_sheet(2025, 2).values()[0][0], "ID")
+
+    def test_move_within_the_same_tab_keeps_the_row(self):
+        self.first.description = "Feira"
+        self.first.save()
+
+        self.sheets.sync_worksheets({(2025, 1): ([self.first], {self.first.id})})
+
+        self.assertEqual(sheet_ids(self.sheets, 2025, 1), [self.first.id, self.second.id])
+        self.assertEqual(self.worksheet.values()[1][3], "Feira")
+
+    def test_outbox_move_is_sent_once(self):
+        self.first.date = date(2025, 3, 1)
+        transaction_service.save_and_enqueue(self.first, "update", old_period=(2025, 1))
+        self.calls.clear()
+
+        outbox_service.process_outbox(self.sheets)
+
+        self.assertEqual(self.calls["batch_update"], 1)
+        self.assertEqual(sheet_ids(self.sheets, 2025, 1), [self.second.id])
+        self.assertEqual(sheet_ids(self.sheets, 2025, 3), [self.first.id])
+
+    def test_failed_write_keeps_the_entries_for_retry(self):
+        self.first.date = date(2025, 3, 1)
+        transaction_service.save_and_enqueue(self.first, "update", old_period=(2025, 1))
+
+        with self.assertLogs("core.services.outbox_service", "ERROR"), mock.patch.object(
+                self.sheets.registry.spreadsheet, "batch_update",
+                side_effect=api_error(500, "erro")):
+            self.assertEqual(outbox_service.process_outbox(self.sheets), 0)
+
+        entry = SheetsOutbox.objects.get()
+        self.assertEqual((entry.status, entry.attempts), ("pending", 1))
+        self.assertEqual(sheet_ids(self.sheets, 2025, 1), [self.first.id, self.second.id])
+
+
+@override_settings(**TEST_SETTINGS)
+class RecomputeBillingTests(TestCase):
+    def test_closing_day_change_moves_rows_through_the_outbox(self):
+        sheets = local_sheets()
+        card = CreditCard.objects.create(name="Cartão", closing_day=20, due_day=27,
+                                         limit=Decimal("1000"))
+        transaction = Transaction(transaction_type="gasto", description="Loja",
+                                  value=Decimal("50"), payment_method="credito",
+                                  date=date(2025, 1, 15), credit_card=card)
+        transaction_service.assign_billing(transaction)
+        transaction_service.save_and_enqueue(transaction)
+        outbox_service.process_outbox(sheets)
+        self.assertEqual(sheet_ids(sheets, 2025, 1), [transaction.id])
+
+        card.closing_day = 10
+        card.save()
+        with mock.patch.object(GoogleSheetsService, "sync_worksheets") as sync:
+            self.assertEqual(billing_service.recompute_billing(card), 1)
+        # Nada é escrito na planilha durante a requisição
+        sync.assert_not_called()
+        self.assertEqual(sheet_ids(sheets, 2025, 1), [transaction.id])
+
+        outbox_service.process_outbox(sheets)
+        self.assertEqual(sheet_ids(sheets, 2025, 1), [])
+        self.assertEqual(sheet_ids(sheets, 2025, 2), [transaction.id])
+
+    def test_command_enqueues_the_moves(self):
+        card = CreditCard.objects.create(name="Cartão", closing_day=10, due_day=17,
+                                         limit=Decimal("1000"))
+        purchase = make_transaction(payment_method="credito", credit_card=card,
+                                    billing_year=2025, billing_month=1)
+        out = StringIO()
+
+        call_command("recompute_billing", str(card.id), stdout=out)
+
+        self.assertIn("1 transação(ões)", out.getvalue())
+        purchase.refresh_from_db()
+        self.assertEqual(purchase.billing_month, 2)
+        self.assertTrue(SheetsOutbox.objects.filter(transaction_id=purchase.id,
+                                                    operation="update").exists())
+        with self.assertRaises(CommandError):
+            call_command("recompute_billing", "999")
+
+
+@override_settings(SHEETS_BACKOFF_BASE=0, SHEETS_MAX_RETRIES=2)
+class SheetsRetryTests(SimpleTestCase):
+    VALUES = "https://sheets.googleapis.com/v4/spreadsheets/key/values"
+
+    def request(self, method, endpoint, error):
+        client = QuotaHTTPClient.__new__(QuotaHTTPClient)
+        with mock.patch("gspread.http_client.HTTPClient.request",
+                        side_effect=error) as request:
+            with self.assertRaises(type(error)):
+                client.request(method, endpoint)
+        return request.call_count
+
+    def test_append_is_not_repeated_after_timeout_or_5xx(self):
+        endpoint = f"{self.VALUES}/Jan:append"
+        self.assertEqual(self.request("post", endpoint, requests.ReadTimeout()), 1)
+        self.assertEqual(self.request("post", endpoint, api_error(503, "indisponível")), 1)
+
+    def test_row_deletion_is_not_repeated_after_5xx(self):
+        endpoint = "https://sheets.googleapis.com/v4/spreadsheets/key:batchUpdate"
+        self.assertEqual(self.request("post", endpoint, api_error(500, "erro")), 1)
+
+    def test_idempotent_calls_are_repeated(self):
+        self.assertEqual(self.request("get", f"{self.VALUES}/Jan", requests.ReadTimeout()), 3)
+        self.assertEqual(self.request("put", f"{self.VALUES}/A2", api_error(503, "erro")), 3)
+        self.assertEqual(self.request("post", f"{self.VALUES}:batchUpdate",
+                                      api_error(502, "erro")), 3)
+
+    def test_rate_limited_append_is_repeated(self):
+        endpoint = f"{self.VALUES}/Jan:append"
+        self.assertEqual(self.request("post", endpoint, api_error(429, "cota")), 3)
+
+    def test_every_attempt_is_counted_by_operation(self):
+        calls = metrics.SHEETS_CALLS.value(operation="GET values")
+        errors = metrics.SHEETS_ERRORS.value(operation="GET values")
+
+        self.request("get", f"{self.VALUES}/Jan%21A1%3AH", requests.ReadTimeout())
+
+        self.assertEqual(metrics.SHEETS_CALLS.value(operation="GET values"), calls + 3)
+        self.assertEqual(metrics.SHEETS_ERRORS.value(operation="GET values"), errors + 3)
+
+
+class MetricsTests(SimpleTestCase):
+    def test_api_operation_drops_key_and_range(self):
+        spreadsheet = "https://sheets.googleapis.com/v4/spreadsheets/key"
+        cases = [
+            ("get", spreadsheet, "GET spreadsheets"),
+            ("get", f"{spreadsheet}/values/Jan%21A1%3AH", "GET values"),
+            ("post", f"{spreadsheet}/values/Jan%21A1:append", "POST values:append"),
+            ("post", f"{spreadsheet}/values:batchUpdate", "POST values:batchUpdate"),
+            ("post", f"{spreadsheet}:batchUpdate", "POST batchUpdate"),
+            ("get", "https://www.googleapis.com/drive/v3/files", "GET files"),
+        ]
+        for method, endpoint, expected in cases:
+            with self.subTest(endpoint=endpoint):
+                self.assertEqual(api_operation(method, endpoint), expected)
+
+    def test_quota_client_counters_are_exposed_as_counters(self):
+        output = metrics.REGISTRY.render()
+        self.assertIn("# TYPE sheets_quota_client_total counter", output)
+        self.assertIn('sheets_quota_client_total{field="retries"}', output)
+
+    def test_local_backend_counts_each_call(self):
+        client = LocalClient(store=LocalStore())
+        before = metrics.SHEETS_CALLS.value(operation="add_worksheet")
+        spreadsheet = client.open("Financeiro")
+        spreadsheet.add_worksheet("01-2025", rows=10, cols=8)
+        # Atributos não são chamadas à API
+        spreadsheet.title, spreadsheet.id
+        self.assertEqual(metrics.SHEETS_CALLS.value(operation="add_worksheet"), before + 1)
+
+
+@override_settings(**TEST_SETTINGS)
+class AggregateTests(TestCase):
+    def setUp(self):
+        self.card = CreditCard.objects.create(name="Cartão", closing_day=20, due_day=27,
+                                              limit=Decimal("1000"))
+
+    def card_purchase(self, **fields):
+        transaction = Transaction(transaction_type="gasto", description="Loja",
+                                  value=Decimal("50"), payment_method="credito",
+                                  date=date(2025, 1, 15), credit_card=self.card)
+        for field, value in fields.items():
+            setattr(transaction, field, value)
+        transaction_service.assign_billing(transaction)
+        transaction.save()
+        return transaction
+
+    def assertInvoicesMatch(self):
+        expected = {(row["credit_card_id"], row["billing_year"], row["billing_month"]):
+                    (row["gastos"] - row["estornos"], row["count"])
+                    for row in invoice_service.compute_invoices()}
+        stored = {(i.credit_card_id, i.billing_year, i.billing_month): (i.total, i.count)
+                  for i in CreditCardInvoice.objects.exclude(count=0, total=0)}
+        self.assertEqual(stored, expected)
+
+    def test_signal_deltas_match_a_full_recount(self):
+        make_transaction()
+        moved = make_transaction(category="lazer", value=Decimal("30"))
+        purchase = self.card_purchase()
+        refund = self.card_purchase(transaction_type="receita", value=Decimal("20"))
+
+        moved.date, moved.category = date(2025, 3, 1), "saude"
+        moved.save()
+        purchase.value = Decimal("70")
+        purchase.date = date(2025, 1, 25)
+        transaction_service.assign_billing(purchase)
+        purchase.save()
+        refund.delete()
+
+        self.assertEqual(summary_service.verify(), [])
+        self.assertInvoicesMatch()
+        self.assertEqual(CreditCardInvoice.objects.get(billing_month=2).total, Decimal("70"))
+
+    def test_refund_reduces_the_invoice(self):
+        self.card_purchase()
+        self.card_purchase(transaction_type="receita", value=Decimal("20"))
+
+        self.assertEqual(CreditCardInvoice.objects.get().total, Decimal("30"))
+        self.assertInvoicesMatch()
+
+    def test_row_created_concurrently_receives_the_delta(self):
+        key = (2025, 1, "alimentacao", "gasto", "debito", None)
+        update = QuerySet.update
+        calls = []
+
+        def update_before_other_request(queryset, **fields):
+            if queryset.model is MonthlySummary and not calls:
+                # A linha ainda não existe no update; outra requisição a cria logo depois
+                calls.append(fields)
+                MonthlySummary.objects.create(**dict(zip(summary_service.KEY_FIELDS, key)),
+                                              total=Decimal("5"), count=1)
+                return 0
+            return update(queryset, **fields)
+
+        with mock.patch.object(QuerySet, "update", autospec=True,
+                               side_effect=update_before_other_request):
+            summary_service.apply_delta(key, Decimal("10"), 1)
+
+        summary = MonthlySummary.objects.get()
+        self.assertEqual((summary.total, summary.count), (Decimal("15"), 2))
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def card_purchase(self, card_name, value, category="outros"):
+        card, _ = CreditCard.objects.get_or_create(
+            name=card_name, defaults={"closing_day": 31, "due_day": 10, "limit": Decimal("1000")})
+        transaction = Transaction(transaction_type="gasto", description="Loja", value=value,
+                                  category=category, payment_method="credito",
+                                  date=date(2025, 1, 15), credit_card=card)
+        transaction_service.assign_billing(transaction)
+        transaction.save()
+
+    def test_summary_of_the_month(self):
+        make_transaction(transaction_type="receita", category="salario", value=Decimal("3000"))
+        make_transaction(value=Decimal("100"))
+        make_transaction(category="transporte", value=Decimal("50"))
+        self.card_purchase("Nubank", Decimal("200"), category="alimentacao")
+        self.card_purchase("Itaú", Decimal("80"))
+        # Outro mês não entra
+        make_transaction(value=Decimal("999"), date=date(2025, 2, 1))
+
+        data = dashboard_service.compute_dashboard_data(2025, 1)
+
+        self.assertEqual((data["receitas"], data["gastos"], data["saldo"]),
+                         (Decimal("3000"), Decimal("430"), Decimal("2570")))
+        self.assertEqual((data["gastos_credito"], data["gastos_debito"]),
+                         (Decimal("280"), Decimal("150")))
+        self.assertEqual(data["quantidade"], 5)
+        self.assertEqual(data["top_categorias"], [("Alimentação", Decimal("300")),
+                                                  ("Outros", Decimal("80")),
+                                                  ("Transporte", Decimal("50"))])
+        self.assertEqual(data["gastos_por_cartao"], [("Nubank", Decimal("200")),
+                                                     ("Itaú", Decimal("80"))])
+
+    def test_top_categories_keeps_the_five_largest(self):
+        for i, category in enumerate(["a", "b", "c", "d", "e", "f"], start=1):
+            make_transaction(category=category, value=Decimal(i))
+        data = dashboard_service.compute_dashboard_data(2025, 1)
+        self.assertEqual([name for name, _ in data["top_categorias"]], ["f", "e", "d", "c", "b"])
+        self.assertEqual(data["saldo"], Decimal("-21"))
+
+    def test_cache_is_invalidated_when_a_transaction_is_saved_or_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_transaction(transaction_type="receita", category="salario", value=Decimal("500"))
+        self.assertEqual(dashboard_service.get_dashboard_data(2025, 1)["saldo"], Decimal("500"))
+        with self.assertNumQueries(0):
+            dashboard_service.get_dashboard_data(2025, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            expense = make_transaction(value=Decimal("120"))
+        data = dashboard_service.get_dashboard_data(2025, 1)
+        self.assertEqual(data["saldo"], Decimal("380"))
+        self.assertEqual(data["top_categorias"], [("Alimentação", Decimal("120"))])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            expense.delete()
+        data = dashboard_service.get_dashboard_data(2025, 1)
+        self.assertEqual((data["saldo"], data["top_categorias"]), (Decimal("500"), []))
+
+    def test_change_in_another_month_keeps_the_cache(self):
+        dashboard_service.get_dashboard_data(2025, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_transaction(date=date(2025, 2, 1))
+        with self.assertNumQueries(0):
+            dashboard_service.get_dashboard_data(2025, 1)
+
+
+class ReportTests(TestCase):
+    def test_monthly_totals_match_a_plain_aggregate(self):
+        card = CreditCard.objects.create(name="Cartão", closing_day=20, due_day=27,
+                                         limit=Decimal("1000"))
+        make_transaction(value=Decimal("10.55"), date=date(2025, 1, 3))
+        make_transaction(value=Decimal("0.10"), category="transporte", date=date(2025, 1, 9))
+        make_transaction(transaction_type="receita", category="salario",
+                         value=Decimal("2500.01"), date=date(2025, 2, 5))
+        # Compra no crédito depois do fechamento vai para a aba de fevereiro
+        purchase = Transaction(transaction_type="gasto", description="Loja", value=Decimal("99.99"),
+                               category="alimentacao", payment_method="credito",
+                               date=date(2025, 1, 25), credit_card=card)
+        transaction_service.assign_billing(purchase)
+        purchase.save()
+
+        report = reports_service.build_report()
+
+        self.assertEqual(report["meses"], ["2025-01", "2025-02"])
+        for i, (year, month) in enumerate([(2025, 1), (2025, 2)]):
+            totals = dict(Transaction.objects.in_sheet_period(year, month)
+                          .values_list("transaction_type").annotate(Sum("value")))
+            self.assertEqual(Decimal(str(report["serie"]["gastos"][i])),
+                             totals.get("gasto", Decimal("0")))
+            self.assertEqual(Decimal(str(report["serie"]["receitas"][i])),
+                             totals.get("receita", Decimal("0")))
+        self.assertEqual(report["serie"]["saldo_acumulado"], [-10.65, 2389.37])
+        self.assertEqual(report["categorias"], ["Alimentação", "Salário", "Transporte"])
+        self.assertEqual(report["por_categoria"]["gastos_por_mes"],
+                         [[10.55, 99.99], [0.0, 0.0], [0.1, 0.0]])
+
+    def test_rolling_mean_uses_the_months_available_at_the_start(self):
+        self.assertEqual(reports_service.rolling_mean(np.array([3.0, 6.0, 9.0, 12.0]), 3).tolist(),
+                         [3.0, 4.5, 6.0, 9.0])
+        # Janela maior que a série: só médias parciais
+        self.assertEqual(reports_service.rolling_mean(np.array([2.0, 4.0]), 5).tolist(),
+                         [2.0, 3.0])
+
+    def test_pivot_sums_by_category_and_column(self):
+        table = reports_service.pivot(np.array([0, 1, 0]), np.array([0, 2, 2]),
+                                      np.array([1.0, 2.0, 3.0]), 2, 3)
+        self.assertEqual(table.tolist(), [[1.0, 0.0, 3.0], [0.0, 0.0, 2.0]])
+
+    def test_empty_range(self):
+        empty = {"meses": [], "anos": [], "categorias": [], "serie": {}, "por_categoria": {}}
+        self.assertEqual(reports_service.build_report(), empty)
+
+        make_transaction(date=date(2025, 1, 3))
+        start = reports_service.month_ordinal(2030, 1)
+        self.assertEqual(reports_service.build_report(start, start + 2), empty)
+
+    def test_start_and_end_clip_the_period_and_keep_empty_months(self):
+        for day, value in [(date(2024, 12, 10), "1"), (date(2025, 1, 10), "10"),
+                           (date(2025, 3, 10), "30"), (date(2025, 5, 10), "50")]:
+            make_transaction(date=day, value=Decimal(value))
+
+        report = reports_service.build_report(start=reports_service.month_ordinal(2025, 1),
+                                              end=reports_service.month_ordinal(2025, 4),
+                                              window=2)
+
+        self.assertEqual(report["meses"], ["2025-01", "2025-02", "2025-03", "2025-04"])
+        self.assertEqual(report["anos"], [2025])
+        self.assertEqual(report["serie"]["gastos"], [10.0, 0.0, 30.0, 0.0])
+        self.assertEqual(report["serie"]["saldo_acumulado"], [-10.0, -10.0, -40.0, -40.0])
+        self.assertEqual(report["serie"]["media_movel_gastos"], [10.0, 5.0, 15.0, 15.0])
+        self.assertEqual(report["por_categoria"]["media_mensal_gastos"], [10.0])
+
+
+class SelectedMonthsTests(SimpleTestCase):
+    def test_last_months_cross_the_year(self):
+        self.assertEqual(transaction_service.selected_months(2025, 2, "3"),
+                         [(2024, 12), (2025, 1), (2025, 2)])
+        self.assertEqual(len(transaction_service.selected_months(2025, 1, "12")), 12)
+        self.assertEqual(transaction_service.selected_months(2025, 1, "12")[0], (2024, 2))
+
+    def test_interval_crosses_the_year(self):
+        self.assertEqual(
+            transaction_service.selected_months(2025, 6, "intervalo", "2024-11", "2025-02"),
+            [(2024, 11), (2024, 12), (2025, 1), (2025, 2)])
+
+    def test_inverted_interval_is_put_in_order(self):
+        self.assertEqual(
+            transaction_service.selected_months(2025, 6, "intervalo", "2025-01", "2024-12"),
+            [(2024, 12), (2025, 1)])
+
+    def test_invalid_interval_falls_back_to_the_selected_month(self):
+        for mes_de, mes_ate in [("2025-13", "2025-02"), ("abc", "2025-02"), ("2025", "2025-02"),
+                                ("2025-00", "2025-02"), ("", "2025-02")]:
+            self.assertEqual(
+                transaction_service.selected_months(2025, 6, "intervalo", mes_de, mes_ate),
+                [(2025, 6)], (mes_de, mes_ate))
+        self.assertEqual(transaction_service.selected_months(2025, 6, "7"), [(2025, 6)])
+
+    def test_long_interval_keeps_the_latest_months(self):
+        months = transaction_service.selected_months(2025, 6, "intervalo", "2000-01", "2025-06")
+        self.assertEqual(len(months), transaction_service.MAX_RANGE_MONTHS)
+        self.assertEqual((months[0], months[-1]), ((2022, 7), (2025, 6)))
+
+
+@override_settings(**TEST_SETTINGS, HISTORICAL_SOURCE="sheets")
+class TransactionsRangeTests(TestCase):
+    def setUp(self):
+        self.sheets = local_sheets()
+        self.calls = self.sheets.client.store.calls
+        self.december = make_transaction(description="Natal", date=date(2024, 12, 20))
+        self.january = make_transaction(description="Ano novo", date=date(2025, 1, 2))
+        self.sheets.sync_worksheets({(2024, 12): ([self.december], ()),
+                                     (2025, 1): ([self.january], ())})
+
+    def test_range_across_the_year_is_read_in_one_call(self):
+        months = [(2024, 11), (2024, 12), (2025, 1), (2025, 2)]
+        batch_gets = self.calls["values_batch_get"]
+
+        table = self.sheets.get_transactions_range(months)
+
+        self.assertEqual([int(i) for i in table.ids], [self.december.id, self.january.id])
+        self.assertEqual(self.calls["values_batch_get"], batch_gets + 1)
+        # Meses sem aba também ficam em cache: a segunda leitura não chama a API
+        self.sheets.get_transactions_range(months)
+        self.assertEqual(self.calls["values_batch_get"], batch_gets + 1)
+
+    def test_history_view_with_an_interval(self):
+        with mock.patch("core.views.sheets_service", self.sheets):
+            response = self.client.get(reverse("historical"), {
+                "ano": 2025, "mes": 6, "periodo": "intervalo",
+                "mes_de": "2025-01", "mes_ate": "2024-12"})
+            self.assertEqual(response.context["paginator"].count, 2)
+            self.assertEqual((response.context["mes_de"], response.context["mes_ate"]),
+                             ("2024-12", "2025-01"))
+
+            # Intervalo de um mês só: lê esse mês, não o ano/mês selecionado
+            response = self.client.get(reverse("historical"), {
+                "ano": 2025, "mes": 6, "periodo": "intervalo",
+                "mes_de": "2024-12", "mes_ate": "2024-12"})
+            self.assertContains(response, "Natal")
+            self.assertNotContains(response, "Ano novo")
+
+
+@override_settings(**TEST_SETTINGS, HISTORICAL_SOURCE="db")
+class DbHistoryViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        card = CreditCard.objects.create(name="Cartão", closing_day=20, due_day=27,
+                                         limit=Decimal("1000"))
+        for i in range(12):
+            make_transaction(description=f"Mercado {i}", value=Decimal(i + 1))
+        make_transaction(description="Uber", category="transporte", value=Decimal("50"))
+        make_transaction(description="Fevereiro", date=date(2025, 2, 3))
+        # Compra depois do fechamento: fica na aba de fevereiro, não na de janeiro
+        purchase = Transaction(transaction_type="gasto", description="Loja", value=Decimal("70"),
+                               payment_method="credito", date=date(2025, 1, 25), credit_card=card)
+        transaction_service.assign_billing(purchase)
+        purchase.save()
+
+    def get(self, **params):
+        with mock.patch("core.views.sheets_service") as sheets:
+            response = self.client.get(reverse("historical"), {"ano": 2025, "mes": 1, **params})
+        self.assertFalse(sheets.method_calls)
+        return response
+
+    def descriptions(self, response):
+        return [row["descricao"] for row in response.context["page_obj"]]
+
+    def test_month_page_comes_from_the_database(self):
+        response = self.get(order_by="valor", direction="desc")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["paginator"].count, 13)
+        self.assertEqual(self.descriptions(response)[:3], ["Uber", "Mercado 11", "Mercado 10"])
+        self.assertNotContains(response, "Loja")
+
+    def test_filters_and_next_page_cursor(self):
+        first = self.get(order_by="valor", direction="asc", busca="mercado")
+        self.assertEqual(first.context["paginator"].count, 12)
+        self.assertEqual(len(self.descriptions(first)), transaction_service.PER_PAGE)
+
+        second = self.get(order_by="valor", direction="asc", busca="mercado",
+                          depois=first.context["page_obj"].next_cursor)
+        self.assertEqual(self.descriptions(second), ["Mercado 10", "Mercado 11"])
+
+        uber = self.get(categoria="transporte")
+        self.assertEqual(self.descriptions(uber), ["Uber"])
+
+    def test_range_uses_the_billing_month(self):
+        response = self.get(periodo="intervalo", mes_de="2025-02", mes_ate="2025-02")
+        self.assertEqual(sorted(self.descriptions(response)), ["Fevereiro", "Loja"])
+
+
+class BillingCycleTests(SimpleTestCase):
+    def cycle(self, closing_day, reference):
+        card = CreditCard(name="Cartão", closing_day=closing_day, due_day=5,
+                          limit=Decimal("1000"))
+        start, end = card.get_current_billing_cycle(reference)
+        return start.date(), end.date()
+
+    def test_closing_day_is_clamped_in_short_months(self):
+        self.assertEqual(self.cycle(31, date(2025, 2, 28)), (date(2025, 2, 1), date(2025, 2, 28)))
+        self.assertEqual(self.cycle(31, date(2025, 3, 1)), (date(2025, 3, 1), date(2025, 3, 31)))
+        self.assertEqual(self.cycle(30, date(2024, 2, 29)),
+                         (date(2024, 1, 31), date(2024, 2, 29)))
+        self.assertEqual(self.cycle(29, date(2025, 4, 30)), (date(2025, 4, 30), date(2025, 5, 29)))
+        self.assertEqual(self.cycle(31, date(2025, 4, 30)), (date(2025, 4, 1), date(2025, 4, 30)))
+
+    def test_cycle_crosses_the_year(self):
+        self.assertEqual(self.cycle(10, date(2025, 12, 20)),
+                         (date(2025, 12, 11), date(2026, 1, 10)))
+        self.assertEqual(self.cycle(10, date(2026, 1, 5)), (date(2025, 12, 11), date(2026, 1, 10)))
+
+    def test_shift_month_rolls_over_the_year(self):
+        self.assertEqual(CreditCard._shift_month(2025, 12, 1), (2026, 1))
+        self.assertEqual(CreditCard._shift_month(2026, 1, -1), (2025, 12))
+        self.assertEqual(CreditCard._shift_month(2025, 1, -13), (2023, 12))
+        self.assertEqual(CreditCard._shift_month(2025, 11, 14), (2027, 1))
+
+
+class CardStatementTests(TestCase):
+    def setUp(self):
+        # Fecha no dia 31 (último dia nos meses curtos) e vence no dia 10 do mês seguinte
+        self.card = CreditCard.objects.create(name="Nubank", closing_day=31, due_day=10,
+                                              limit=Decimal("1000"))
+
+    def card_purchase(self, day, value):
+        transaction = Transaction(transaction_type="gasto", description="Loja", value=value,
+                                  payment_method="credito", date=day, credit_card=self.card)
+        transaction_service.assign_billing(transaction)
+        transaction.save()
+        return transaction
+
+    def test_statement_uses_the_clamped_closing_date(self):
+        self.card_purchase(date(2025, 1, 31), Decimal("10"))
+        self.card_purchase(date(2025, 2, 28), Decimal("20"))
+        self.card_purchase(date(2025, 3, 5), Decimal("40"))
+
+        # Fevereiro fecha no dia 28: no próprio dia a fatura ainda está aberta
+        [statement] = invoice_service.card_statements([self.card], today=date(2025, 2, 28))
+        self.assertEqual(statement["fatura_aberta"].billing_month, 2)
+        self.assertEqual(statement["fatura_aberta"].closing_date, date(2025, 2, 28))
+        self.assertEqual(statement["faturas_fechadas"], [])
+        self.assertEqual(statement["limite_disponivel"], Decimal("940"))
+
+        # No dia seguinte ela fecha (vence 10/03) e a de março fica aberta
+        [statement] = invoice_service.card_statements([self.card], today=date(2025, 3, 1))
+        self.assertEqual(statement["fatura_aberta"].billing_month, 3)
+        self.assertEqual([(i.billing_month, i.due_date) for i in statement["faturas_fechadas"]],
+                         [(2, date(2025, 3, 10))])
+        self.assertEqual(statement["limite_usado"], Decimal("60"))
+
+    def test_statement_crosses_the_year(self):
+        self.card.closing_day = 10
+        self.card.save()
+        self.card_purchase(date(2025, 12, 20), Decimal("30"))
+
+        [statement] = invoice_service.card_statements([self.card], today=date(2026, 1, 5))
+        invoice = statement["fatura_aberta"]
+        self.assertEqual((invoice.billing_year, invoice.billing_month), (2026, 1))
+        self.assertEqual((invoice.closing_date, invoice.due_date),
+                         (date(2026, 1, 10), date(2026, 2, 10)))
+
+    def test_cards_page(self):
+        self.card_purchase(date.today(), Decimal("123.45"))
+        CreditCard.objects.create(name="Inativo", closing_day=5, due_day=12,
+                                  limit=Decimal("100"), active=False)
+
+        response = self.client.get(reverse("cards"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item["cartao"] for item in response.context["cartoes"]], [self.card])
+        self.assertContains(response, "Nubank")
+        self.assertNotContains(response, "Inativo")
+        self.assertContains(response, "1 lançamento(s)")
+        self.assertEqual(response.context["cartoes"][0]["limite_disponivel"], Decimal("876.55"))
+
+
+class ParseMoneyTests(SimpleTestCase):
+    def test_brazilian_and_decimal_point_formats(self):
+        cases = {
+            "R$ 1.234,56": Decimal("1234.56"), "-R$ 10,00": Decimal("-10.00"),
+            "R$\xa0-5,5": Decimal("-5.50"), "1234,5": Decimal("1234.50"),
+            "1.234": Decimal("1234.00"), "1234.56": Decimal("1234.56"),
+            "1,234.56": Decimal("1234.56"), " +7 ": Decimal("7.00"),
+            "0,005": Decimal("0.01"),
+        }
+        for text, expected in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(parse_money(text), expected)
+
+    def test_numbers_and_cents(self):
+        self.assertEqual(parse_money(0.1), Decimal("0.10"))
+        self.assertEqual(parse_money(3), Decimal("3.00"))
+        self.assertEqual(parse_money("R$ 1.234,56", cents=True), 123456)
+        self.assertEqual(parse_money(Decimal("2.345"), cents=True), 235)
+
+    def test_invalid_values_raise(self):
+        for value in ["", "R$", "abc", "1,2,3", "--1", "- R$ -1", "١٢", "12\u0664",
+                      True, None, float("nan"), Decimal("Infinity")]:
+            with self.subTest(value=value):
+                with self.assertRaises(MoneyParseError):
+                    parse_money(value)
+
+    def test_parse_many_with_default(self):
+        self.assertEqual(parse_many(["1,00", "x", "1,00"], default=None),
+                         [Decimal("1.00"), None, Decimal("1.00")])
+
+    def test_parse_date_formats(self):
+        for text in ["15/01/2025", "2025-01-15", "15-01-2025", " 15/01/2025 "]:
+            with self.subTest(text=text):
+                self.assertEqual(parse_date(text), date(2025, 1, 15))
+        with self.assertRaises(ValueError):
+            parse_date("2025/01/15")
+
+
+def sheet_record(transaction_id, description, value, day, tipo="gasto", categoria="outros"):
+    return {"ID": transaction_id, "Descrição": description, "Valor": value, "Tipo": tipo,
+            "Categoria": categoria, "Método Pagamento": "debito",
+            "Data": f"2025-01-{day:02d}"}
+
+
+class MonthTableTests(SimpleTestCase):
+    def setUp(self):
+        self.table = MonthTable.from_records([
+            sheet_record(1, "Açougue", "R$ 30,00", 10),
+            sheet_record(2, "Mercado", 12.5, 12),
+            sheet_record(3, "Farmácia", "7,90", 10, categoria="saude"),
+            sheet_record(4, "Salário", "1.000,00", 5, tipo="receita"),
+            sheet_record(5, "Padaria", "4,50", 12),
+        ])
+
+    def ids(self, rows):
+        return [row["id"] for row in rows]
+
+    def test_select_orders_by_field_and_id(self):
+        self.assertEqual(self.ids(self.table.select()), [5, 2, 3, 1, 4])
+        self.assertEqual(self.ids(self.table.select(order_by="data", direction="asc")),
+                         [4, 1, 3, 2, 5])
+        self.assertEqual(self.ids(self.table.select(order_by="valor", direction="asc")),
+                         [5, 3, 2, 1, 4])
+        self.assertEqual(self.ids(self.table.select(order_by="descricao", direction="asc")),
+                         [1, 3, 2, 5, 4])
+
+    def test_select_filters_keep_the_order(self):
+        self.assertEqual(self.ids(self.table.select(tipo="gasto", categoria="outros")),
+                         [5, 2, 1])
+        self.assertEqual(self.ids(self.table.select(busca="acougue")), [1])
+        self.assertEqual(self.ids(self.table.select(categoria="inexistente")), [])
+
+    def test_rows_are_typed(self):
+        row = self.table.select(busca="mercado")[0]
+        self.assertEqual((row["valor"], row["data"]), (Decimal("12.50"), date(2025, 1, 12)))
+
+    def test_seek_finds_the_row_after_the_cursor(self):
+        rows = self.table.select()
+        # (data, ID) da linha 2 em ordem decrescente: a próxima é a 3
+        ordinal = date(2025, 1, 12).toordinal()
+        self.assertEqual(rows.seek(ordinal, 2, after=True), 2)
+        self.assertEqual(rows.seek(ordinal, 2, after=False), 1)
+
+    def test_seek_with_a_text_that_is_no_longer_in_the_table(self):
+        rows = self.table.select(order_by="descricao", direction="asc")
+        # Cursor de uma linha editada depois: "Feira" cai entre "Farmácia" e "Mercado"
+        self.assertEqual(self.ids(rows[rows.seek("Feira", 9):]), [2, 5, 4])
+
+    def test_table_page_walks_forward_and_back_with_cursors(self):
+        rows = self.table.select()
+        first = transaction_service.table_page(rows, per_page=2)
+        second = transaction_service.table_page(
+            rows, after=transaction_service.decode_cursor(first.next_cursor, "data", "desc"),
+            per_page=2)
+        back = transaction_service.table_page(
+            rows, before=transaction_service.decode_cursor(second.previous_cursor, "data",
+                                                           "desc"),
+            per_page=2)
+
+        self.assertEqual(self.ids(first), [5, 2])
+        self.assertEqual(self.ids(second), [3, 1])
+        self.assertEqual(self.ids(back), [5, 2])
+
+
+class KeysetWindowTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Datas repetidas: o ID desempata
+        for day in (3, 1, 3, 2, 3, 1, 2):
+            make_transaction(date=date(2025, 1, day))
+
+    def walk(self, order_by, direction, per_page=3):
+        queryset = transaction_service.order_transactions(Transaction.objects.all(),
+                                                          order_by, direction)
+        pages, after = [], None
+        while True:
+            transactions, number, _, _, has_next = transaction_service.keyset_window(
+                queryset, order_by, direction, after=after, per_page=per_page)
+            pages.append([t.id for t in transactions])
+            if not has_next:
+                return queryset, pages
+            row = transaction_service.to_historical_row(transactions[-1])
+            after = transaction_service.decode_cursor(
+                transaction_service.encode_cursor(order_by, direction, row, number + 1),
+                order_by, direction)
+
+    def test_cursors_visit_every_row_once_in_order(self):
+        for order_by, direction in [("data", "desc"), ("data", "asc"), ("valor", "desc")]:
+            with self.subTest(order_by=order_by, direction=direction):
+                queryset, pages = self.walk(order_by, direction)
+                self.assertEqual([i for page in pages for i in page],
+                                 list(queryset.values_list("id", flat=True)))
+                self.assertEqual([len(page) for page in pages], [3, 3, 1])
+
+    def test_before_cursor_returns_the_previous_page(self):
+        queryset, pages = self.walk("data", "desc")
+        last = Transaction.objects.get(id=pages[2][0])
+        before = (last.date.toordinal(), last.id, 2)
+
+        transactions, number, _, has_previous, has_next = transaction_service.keyset_window(
+            queryset, "data", "desc", before=before, per_page=3)
+
+        self.assertEqual([t.id for t in transactions], pages[1])
+        self.assertEqual((number, has_previous, has_next), (2, True, True))
+
+    def test_cursor_of_another_ordering_is_ignored(self):
+        row = transaction_service.to_historical_row(Transaction.objects.first())
+        token = transaction_service.encode_cursor("data", "desc", row, 2)
+        self.assertIsNone(transaction_service.decode_cursor(token, "valor", "desc"))
+        self.assertIsNone(transaction_service.decode_cursor(token, "data", "asc"))
+        self.assertIsNone(transaction_service.decode_cursor("lixo", "data", "desc"))
+
+
+def search(busca, queryset=None):
+    queryset = Transaction.objects.all() if queryset is None else queryset
+    return sorted(search_service.matching(queryset, busca).values_list("description", flat=True))
+
+
+# Índice FTS5 só no SQLite
+ONLY_SQLITE = skipUnless(connection.vendor == "sqlite", "índice de texto só no SQLite")
+
+
+@ONLY_SQLITE
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for description in ["Açougue Central", "Alimentação escolar", "Farmácia", "Mercado"]:
+            make_transaction(description=description)
+
+    def test_search_ignores_accents_and_case(self):
+        self.assertTrue(search_service.available())
+        self.assertEqual(search("acougue"), ["Açougue Central"])
+        self.assertEqual(search("ALIMENTACAO"), ["Alimentação escolar"])
+        self.assertEqual(search("farmácia"), ["Farmácia"])
+
+    def test_every_word_is_a_prefix(self):
+        self.assertEqual(search("merc"), ["Mercado"])
+        self.assertEqual(search("açou cent"), ["Açougue Central"])
+        self.assertEqual(search("açou mercado"), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        transaction = Transaction.objects.get(description="Mercado")
+        transaction.description = "Padaria"
+        transaction.save()
+        Transaction.objects.filter(description="Farmácia").delete()
+
+        self.assertEqual(search("mercado"), [])
+        self.assertEqual(search("padaria"), ["Padaria"])
+        self.assertEqual(search("farmacia"), [])
+
+    def test_ranked_ids_respects_other_filters(self):
+        make_transaction(description="Mercado", transaction_type="receita")
+        queryset = Transaction.objects.filter(transaction_type="receita")
+        self.assertEqual(len(search_service.ranked_ids(queryset, "mercado")), 1)
+
+
+@ONLY_SQLITE
+class SearchTriggerTests(TransactionTestCase):
+    def alter_description(self, max_length):
+        old_field = Transaction._meta.get_field("description")
+        new_field = old_field.clone()
+        new_field.set_attributes_from_name("description")
+        new_field.max_length = max_length
+        with connection.schema_editor() as editor:
+            editor.alter_field(Transaction, old_field, new_field)
+        self.addCleanup(self.restore, new_field, old_field)
+
+    def restore(self, new_field, old_field):
+        with connection.schema_editor() as editor:
+            editor.alter_field(Transaction, new_field, old_field)
+        signals.restore_search_index(apps.get_app_config("core"), using="default")
+
+    def test_post_migrate_restores_triggers_dropped_by_a_table_rebuild(self):
+        self.alter_description(300)
+        # O SQLite refez a tabela: os gatilhos sumiram e a escrita não foi indexada
+        self.assertEqual(sorted(search_service.missing_triggers()),
+                         sorted(search_service.TRIGGERS))
+        make_transaction(description="Açougue")
+
+        signals.restore_search_index(apps.get_app_config("core"), using="default")
+
+        self.assertEqual(search_service.missing_triggers(), [])
+        self.assertEqual(search("acougue"), ["Açougue"])
+        make_transaction(description="Mercado")
+        self.assertEqual(search("mercado"), ["Mercado"])
+
+
+@override_settings(**TEST_SETTINGS)
+class ImportTests(TestCase):
+    def test_card_statement_refund_reduces_the_invoice(self):
+        card = CreditCard.objects.create(name="Cartão", closing_day=20, due_day=27,
+                                         limit=Decimal("1000"))
+        rows = import_service.parse_csv([
+            "data;descricao;valor",
+            "10/01/2025;Loja;-100,00",
+            "12/01/2025;Estorno Loja;40,00",
+        ])
+        sheets = local_sheets()
+
+        self.assertEqual(import_service.import_statement(rows, sheets, card), (2, []))
+
+        refund = Transaction.objects.get(description="Estorno Loja")
+        self.assertEqual((refund.transaction_type, refund.credit_card, refund.payment_method),
+                         ("receita", card, ""))
+        self.assertEqual((refund.billing_year, refund.billing_month), (2025, 1))
+        self.assertEqual(CreditCardInvoice.objects.get().total, Decimal("60.00"))
+        self.assertEqual(len(sheet_ids(sheets, 2025, 1)), 2)
+        self.assertEqual(summary_service.verify(), [])
+
+    def test_statement_without_card(self):
+        row = {"data": date(2025, 1, 10), "descricao": "Salário", "valor": Decimal("900"),
+               "tipo": "", "categoria": "", "pagamento": "debito"}
+        transaction = import_service.build_transaction(row)
+        self.assertEqual((transaction.transaction_type, transaction.payment_method,
+                          transaction.credit_card, transaction.billing_month),
+                         ("receita", "", None, None))
+
+
+@override_settings(**TEST_SETTINGS)
+class ReconcileTests(TestCase):
+    def setUp(self):
+        self.sheets = local_sheets()
+        self.first = transaction_service.save_and_enqueue(Transaction(
+            transaction_type="gasto", description="Mercado", value=Decimal("10"),
+            payment_method="debito", category="alimentacao", date=date(2025, 1, 10)))
+        self.second = transaction_service.save_and_enqueue(Transaction(
+            transaction_type="gasto", description="Farmácia", value=Decimal("20"),
+            payment_method="debito", date=date(2025, 1, 12)))
+        outbox_service.process_outbox(self.sheets)
+        self.worksheet = self.sheets.get_or_create_sheet(2025, 1)
+
+    def sheet_rows(self):
+        return [row[:7] for row in self.worksheet.values()[1:]]
+
+    def db_rows(self):
+        return [GoogleSheetsService.build_row(t)[:7]
+                for t in Transaction.objects.in_sheet_period(2025, 1).order_by("id")]
+
+    def diff(self, policy):
+        contents = self.sheets.read_worksheets([self.worksheet.title])
+        db_rows = reconcile_service.db_months([(2025, 1)])[(2025, 1)]
+        known = {str(i) for i in Transaction.objects.values_list("id", flat=True)}
+        return reconcile_service.diff_month(2025, 1, contents[self.worksheet.title], db_rows,
+                                            known, {}, policy, set())
+
+    def test_db_policy_finds_every_kind_of_difference(self):
+        self.worksheet.update("B2", [[99]])
+        self.worksheet.delete_rows(3)
+        self.worksheet.append_row([999, 5, "gasto", "Sem dono", "", "", "2025-01-20"])
+
+        diff = self.diff("db")
+
+        self.assertEqual(diff.counts(), {
+            "planilha_atualizadas": 1, "planilha_incluidas": 1, "planilha_excluidas": 1,
+            "banco_atualizadas": 0, "banco_incluidas": 0, "banco_excluidas": 0})
+        self.assertEqual(diff.sheet_deletes, [3])
+        self.assertEqual([t.id for t in diff.push_appends], [self.second.id])
+
+    def test_sheets_policy_pulls_the_sheet_into_the_database(self):
+        self.worksheet.update("B2", [[99]])
+        self.worksheet.delete_rows(3)
+        self.worksheet.append_row(["", 5, "gasto", "Feira", "", "", "2025-01-20"])
+
+        diff = self.diff("sheets")
+
+        self.assertEqual([(t.id, fields["value"]) for t, fields in diff.pull_updates],
+                         [(self.first.id, Decimal("99.00"))])
+        self.assertEqual([fields["description"] for _, fields in diff.pull_creates], ["Feira"])
+        self.assertEqual(diff.db_deletes, [self.second])
+
+    def test_reconcile_makes_the_sheet_match_the_database(self):
+        self.worksheet.update("B2", [[99]])
+        self.worksheet.delete_rows(3)
+        self.worksheet.append_row([999, 5, "gasto", "Sem dono", "", "", "2025-01-20"])
+
+        results = reconcile_service.reconcile(self.sheets, policy="db")
+
+        self.assertEqual(set(results), {(2025, 1)})
+        self.assertEqual(sorted(self.sheet_rows()), sorted(self.db_rows()))
+        self.assertEqual(reconcile_service.reconcile(self.sheets, policy="db"), {})
+
+    def test_rows_shifted_after_the_read_are_not_touched(self):
+        self.worksheet.append_row([999, 5, "gasto", "Sem dono", "", "", "2025-01-20"])
+        self.worksheet.update("B2", [[99]])
+        diff = self.diff("db")
+        # O worker da fila exclui uma linha do meio antes da escrita
+        self.sheets.sync_worksheet(2025, 1, delete_ids=[self.second.id])
+        before = self.worksheet.values()
+
+        with self.assertRaises(reconcile_service.SheetChanged):
+            reconcile_service.apply_diff(self.sheets, diff, sheet_exists=True)
+
+        self.assertEqual(self.worksheet.values(), before)
+
+    def test_pulled_date_change_recomputes_the_billing_month(self):
+        card = CreditCard.objects.create(name="Cartão", closing_day=20, due_day=27,
+                                         limit=Decimal("1000"))
+        purchase = Transaction(transaction_type="gasto", description="Loja",
+                               value=Decimal("50"), payment_method="credito",
+                               date=date(2025, 1, 15), credit_card=card)
+        transaction_service.assign_billing(purchase)
+        transaction_service.save_and_enqueue(purchase)
+        outbox_service.process_outbox(self.sheets)
+        # Na planilha, a compra passou para depois do fechamento
+        row = self.sheets.find_row(self.worksheet, purchase.id)
+        self.worksheet.update(f"G{row}", [["2025-01-25"]])
+
+        reconcile_service.reconcile(self.sheets, policy="sheets", months=[(2025, 1)])
+
+        purchase.refresh_from_db()
+        self.assertEqual((purchase.billing_year, purchase.billing_month), (2025, 2))
+        self.assertEqual(CreditCardInvoice.objects.get(count=1).billing_month, 2)
+        outbox_service.process_outbox(self.sheets)
+        self.assertEqual(sheet_ids(self.sheets, 2025, 2), [purchase.id])
+        self.assertNotIn(purchase.id, sheet_ids(self.sheets, 2025, 1))
+
+
+@override_settings(**TEST_SETTINGS)
+class TransactionApiTests(TestCase):
+    URL = "/api/transactions/"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.card = CreditCard.objects.create(name="Cartão", closing_day=20, due_day=27,
+                                             limit=Decimal("1000"))
+        for day in range(1, 8):
+            make_transaction(description=f"Compra {day}", value=Decimal(day),
+                             date=date(2025, 1, day))
+        make_transaction(description="Março", date=date(2025, 3, 5))
+
+    def get(self, url, **headers):
+        return self.client.get(url, HTTP_ACCEPT="application/json", **headers)
+
+    def test_list_walks_pages_with_cursors(self):
+        url = f"{self.URL}?ano=2025&mes=1&order_by=valor&direction=asc&page_size=3&fields=id,value"
+        values = []
+        while url:
+            data = self.get(url).json()
+            self.assertEqual(data["count"], 7)
+            self.assertEqual(set(data["results"][0]), {"id", "value"})
+            values.extend(row["value"] for row in data["results"])
+            last, url = data, data["next"]
+
+        self.assertEqual(values, [f"{day}.00" for day in range(1, 8)])
+        previous = self.get(last["previous"]).json()
+        self.assertEqual([row["value"] for row in previous["results"]],
+                         ["4.00", "5.00", "6.00"])
+
+    def test_etag_answers_304_until_the_month_changes(self):
+        url = f"{self.URL}?ano=2025&mes=1"
+        january = self.get(url)
+        march = self.get(f"{self.URL}?ano=2025&mes=3")
+
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=january["ETag"]).status_code, 304)
+
+        transaction = Transaction.objects.get(description="Compra 1")
+        response = self.client.patch(f"{self.URL}{transaction.id}/", {"description": "Feira"},
+                                     content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=january["ETag"]).status_code, 200)
+        # Outro mês: a mesma versão continua valendo
+        self.assertEqual(self.get(f"{self.URL}?ano=2025&mes=3",
+                                  HTTP_IF_NONE_MATCH=march["ETag"]).status_code, 304)
+
+    def test_create_assigns_billing_and_enqueues_the_sheet_write(self):
+        response = self.client.post(self.URL, {
+            "transaction_type": "gasto", "description": "Loja", "value": "R$ 1.234,50",
+            "payment_method": "credito", "category": "outros", "date": "2025-01-25",
+            "credit_card": self.card.id,
+        }, content_type="application/json")
+
+        self.assertEqual(response.status_code, 201, response.content)
+        data = response.json()
+        self.assertEqual((data["value"], data["billing_year"], data["billing_month"],
+                          data["credit_card_name"]), ("1234.50", 2025, 2, "Cartão"))
+        entry = SheetsOutbox.objects.get(transaction_id=data["id"])
+        self.assertEqual((entry.operation, entry.year, entry.month), ("save", 2025, 2))
+        self.assertEqual(CreditCardInvoice.objects.get().total, Decimal("1234.50"))
+
+    def test_invalid_values_are_rejected(self):
+        response = self.client.post(self.URL, {
+            "transaction_type": "gasto", "value": "١٢", "date": "2025-01-01",
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("value", response.json())
+        self.assertEqual(self.get(f"{self.URL}?ano=x&mes=1").status_code, 400)
+
+    def test_update_moving_the_month_enqueues_the_old_tab(self):
+        transaction = Transaction.objects.get(description="Compra 2")
+        response = self.client.patch(f"{self.URL}{transaction.id}/", {"date": "2025-02-10"},
+                                     content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        entry = SheetsOutbox.objects.get(transaction_id=transaction.id)
+        self.assertEqual((entry.operation, entry.old_year, entry.old_month, entry.year,
+                          entry.month), ("update", 2025, 1, 2025, 2))
+        self.assertEqual(summary_service.verify(), [])
+
+        sheets = local_sheets()
+        outbox_service.process_outbox(sheets)
+        self.assertEqual(sheet_ids(sheets, 2025, 2), [transaction.id])
+
+
+@override_settings(**TEST_SETTINGS)
+class CardApiTests(TestCase):
+    def test_closing_day_change_moves_purchases_and_delete_deactivates(self):
+        card = CreditCard.objects.create(name="Cartão", closing_day=20, due_day=27,
+                                         limit=Decimal("1000"))
+        purchase = make_transaction(payment_method="credito", credit_card=card,
+                                    billing_year=2025, billing_month=1)
+
+        response = self.client.patch(f"/api/cards/{card.id}/", {"closing_day": 10},
+                                     content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        purchase.refresh_from_db()
+        self.assertEqual((purchase.billing_year, purchase.billing_month), (2025, 2))
+        self.assertTrue(SheetsOutbox.objects.filter(transaction_id=purchase.id,
+                                                    operation="update").exists())
+
+        self.assertEqual(self.client.delete(f"/api/cards/{card.id}/").status_code, 204)
+        card.refresh_from_db()
+        self.assertFalse(card.active)
+
+
+@ONLY_SQLITE
+@override_settings(**TEST_SETTINGS)
+class BenchmarkTests(TestCase):
+    def test_every_benchmark_runs_and_the_database_is_rolled_back(self):
+        out = StringIO()
+        call_command("benchmark", sizes="40", repeat=1, stdout=out)
+
+        for name, _, _ in benchmarks.BENCHMARKS:
+            self.assertIn(name, out.getvalue())
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(SheetsOutbox.objects.exists())
+
+    def test_compare_flags_slower_medians(self):
+        previous = [{"name": "a", "size": 10, "median": 1.0},
+                    {"name": "b", "size": 10, "median": 1.0}]
+        current = [{"name": "a", "size": 10, "median": 1.05},
+                   {"name": "b", "size": 10, "median": 1.5},
+                   {"name": "c", "size": 10, "median": 1.0}]
+        self.assertEqual(benchmarks.compare(current, previous),
+                         [("a", 10, 1.0, 1.05, 1.05, False), ("b", 10, 1.0, 1.5, 1.5, True)])
@@ -1,21 +1,33 @@
-from django.urls import path
+from django.urls import include, path
+from rest_framework.routers import DefaultRouter
 
-from core import views
+from core import api, views
+
+router = DefaultRouter()
+router.register('transactions', api.TransactionViewSet, basename='api-transaction')
+router.register('cards', api.CreditCardViewSet, basename='api-card')
 
 
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
     path('new-transaction/', views.new_trasaction, name='new_transaction'),
     path('transaction/create/', views.create_transaction, name='criar_transacao'),
+    path('transaction/import/', views.import_transactions, name='import_transactions'),
 
     path("historical/", views.historical, name="historical"),
+    path("historical/export/", views.export_transactions, name="export_transactions"),
     path("transaction/<int:id>/edit/", views.edit_transaction, name="edit_transaction"),
     path("transaction/<int:id>/delete/", views.delete_transaction, name="delete_transaction"),
 
     path('reports/', views.reports, name='reports'),
+    path('reports/data/', views.reports_data, name='reports_data'),
 
     path('cards/', views.cards, name='cards'),
     path('cards/create/', views.create_card, name='create_card'),
     path('cards/<int:id>/edit/', views.edit_card, name='edit_card'),
     path('cards/<int:id>/delete/', views.delete_card, name='delete_card'),
+
+    path('metrics', views.metrics_view, name='metrics'),
+
+    path('api/', include(router.urls)),
 ]
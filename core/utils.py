@@ -1,17 +1,118 @@
-def limpar_mascara_moeda(valor):
+import math
+import re
+import unicodedata
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
+
+CENTS = Decimal("0.01")
+
+# Formatos de data aceitos em extratos e na planilha
+DATE_FORMATS = ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y")
+
+# Valor em reais: sinal e "R$" opcionais, depois o formato brasileiro ("1.234,56",
+# "1234,5") ou, se não servir, o com ponto decimal ("1234.56", "1,234.56"). Milhares
+# só em grupos de 3; "1.234" é milhar. Dígitos só ASCII ([0-9], não \d: "١٢" não é
+# valor); \s continua aceitando o espaço não separável que vem de planilhas
+MONEY = re.compile(r"""
+    \s*(?P<sign>[-+]?)\s*(?:R\$)?\s*(?P<sign2>[-+]?)\s*
+    (?:
+        (?P<br_int>[0-9]{1,3}(?:\.[0-9]{3})+|[0-9]*)(?:,(?P<br_frac>[0-9]+))?
+      | (?P<us_int>[0-9]{1,3}(?:,[0-9]{3})+|[0-9]*)(?:\.(?P<us_frac>[0-9]+))?
+    )
+    \s*
+""", re.VERBOSE)
+
+_RAISE = object()
+
+
+class MoneyParseError(ValueError):
+    """Valor que não é um número nem um valor em reais reconhecível"""
+
+
+def parse_money(value, cents=False):
     """
-    Converte valor formatado (R$ 1.234,56) para float (1234.56)
+    Converte um valor em reais para Decimal com 2 casas (ou centavos inteiros, com
+    cents=True). Aceita números e textos como "R$ 1.234,56", "-R$ 10,00", "1234,56"
+    ou "1234.56" (número vindo da planilha), lendo o texto uma vez só. Qualquer
+    outra coisa gera MoneyParseError, em vez de virar 0.
     """
-    if isinstance(valor, (int, float)):
-        return float(valor)
+    if isinstance(value, str):
+        sign, integer, fraction = _parse_text(value)
+        if len(fraction) <= 2:
+            # Caso comum (até 2 casas): monta o resultado direto, sem arredondar
+            fraction = fraction.ljust(2, "0")
+            if cents:
+                return int(f"{sign}{integer}{fraction}")
+            return Decimal(f"{sign}{integer}.{fraction}")
+        amount = Decimal(f"{sign}{integer}.{fraction}")
+    elif isinstance(value, bool):
+        raise MoneyParseError(f"Valor inválido: {value!r}")
+    elif isinstance(value, Decimal):
+        amount = value
+    elif isinstance(value, int):
+        amount = Decimal(value)
+    elif isinstance(value, float):
+        if not math.isfinite(value):
+            raise MoneyParseError(f"Valor inválido: {value!r}")
+        # repr é o menor texto que representa o float: 0.1 vira "0.1", não 0.1000...055
+        amount = Decimal(repr(value))
+    else:
+        raise MoneyParseError(f"Valor inválido: {value!r}")
+
+    if not amount.is_finite():
+        raise MoneyParseError(f"Valor inválido: {value!r}")
+    amount = amount.quantize(CENTS, rounding=ROUND_HALF_UP)
+    return int(amount * 100) if cents else amount
+
+
+def parse_many(values, cents=False, default=_RAISE):
+    """
+    parse_money para muitos valores (importação, ordenação). Textos repetidos são
+    convertidos uma vez só. Com `default`, valores inválidos viram esse valor em vez
+    de gerar MoneyParseError.
+    """
+    parsed = {}
+    results = []
+    for value in values:
+        key = (type(value), value)
+        if key not in parsed:
+            try:
+                parsed[key] = parse_money(value, cents=cents)
+            except MoneyParseError:
+                if default is _RAISE:
+                    raise
+                parsed[key] = default
+        results.append(parsed[key])
+    return results
+
+
+def _parse_text(text):
+    """Valida e lê o texto num único passo da expressão MONEY: (sinal, inteiro, decimais)"""
+    match = MONEY.fullmatch(text)
+    if match is None:
+        raise MoneyParseError(f"Valor inválido: {text!r}")
+
+    sign, sign2, br_int, br_frac, us_int, us_frac = match.groups()
+    if br_int is not None:
+        integer, fraction = br_int.replace(".", ""), br_frac or ""
+    else:
+        integer, fraction = us_int.replace(",", ""), us_frac or ""
+    if (sign and sign2) or not (integer or fraction):
+        raise MoneyParseError(f"Valor inválido: {text!r}")
+    return (sign or sign2).replace("+", ""), integer or "0", fraction
+
 
-    # Remove R$, pontos e espaços
-    valor_limpo = valor.replace('R$', '').replace('.', '').replace(' ', '').strip()
+def parse_date(value):
+    """Converte uma data em texto (DATE_FORMATS) para date; ValueError se não servir"""
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Data inválida: {value}")
 
-    # Substitui vírgula por ponto para converter para float
-    valor_limpo = valor_limpo.replace(',', '.')
 
-    try:
-        return float(valor_limpo)
-    except ValueError:
-        return 0.0
\ No newline at end of file
+def fold_text(text):
+    """Texto para comparar em buscas: sem acentos e sem diferenciar maiúsculas"""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
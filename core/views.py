@@ -1,13 +1,22 @@
+import io
 from datetime import datetime
 
-from django.core.paginator import Paginator
-from django.shortcuts import render, redirect, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, render, redirect, get_object_or_404
 from django.contrib import messages
 from core.models import Transaction, CreditCard
+from core.services import (billing_service, dashboard_service, export_service,
+                           import_service, invoice_service, metrics, outbox_service,
+                           reports_service, sheets_pool, transaction_service,
+                           version_service)
 from core.services.sheets_service import GoogleSheetsService
-from core.utils import limpar_mascara_moeda
+from core.utils import MoneyParseError, parse_money
 
 sheets_service = GoogleSheetsService()
+outbox_worker = outbox_service.OutboxWorker(sheets_service)
 
 # mapeia o valor do front -> nome legível no banco
 CATEGORY_MAP = {
@@ -20,7 +29,7 @@ CATEGORY_MAP = {
 }
 
 
-def create_transaction(request):
+async def create_transaction(request):
     if request.method == "POST":
         tipo = request.POST.get("tipo")
         descricao = request.POST.get("descricao")
@@ -39,9 +48,11 @@ def create_transaction(request):
         # normaliza método de pagamento: só se for gasto
         payment_method = metodo if (tipo == 'gasto') else ''
 
-        print(f"Valor recebido do form: {valor}")
-        valor = limpar_mascara_moeda(valor)
-        print(f"Valor convertido para float: {valor}")
+        try:
+            valor = parse_money(valor)
+        except MoneyParseError:
+            messages.error(request, "Valor inválido.")
+            return redirect('new_transaction')
 
         # Verifica se é transação de crédito e determina o mês de faturamento
         billing_month = None
@@ -49,11 +60,11 @@ def create_transaction(request):
         credit_card = None
 
         if metodo == 'credito' and cartao_id:
-            credit_card = CreditCard.objects.get(id=cartao_id)
+            credit_card = await CreditCard.objects.aget(id=cartao_id)
             billing_month, billing_year = credit_card.get_billing_month_for_date(data)
 
-        # cria a transação
-        transaction = Transaction.objects.create(
+        # cria a transação e enfileira o envio para o Google Sheets (no mês correto)
+        transaction = Transaction(
             transaction_type=tipo,
             description=descricao or '',
             value=valor,
@@ -64,33 +75,34 @@ def create_transaction(request):
             billing_month=billing_month,
             billing_year=billing_year
         )
-
-        # Salva no Google Sheets no mês correto
-        if billing_month and billing_year:
-            sheets_service.save_transaction(transaction, billing_year, billing_month)
-        else:
-            sheets_service.save_transaction(transaction)
+        await sync_to_async(transaction_service.save_and_enqueue)(
+            transaction, 'save', on_commit=outbox_worker.wake)
 
         messages.success(request, "Transação criada com sucesso!")
         return redirect('new_transaction')
 
     # GET - Busca cartões ativos
-    cartoes = CreditCard.objects.filter(active=True)
-    return render(request, 'new_transaction.html', {'cartoes': cartoes})
+    return render(request, 'new_transaction.html', {'cartoes': await active_cards()})
 
 
-def edit_transaction(request, id):
-    transacao = get_object_or_404(Transaction, id=id)
+async def edit_transaction(request, id):
+    # Cartão junto (select_related): o template acessa transacao.credit_card. As duas
+    # consultas rodam em sequência: o ORM assíncrono usa uma única thread do banco
+    transacao = await aget_object_or_404(Transaction.objects.select_related('credit_card'),
+                                         id=id)
+    cartoes = await active_cards()
 
-    # Salva os dados antigos para comparar depois
-    old_date = transacao.date
-    old_payment_method = transacao.payment_method
-    old_credit_card = transacao.credit_card
+    # Guarda a aba onde a transação está hoje, caso precise mudar de mês
+    old_period = transacao.get_sheet_period()
 
     if request.method == "POST":
         # Atualiza no banco Django
+        try:
+            transacao.value = parse_money(request.POST.get("valor"))
+        except MoneyParseError:
+            messages.error(request, "Valor inválido.")
+            return redirect('edit_transaction', id=id)
         transacao.description = request.POST.get("descricao")
-        transacao.value = limpar_mascara_moeda(request.POST.get("valor"))
 
         nova_data = datetime.strptime(request.POST.get("data"), "%Y-%m-%d").date()
         transacao.date = nova_data
@@ -102,7 +114,7 @@ def edit_transaction(request, id):
         # Atualiza cartão de crédito e mês de faturamento
         cartao_id = request.POST.get("cartao_credito")
         if cartao_id:
-            transacao.credit_card = CreditCard.objects.get(id=cartao_id)
+            transacao.credit_card = await CreditCard.objects.aget(id=cartao_id)
             # Recalcula o mês de faturamento baseado na nova data
             billing_month, billing_year = transacao.credit_card.get_billing_month_for_date(
                 nova_data)
@@ -113,78 +125,80 @@ def edit_transaction(request, id):
             transacao.billing_month = None
             transacao.billing_year = None
 
-        transacao.save()
-
-        # Determina se precisa mover a transação entre planilhas
-        precisa_mover = False
-        old_year, old_month = old_date.year, old_date.month
-        new_year, new_month = nova_data.year, nova_data.month
-
-        # Se é transação de crédito, usa o mês de faturamento
-        if transacao.payment_method == 'credito' and transacao.credit_card:
-            new_year, new_month = transacao.billing_year, transacao.billing_month
-            # Para crédito, sempre verifica se o mês de faturamento mudou
-            precisa_mover = True
-
-        # Para débito ou mudança de ano/mês, verifica se a data mudou significativamente
-        elif (old_year != new_year or old_month != new_month):
-            precisa_mover = True
-
-        # Se o método de pagamento mudou (de crédito para débito ou vice-versa)
-        if old_payment_method != transacao.payment_method:
-            precisa_mover = True
-
-        if precisa_mover:
-            # Move a transação para a planilha correta
-            if sheets_service.move_transaction(transacao, old_year, old_month, new_year,
-                                               new_month):
-                messages.success(request, "Transação atualizada e movida para o mês correto!")
-            else:
-                messages.error(request,
-                               "Transação atualizada, mas houve erro ao mover entre planilhas.")
-        else:
-            # Apenas atualiza a transação na planilha atual
-            if sheets_service.update_transaction(transacao):
-                messages.success(request, "Transação atualizada com sucesso!")
-            else:
-                messages.error(request, "Erro ao atualizar transação no Google Sheets.")
+        # Grava no banco e enfileira a atualização (ou mudança de aba) no Google Sheets
+        await sync_to_async(transaction_service.save_and_enqueue)(
+            transacao, 'update', old_period=old_period, on_commit=outbox_worker.wake)
 
+        messages.success(request, "Transação atualizada com sucesso!")
         return redirect("historical")
 
-    # GET - Busca cartões ativos para o formulário
-    cartoes = CreditCard.objects.filter(active=True)
-
     return render(request, "edit_transaction.html", {
         "transacao": transacao,
         "cartoes": cartoes
     })
 
 
-def delete_transaction(request, id):
-    transacao = get_object_or_404(Transaction, id=id)
+async def delete_transaction(request, id):
+    transacao = await aget_object_or_404(Transaction, id=id)
 
     if request.method == "POST":
-        # Salva os dados antes de deletar para usar no Google Sheets
-        transaction_id = transacao.id
-        year = transacao.date.year
-        month = transacao.date.month
+        # Enfileira a exclusão na aba onde a transação está (mês de fatura no crédito)
+        await sync_to_async(transaction_service.delete_and_enqueue)(
+            transacao, on_commit=outbox_worker.wake)
 
-        # Deleta do banco Django
-        transacao.delete()
-
-        # Deleta do Google Sheets
-        if sheets_service.delete_transaction(transaction_id, year, month):
-            messages.success(request, "Transação excluída com sucesso!")
-        else:
-            messages.error(request, "Erro ao excluir transação do Google Sheets.")
+        messages.success(request, "Transação excluída com sucesso!")
 
         return redirect("historical")
 
     return render(request, "delete_transaction.html", {"transacao": transacao})
 
 
+async def active_cards():
+    """Cartões ativos, lidos com o ORM assíncrono"""
+    return [cartao async for cartao in CreditCard.objects.filter(active=True)]
+
+
+def import_transactions(request):
+    if request.method == "POST":
+        arquivo = request.FILES.get("arquivo")
+        cartao_id = request.POST.get("cartao_credito")
+
+        if not arquivo:
+            messages.error(request, "Selecione um arquivo CSV ou OFX.")
+            return redirect('import_transactions')
+
+        credit_card = CreditCard.objects.get(id=cartao_id) if cartao_id else None
+
+        # Lê o arquivo enviado como texto, linha a linha, sem carregar tudo na memória
+        lines = io.TextIOWrapper(arquivo.file, encoding="utf-8-sig", errors="replace",
+                                 newline="")
+        try:
+            imported, failed = import_service.import_statement(
+                import_service.parse_statement(lines, arquivo.name),
+                sheets_service,
+                credit_card=credit_card,
+            )
+        except ValueError as e:
+            messages.error(request, f"Erro ao importar extrato: {e}")
+            return redirect('import_transactions')
+
+        if failed:
+            outbox_worker.wake()
+            messages.warning(request, f"{imported} transações importadas. Alguns meses serão "
+                                      f"enviados ao Google Sheets em instantes.")
+        else:
+            messages.success(request, f"{imported} transações importadas com sucesso!")
+        return redirect('import_transactions')
+
+    cartoes = CreditCard.objects.filter(active=True)
+    return render(request, 'import_transactions.html', {'cartoes': cartoes})
+
+
 def dashboard(request):
-    return render(request, 'dashboard.html')
+    now = datetime.now()
+    return render(request, 'dashboard.html', {
+        'resumo': dashboard_service.get_dashboard_data(now.year, now.month),
+    })
 
 
 def new_trasaction(request):
@@ -192,7 +206,7 @@ def new_trasaction(request):
     return render(request, 'new_transaction.html', {'cartoes': cartoes})
 
 
-def historical(request):
+async def historical(request):
     from datetime import datetime
     now = datetime.now()
 
@@ -214,63 +228,78 @@ def historical(request):
     if ano < 2000 or ano > 2100:
         ano = now.year
 
-    # Busca transações do mês/ano selecionado
-    transactions = sheets_service.get_transactions(ano, mes)
-
     # aplica filtros adicionais
     busca = request.GET.get("busca")
     tipo = request.GET.get("tipo")
     categoria = request.GET.get("categoria")
     pagamento = request.GET.get("pagamento")
 
-    # parâmetros de ordenação
-    order_by = request.GET.get("order_by", "data")
-    direction = request.GET.get("direction", "desc")
-
-    if busca:
-        transactions = [t for t in transactions if
-                        busca and busca.lower() in str(t.get("descricao", "")).lower()]
-    if tipo and tipo != "todos":
-        transactions = [t for t in transactions if t.get("tipo") == tipo]
-    if categoria and categoria != "todas":
-        transactions = [t for t in transactions if t.get("categoria") == categoria]
-    if pagamento and pagamento != "todos":
-        transactions = [t for t in transactions if t.get("pagamento") == pagamento]
-
-    # função de ordenação personalizada para valor
-    def get_sort_key(item, field):
-        if field == 'valor':
-            # Remove "R$" e converte para float para ordenação numérica
-            valor_str = str(item.get('valor', '0')).replace('R$', '').replace('.', '').replace(',',
-                                                                                               '.').strip()
-            try:
-                return float(valor_str)
-            except ValueError:
-                return 0.0
-        elif field == 'data':
-            # Converte string de data para objeto datetime para ordenação correta
-            data_str = item.get('data', '')
-            try:
-                return datetime.strptime(data_str, '%d/%m/%Y')
-            except ValueError:
-                return datetime.min
-        else:
-            return item.get(field, '')
+    # período: só o mês selecionado, os últimos 3/6/12 meses ou um intervalo
+    periodo = request.GET.get("periodo", "")
+    mes_de = request.GET.get("mes_de", "")
+    mes_ate = request.GET.get("mes_ate", "")
+    meses = transaction_service.selected_months(ano, mes, periodo, mes_de, mes_ate)
 
-    # aplica ordenação
-    reverse = direction == 'desc'
-    transactions.sort(key=lambda x: get_sort_key(x, order_by), reverse=reverse)
+    # busca pela descrição em todo o histórico (sem período), pelo índice de texto
+    todo_historico = bool(busca) and request.GET.get("escopo") == "tudo"
+
+    # parâmetros de ordenação (a busca em todo o histórico começa pelos mais relevantes)
+    relevance = transaction_service.RELEVANCE
+    order_by = request.GET.get("order_by", relevance if todo_historico else "data")
+    direction = request.GET.get("direction", "asc" if order_by == relevance else "desc")
+    if order_by == relevance and not todo_historico:
+        order_by = "data"
 
     # mantém os parâmetros de filtro na paginação
     params = request.GET.copy()
-    if 'page' in params:
-        del params['page']
+    for key in ("page", "antes", "depois"):
+        params.pop(key, None)
     query_string = params.urlencode()
-
-    # paginação
-    paginator = Paginator(transactions, 10)  # 10 por página
     page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+
+    # cursores das páginas vizinhas (ou ?page= para ir direto a uma página)
+    after = transaction_service.decode_cursor(request.GET.get("depois"), order_by, direction)
+    before = transaction_service.decode_cursor(request.GET.get("antes"), order_by, direction)
+
+    if todo_historico:
+        # Sempre no banco: ler todas as abas do Sheets para uma busca seria caro demais
+        page_obj = await sync_to_async(transaction_service.search_page)(
+            busca, page_number, tipo, categoria, pagamento, order_by, direction, after, before)
+        return render_historical(request, page_obj, order_by, direction, query_string, ano, mes,
+                                 meses, todo_historico)
+
+    if getattr(settings, "HISTORICAL_SOURCE", "sheets") == "db":
+        # Filtros, ordenação e cursor feitos pelo banco; só a página é convertida
+        page_obj = await sync_to_async(transaction_service.historical_page)(
+            meses, page_number, busca, tipo, categoria, pagamento, order_by, direction,
+            after, before)
+        return render_historical(request, page_obj, order_by, direction, query_string, ano, mes,
+                                 meses)
+
+    # Busca transações do período (chamadas ao Google Sheets fora do event loop); vários
+    # meses são lidos juntos, numa única chamada para os que não estão em cache. As versões
+    # dos meses (que validam o cache) são lidas antes, aqui, e não nas threads do pool
+    versions = await sync_to_async(version_service.versions)(meses)
+    if len(meses) == 1:
+        transactions = await sheets_pool.run(sheets_service.get_transactions, *meses[0],
+                                             versions[meses[0]])
+    else:
+        transactions = await sheets_pool.run(sheets_service.get_transactions_range, meses,
+                                             versions)
+
+    # filtros na ordenação já calculada do mês; só as linhas da página são montadas
+    transactions = transactions.select(busca, tipo, categoria, pagamento, order_by, direction)
+    page_obj = transaction_service.table_page(transactions, order_by, direction, after, before,
+                                              page_number)
+
+    return render_historical(request, page_obj, order_by, direction, query_string, ano, mes,
+                             meses)
+
+
+def render_historical(request, page_obj, order_by, direction, query_string, ano, mes,
+                      meses=None, todo_historico=False):
+    now = datetime.now()
+    meses = meses or [(ano, mes)]
 
     # Gera lista de anos disponíveis (últimos 10 anos + próximos 2)
     anos_disponiveis = list(range(now.year - 0, now.year + 2))
@@ -280,13 +309,18 @@ def historical(request):
         "historical.html",
         {
             "transactions": page_obj,
-            "paginator": paginator,
+            "paginator": page_obj.paginator,
             "page_obj": page_obj,
             "order_by": order_by,
             "direction": direction,
             "query_string": query_string,
             "ano_selecionado": ano,
             "mes_selecionado": mes,
+            "periodo": request.GET.get("periodo", ""),
+            "mes_de": f"{meses[0][0]}-{meses[0][1]:02d}",
+            "mes_ate": f"{meses[-1][0]}-{meses[-1][1]:02d}",
+            "varios_meses": len(meses) > 1,
+            "todo_historico": todo_historico,
             "anos_disponiveis": anos_disponiveis,
             "meses_disponiveis": [
                 (1, "Janeiro"), (2, "Fevereiro"), (3, "Março"),
@@ -298,17 +332,104 @@ def historical(request):
     )
 
 
+def export_transactions(request):
+    """
+    Exporta as transações filtradas em CSV (gerado sob demanda) ou XLSX.
+    Aceita ?de=AAAA-MM-DD&ate=AAAA-MM-DD ou o período do histórico (ano/mes e
+    periodo/mes_de/mes_ate), mais os mesmos filtros do histórico.
+    """
+    def parse_date(value):
+        try:
+            return datetime.strptime(value, "%Y-%m-%d").date()
+        except (TypeError, ValueError):
+            return None
+
+    de = parse_date(request.GET.get("de"))
+    ate = parse_date(request.GET.get("ate"))
+
+    transactions = Transaction.objects.all()
+    if de or ate:
+        if de:
+            transactions = transactions.filter(date__gte=de)
+        if ate:
+            transactions = transactions.filter(date__lte=ate)
+    elif request.GET.get("ano") and request.GET.get("mes"):
+        try:
+            meses = transaction_service.selected_months(
+                int(request.GET["ano"]), int(request.GET["mes"]), request.GET.get("periodo"),
+                request.GET.get("mes_de"), request.GET.get("mes_ate"))
+            transactions = transactions.in_sheet_range(meses[0], meses[-1])
+        except ValueError:
+            pass
+
+    transactions = transaction_service.filter_transactions(
+        transactions,
+        busca=request.GET.get("busca"),
+        tipo=request.GET.get("tipo"),
+        categoria=request.GET.get("categoria"),
+        pagamento=request.GET.get("pagamento"),
+    )
+
+    # No ASGI o conteúdo precisa ser um iterador assíncrono para sair em blocos
+    if request.GET.get("formato") == "xlsx":
+        output = export_service.write_xlsx(transactions)
+        if not isinstance(request, ASGIRequest):
+            return FileResponse(output, as_attachment=True, filename="transacoes.xlsx")
+        size = output.seek(0, io.SEEK_END)
+        output.seek(0)
+        return StreamingHttpResponse(
+            export_service.aiter_file(output),
+            content_type=export_service.XLSX_CONTENT_TYPE,
+            headers={"Content-Disposition": 'attachment; filename="transacoes.xlsx"',
+                     "Content-Length": str(size)},
+        )
+
+    if isinstance(request, ASGIRequest):
+        content = export_service.aiter_csv(transactions)
+    else:
+        content = export_service.iter_csv(transactions)
+    return StreamingHttpResponse(
+        content,
+        content_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": 'attachment; filename="transacoes.csv"'},
+    )
+
+
 def reports(request):
     return render(request, 'reports.html')
 
 
+def reports_data(request):
+    """Dados dos relatórios em JSON (?de=AAAA-MM&ate=AAAA-MM&janela=3)"""
+    def parse_month(value):
+        try:
+            year, month = (int(part) for part in value.split("-"))
+            return reports_service.month_ordinal(year, month)
+        except (AttributeError, ValueError):
+            return None
+
+    try:
+        window = max(1, int(request.GET.get("janela", 3)))
+    except ValueError:
+        window = 3
+
+    report = reports_service.build_report(
+        start=parse_month(request.GET.get("de")),
+        end=parse_month(request.GET.get("ate")),
+        window=window,
+    )
+    return JsonResponse(report)
+
+
 # def cards(request):
 #     return render(request, 'cards.html')
 
 
 def cards(request):
     cartoes = CreditCard.objects.filter(active=True)
-    return render(request, 'cards.html', {'cartoes': cartoes})
+    return render(request, 'cards.html', {
+        'cartoes': invoice_service.card_statements(cartoes),
+    })
 
 
 def create_card(request):
@@ -316,15 +437,13 @@ def create_card(request):
         name = request.POST.get('name')
         closing_day = int(request.POST.get('closing_day'))
         due_day = int(request.POST.get('due_day'))
-        limit = request.POST.get('limit').replace('R$', '').replace('.', '').replace(',',
-                                                                                     '.').strip()
 
         try:
             CreditCard.objects.create(
                 name=name,
                 closing_day=closing_day,
                 due_day=due_day,
-                limit=float(limit)
+                limit=parse_money(request.POST.get('limit'))
             )
             messages.success(request, 'Cartão criado com sucesso!')
         except Exception as e:
@@ -339,14 +458,29 @@ def edit_card(request, id):
     cartao = get_object_or_404(CreditCard, id=id)
 
     if request.method == 'POST':
+        try:
+            limit = parse_money(request.POST.get('limit'))
+        except MoneyParseError:
+            messages.error(request, 'Limite inválido.')
+            return render(request, 'edit_card.html', {'cartao': cartao})
+
+        old_closing_day = cartao.closing_day
         cartao.name = request.POST.get('name')
         cartao.closing_day = int(request.POST.get('closing_day'))
         cartao.due_day = int(request.POST.get('due_day'))
-        limit = request.POST.get('limit').replace('R$', '').replace('.', '').replace(',',
-                                                                                     '.').strip()
-        cartao.limit = float(limit)
+        cartao.limit = limit
         cartao.save()
 
+        if cartao.closing_day != old_closing_day:
+            # Novo fechamento: as compras antigas podem mudar de mês de fatura
+            moved = billing_service.recompute_billing(cartao)
+            outbox_worker.wake()
+            if moved:
+                messages.info(request, f'{moved} transação(ões) mudaram de mês de fatura.')
+        else:
+            # O vencimento pode ter mudado: refaz as datas das faturas
+            invoice_service.rebuild(cartao)
+
         messages.success(request, 'Cartão atualizado com sucesso!')
         return redirect('cards')
 
@@ -362,4 +496,12 @@ def delete_card(request, id):
         messages.success(request, 'Cartão excluído com sucesso!')
         return redirect('cards')
 
-    return render(request, 'delete_card.html', {'cartao': cartao})
\ No newline at end of file
+    return render(request, 'delete_card.html', {'cartao': cartao})
+
+
+def metrics_view(request):
+    """Métricas no formato texto do Prometheus (latência, banco, Sheets e caches)"""
+    if not getattr(settings, "METRICS_ENABLED", True):
+        raise Http404
+    return HttpResponse(metrics.REGISTRY.render(),
+                        content_type="text/plain; version=0.0.4; charset=utf-8")
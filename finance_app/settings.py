@@ -37,10 +37,12 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'rest_framework',
     'core',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -121,3 +123,66 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Google Sheets
+# Chave (ID) da planilha "Financeiro"; se vazia, a planilha é procurada pelo nome
+SHEETS_SPREADSHEET_KEY = None
+
+# Tempo (em segundos) que as transações de um mês ficam em cache e quantos meses manter
+SHEETS_CACHE_TTL = 300
+SHEETS_CACHE_MAX_MONTHS = 24
+
+# Fila de envio para o Google Sheets: "thread" processa dentro do próprio servidor,
+# "command" deixa para o comando process_sheets_outbox
+SHEETS_OUTBOX_WORKER = "thread"
+SHEETS_OUTBOX_MAX_ATTEMPTS = 8
+SHEETS_OUTBOX_RETRY_BASE = 5
+
+# Segundos até uma operação reservada por um worker que parou voltar para a fila
+SHEETS_OUTBOX_CLAIM_TIMEOUT = 300
+
+# Origem dos dados da página de histórico: "sheets" (abas do Google Sheets) ou
+# "db" (filtros, ordenação e paginação feitos pelo banco)
+HISTORICAL_SOURCE = "sheets"
+
+# Tempo (em segundos) que os indicadores do dashboard ficam no cache
+DASHBOARD_CACHE_TTL = 60
+
+# Conciliação planilha x banco: quem manda quando os dois lados divergem
+# ("db", "sheets" ou "merge") e intervalo do modo periódico, em segundos
+SHEETS_RECONCILE_POLICY = "db"
+SHEETS_RECONCILE_INTERVAL = 24 * 60 * 60
+
+# Threads para as chamadas ao Google Sheets feitas pelas views assíncronas (limita
+# quantas chamadas à API ficam em andamento ao mesmo tempo)
+SHEETS_THREAD_POOL_SIZE = 8
+
+# Cotas da API do Google Sheets (chamadas por minuto) e novas tentativas com backoff
+# exponencial em erros 429/5xx: base e limite da espera, em segundos
+SHEETS_READS_PER_MINUTE = 60
+SHEETS_WRITES_PER_MINUTE = 60
+SHEETS_MAX_RETRIES = 5
+SHEETS_BACKOFF_BASE = 1.0
+SHEETS_BACKOFF_MAX = 32.0
+
+# Onde ficam as abas mensais: "google" (Google Sheets, com credentials.json) ou "local"
+# (planilha em memória, sem rede, para desenvolvimento, testes e benchmarks), com uma
+# latência artificial opcional por chamada, em segundos
+SHEETS_BACKEND = "google"
+SHEETS_LOCAL_LATENCY = 0.0
+
+# Expõe /metrics (formato do Prometheus) com latência por view, banco, chamadas ao
+# Google Sheets e acertos dos caches
+METRICS_ENABLED = True
+
+# Busca pela descrição com o índice FTS5 do SQLite (sem acentos, por prefixo e
+# ordenada por relevância); desligada, usa icontains
+SEARCH_FTS_ENABLED = True
+
+# Máximo de resultados de uma busca em todo o histórico na ordem de relevância
+SEARCH_MAX_RESULTS = 500
+
+# API REST (/api/): transações por página (?page_size=, até o máximo)
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200